@@ -51,10 +51,17 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "document.instrumentation.QueryInstrumentationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Asynchronous views are used when served with ASGI (see asgi.py). WhiteNoise is synchronous and would make
+# every request hold a thread, so static files are then served by the front proxy
+ASYNC_VIEWS = (os.getenv("ASYNC_VIEWS") == "True")
+if ASYNC_VIEWS:
+    MIDDLEWARE.remove("whitenoise.middleware.WhiteNoiseMiddleware")
+
 ROOT_URLCONF = "archowum.urls"
 
 TEMPLATES = [
@@ -149,5 +156,69 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Media
 MEDIA_URL = os.getenv("MEDIA_URL", default="/media/")
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+DEFAULT_FILE_STORAGE = "document.storage.ContentAddressedStorage"
+
+# Compression of stored text-heavy files: "auto" (zstd if the zstandard package is installed, otherwise gzip),
+# "gzip", "zstd" or "" (none); files whose size would drop by less than the minimal saving are stored as they are
+DOCUMENT_COMPRESSION = os.getenv("DOCUMENT_COMPRESSION", default="auto")
+DOCUMENT_COMPRESSION_MIN_SAVING = 0.1
+
+# Chunked uploads of large files, assembled next to the stored files, so that saving them only moves them;
+# unfinished uploads older than the expiry (seconds) are removed by `manage.py clear_uploads`
+DOCUMENT_UPLOAD_DIR = os.path.join(MEDIA_ROOT, "blobs", "tmp", "uploads")
+DOCUMENT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_SIZE = int(os.getenv("DOCUMENT_UPLOAD_MAX_SIZE", default=2 * 1024 * 1024 * 1024))
+DOCUMENT_UPLOAD_EXPIRY = 24 * 3600
+
+# Downloads of documents: None streams files from Django,
+# "x-sendfile" (Apache, lighttpd) or "x-accel-redirect" (nginx) lets the front proxy send them
+DOCUMENT_DOWNLOAD_OFFLOAD = os.getenv("DOCUMENT_DOWNLOAD_OFFLOAD") or None
+DOCUMENT_DOWNLOAD_ACCEL_PREFIX = os.getenv("DOCUMENT_DOWNLOAD_ACCEL_PREFIX", default="/protected-media/")
 
 LOGIN_URL = "/login/"
+
+# Cache shared by all the processes (web workers, run_jobs, management commands), as it keeps the version
+# of the cached feed; by default a directory, with several servers e.g.
+# "django.core.cache.backends.memcached.PyMemcacheCache" with "host:port" as the location
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", default="django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", default=os.path.join(BASE_DIR, "cache")),
+    }
+}
+
+# Rendered list of the newest documents is cached until documents, products or categories change
+DOCUMENT_FEED_CACHE_TIMEOUT = int(os.getenv("DOCUMENT_FEED_CACHE_TIMEOUT", default=3600))
+
+# Search suggestions of each process load changes made by other processes after at most this many seconds
+TYPEAHEAD_CHECK_INTERVAL = float(os.getenv("TYPEAHEAD_CHECK_INTERVAL", default=5))
+
+# Background tasks (e.g. deleting products with their documents);
+# eager tasks run immediately within the request, which is useful in tests
+BACKGROUND_TASKS_EAGER = (os.getenv("BACKGROUND_TASKS_EAGER") == "True")
+BACKGROUND_TASKS_WORKERS = int(os.getenv("BACKGROUND_TASKS_WORKERS", default=4))
+
+# Background tasks are saved as jobs in the database and run by `manage.py run_jobs`; without a worker
+# they are run by the pool of threads of the web process (JOBS_IN_PROCESS=False turns it off)
+JOBS_IN_PROCESS = (os.getenv("JOBS_IN_PROCESS", default="True") == "True")
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", default=3))
+JOBS_BACKOFF_SECONDS = int(os.getenv("JOBS_BACKOFF_SECONDS", default=30))
+JOBS_STALE_TIMEOUT = int(os.getenv("JOBS_STALE_TIMEOUT", default=3600))
+# Seconds between checks of the queue by the web process (stale jobs, retries which are due); 0 turns them off
+JOBS_IN_PROCESS_INTERVAL = int(os.getenv("JOBS_IN_PROCESS_INTERVAL", default=60))
+
+# Text extraction from files of documents, run in a pool of processes
+DOCUMENT_EXTRACTION_WORKERS = int(os.getenv("DOCUMENT_EXTRACTION_WORKERS", default=2))
+DOCUMENT_EXTRACTION_MAX_CHARS = 200000
+
+# Previews of documents (first page of PDFs as PNG with PyMuPDF installed, otherwise an excerpt of the text)
+# are cached on disk; the least recently used ones are removed when the cache exceeds its size in bytes
+DOCUMENT_PREVIEW_ROOT = os.getenv("DOCUMENT_PREVIEW_ROOT", default=os.path.join(BASE_DIR, "previews"))
+DOCUMENT_PREVIEW_CACHE_SIZE = int(os.getenv("DOCUMENT_PREVIEW_CACHE_SIZE", default=200 * 1024 * 1024))
+DOCUMENT_PREVIEW_WIDTH = 600
+DOCUMENT_PREVIEW_EXCERPT_CHARS = 1500
+
+# Deleting products and categories
+DOCUMENT_DELETION_BATCH_SIZE = 500
+DOCUMENT_DELETION_FILE_WORKERS = 8
+DOCUMENT_DELETION_FILE_ATTEMPTS = 3
@@ -18,24 +18,46 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path
 
-from document import views
+from document import async_views, views
+
+# Under ASGI the most requested pages are served by their asynchronous variants
+if settings.ASYNC_VIEWS:
+    main_view = async_views.main
+    document_detail_view = async_views.document_detail
+    download_view = async_views.download
+else:
+    main_view = views.MainView.as_view()
+    document_detail_view = views.DocumentDetailView.as_view()
+    download_view = views.DownloadDocumentView.as_view()
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.MainView.as_view(), name="main"),
-    path('search/', views.MainView.as_view(), name="search"),
+    path('', main_view, name="main"),
+    path('search/', main_view, name="search"),
+    path('suggest/', views.SuggestView.as_view(), name="suggest"),
     path('document/add', views.AddDocumentView.as_view(), name="add_document"),
     path('product/add', views.AddProductView.as_view(), name="add_product"),
     path('category/add', views.AddCategoryView.as_view(), name="add_category"),
     path('product/edit/<pk>', views.EditProductView.as_view(), name="edit_product"),
     path('category/edit/<pk>', views.EditCategoryView.as_view(), name="edit_category"),
     path('document/edit/<pk>', views.EditDocumentView.as_view(), name="edit_document"),
+    path('upload/', views.StartUploadView.as_view(), name="start_upload"),
+    path('upload/<uuid:pk>', views.UploadView.as_view(), name="upload"),
+    path('document/bulk-edit', views.BulkEditDocumentsView.as_view(), name="bulk_edit_documents"),
     path('product/delete/<pk>', views.DeleteProductView.as_view(), name="delete_product"),
     path('category/delete/<pk>', views.DeleteCategoryView.as_view(), name="delete_category"),
     path('document/delete/<pk>', views.DeleteDocumentView.as_view(), name="delete_document"),
-    path('document/<pk>', views.DocumentDetailView.as_view(), name="document_detail"),
-    path('download/<pk>', views.DownloadDocumentView.as_view(), name="download"),
+    path('document/<pk>', document_detail_view, name="document_detail"),
+    path('document/<pk>/preview', views.DocumentPreviewView.as_view(), name="document_preview"),
+    path('download/<pk>', download_view, name="download"),
+    path('export/', views.ExportDocumentsView.as_view(), name="export_documents"),
+    path('api/documents/', views.ApiDocumentsView.as_view(), name="api_documents"),
+    path('api/documents/<int:pk>', views.ApiDocumentView.as_view(), name="api_document"),
+    path('api/products/', views.ApiProductsView.as_view(), name="api_products"),
+    path('api/categories/', views.ApiCategoriesView.as_view(), name="api_categories"),
+    path('api/history/', views.ApiHistoryView.as_view(), name="api_history"),
     path('manage/', views.ManageView.as_view(), name="manage"),
+    path('deletion/<pk>', views.DeletionStatusView.as_view(), name="deletion_status"),
     path('register/', views.RegisterView.as_view(), name="register"),
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
@@ -6,3 +6,10 @@ from document import models
 admin.site.register(models.Product)
 admin.site.register(models.Category)
 admin.site.register(models.Document)
+
+
+@admin.register(models.Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["id", "name", "status", "priority", "attempts", "max_attempts", "run_after", "finished_at"]
+    list_filter = ["status"]
+    readonly_fields = ["attempts", "created_at", "started_at", "heartbeat_at", "finished_at"]
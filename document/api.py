@@ -0,0 +1,210 @@
+import hashlib
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import quote_etag
+
+from document import models
+from document.utils import pagination
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class Resource:
+    """
+    Objects listed by the API.
+
+    Fields map names to functions getting their values from an object; clients choose the fields they need
+    with the "fields" parameter.
+    """
+    model = None
+    fields = {}
+    # Field of the time of the last change, used by the "updated_since" parameter and for sorting
+    timestamp_field = "updated_at"
+    related = ()
+
+    def get_queryset(self):
+        return self.model.objects.filter(pending_deletion=False).select_related(*self.related)
+
+
+class DocumentResource(Resource):
+    model = models.Document
+    fields = {
+        "id": lambda document: document.id,
+        "product": lambda document: document.product_id,
+        "category": lambda document: document.category_id,
+        "validity_start": lambda document: document.validity_start,
+        "file": lambda document: document.file.name,
+        "url": lambda document: reverse("download", args=[document.id]),
+        "created_by": lambda document: document.created_by.username,
+        "created_at": lambda document: document.created_at,
+        "updated_at": lambda document: document.updated_at,
+    }
+    related = ("created_by",)
+
+
+class ProductResource(Resource):
+    model = models.Product
+    fields = {
+        "id": lambda product: product.id,
+        "name": lambda product: product.name,
+        "model": lambda product: product.model,
+        "documents_count": lambda product: product.documents_count,
+        "updated_at": lambda product: product.updated_at,
+    }
+
+
+class CategoryResource(Resource):
+    model = models.Category
+    fields = {
+        "id": lambda category: category.id,
+        "name": lambda category: category.name,
+        "documents_count": lambda category: category.documents_count,
+        "updated_at": lambda category: category.updated_at,
+    }
+
+
+class HistoryResource(Resource):
+    model = models.History
+    fields = {
+        "id": lambda change: change.id,
+        "document": lambda change: change.document_id,
+        "product": lambda change: change.product_id,
+        "category": lambda change: change.category_id,
+        "element": lambda change: change.element,
+        "changed_from": lambda change: change.changed_from,
+        "changed_to": lambda change: change.changed_to,
+        "changed_by": lambda change: change.changed_by.username,
+        "changed_at": lambda change: change.changed_at,
+    }
+    timestamp_field = "changed_at"
+    related = ("changed_by",)
+
+    def get_queryset(self):
+        return self.model.objects.select_related(*self.related)
+
+
+def get_fields(resource, value):
+    """
+    Get the fields requested with the "fields" parameter.
+
+    :param resource: Resource
+    :param value: string, names of the fields separated by commas, or None for all fields
+    :return: list of strings
+    :raises ApiError: if a field is unknown
+    """
+    if not value:
+        return list(resource.fields)
+    fields = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in resource.fields]
+    if unknown:
+        raise ApiError(f"Nieznane pola: {', '.join(unknown)}. Dostępne pola: {', '.join(resource.fields)}.")
+    return fields
+
+
+def get_since(value):
+    """
+    Get time from the "updated_since" parameter.
+
+    :param value: string, ISO 8601 date or date and time, naive values are in the current time zone
+    :return: aware datetime or None if the value is empty
+    :raises ApiError: if the value is not a date
+    """
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+        if since is None:
+            date = parse_date(value)
+            since = datetime.combine(date, time()) if date else None
+    except ValueError:
+        since = None
+    if since is None:
+        raise ApiError("Parametr updated_since nie jest datą w formacie ISO 8601.")
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def get_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ApiError(f"Parametr limit musi być liczbą od 1 do {MAX_LIMIT}.")
+    return limit
+
+
+def get_sort(resource, value):
+    """
+    Get the sorting from the "sort" parameter.
+
+    :param resource: Resource
+    :param value: string, "id" or the resource's timestamp field, prefixed with "-" for the descending order
+    :return: string
+    :raises ApiError: if the objects cannot be sorted by the field
+    """
+    if not value:
+        return "id"
+    sorts = ("id", resource.timestamp_field)
+    if value.lstrip("-") not in sorts:
+        raise ApiError(f"Nieznane sortowanie: {value}. Dostępne sortowania: {', '.join(sorts)}.")
+    return value
+
+
+def get_cursor(resource, sort, value):
+    """
+    Get the cursor from the "after" or "before" parameter.
+
+    :param resource: Resource
+    :param sort: string, sorting from get_sort
+    :param value: string, cursor from a "next" or "previous" link
+    :return: tuple (value, id) or None if the value is empty
+    :raises ApiError: if the value is not a cursor of the sorting
+    """
+    if not value:
+        return None
+    cursor = pagination.clean_sorted_cursor(resource.model, sort.lstrip("-"), pagination.get_sorted_cursor(value))
+    if cursor is None:
+        raise ApiError("Nieprawidłowy kursor strony.")
+    return cursor
+
+
+def serialize(obj, resource, fields):
+    return {name: resource.fields[name](obj) for name in fields}
+
+
+def json_response(request, data):
+    """
+    Get response with the data, or "304 Not Modified" if the client's copy is the same.
+
+    :param request: request object
+    :param data: dictionary
+    :return: response object
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode()
+    # Clients polling the API revalidate their copy, which is not sent again while it is unchanged
+    etag = quote_etag(hashlib.md5(body).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
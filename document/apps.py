@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DocumentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'document'
+
+    def ready(self):
+        # Registers the failure handlers of jobs, which run_jobs workers may call before importing the jobs
+        from document import deletion, signals  # noqa: F401
@@ -0,0 +1,41 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from document import views
+
+# Views run in the pool of worker threads; thread-sensitive views would all share a single thread
+THREAD_SENSITIVE = False
+
+
+def as_async_view(view_class):
+    """
+    Get an asynchronous variant of the class-based view, used when the application is served with ASGI.
+
+    Django 3.2 has no asynchronous ORM, so the view's database access and rendering run in a worker thread.
+    The response is sent from the event loop, so a slow client, e.g. downloading a large file,
+    does not hold a thread; each part of a streamed file is read in a worker thread (see document/handlers.py).
+
+    :param view_class: class-based view
+    :return: coroutine function
+    """
+    view = view_class.as_view()
+
+    def view_in_thread(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            # Connections of the worker threads are not closed at the end of the request by Django
+            if not THREAD_SENSITIVE:
+                close_old_connections()
+
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(view_in_thread, thread_sensitive=THREAD_SENSITIVE)(request, *args, **kwargs)
+
+    async_view.view_class = view_class
+    async_view.__name__ = view_class.__name__
+    return async_view
+
+
+main = as_async_view(views.MainView)
+document_detail = as_async_view(views.DocumentDetailView)
+download = as_async_view(views.DownloadDocumentView)
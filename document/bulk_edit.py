@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.utils import timezone
+
+from document import models
+from document.signals import documents_changed
+from document.utils import counters, history, utils
+
+# Fields which can be changed for many documents at once
+FIELDS = {
+    "product": "produkt",
+    "category": "kategoria dokumentu",
+    "validity_start": "ważny od",
+}
+
+UNIQUE_FIELDS = ("product", "category", "validity_start")
+
+
+class ConflictError(Exception):
+    """Change would give several documents the same product, category and validity start."""
+    def __init__(self, ids):
+        self.ids = ids
+        super().__init__(f"Dokumenty {', '.join(f'#{pk}' for pk in ids)} miałyby ten sam produkt, kategorię i datę.")
+
+
+def select_documents(phrase=None, product=None, category=None):
+    """
+    Select documents found with the phrase and belonging to the product and category.
+
+    :param phrase: string, search phrase
+    :param product: product object
+    :param category: category object
+    :return: queryset
+    """
+    documents = utils.search(phrase) if phrase else models.Document.objects.filter(pending_deletion=False)
+    if product is not None:
+        documents = documents.filter(product=product)
+    if category is not None:
+        documents = documents.filter(category=category)
+    return documents
+
+
+def get_key(document, field=None, value=None):
+    """Get unique key of the document, optionally with the value of one field replaced."""
+    key = {"product": document.product_id, "category": document.category_id, "validity_start": document.validity_start}
+    if field is not None:
+        key[field] = getattr(value, "pk", value)
+    return tuple(key[name] for name in UNIQUE_FIELDS)
+
+
+def find_conflicts(documents, field, value):
+    """
+    Find documents which would break uniqueness of product, category and validity start after the change.
+
+    :param documents: list of the changed documents
+    :param field: string, name of the changed field
+    :param value: new value of the field
+    :return: list of ids of the conflicting documents
+    """
+    new_keys = {}
+    conflicts = set()
+    for document in documents:
+        key = get_key(document, field, value)
+        if key in new_keys:
+            conflicts.update((new_keys[key], document.id))
+        new_keys.setdefault(key, document.id)
+
+    # Documents outside of the selection keep their keys
+    changed_ids = {document.id for document in documents}
+    others = models.Document.objects.filter(
+        product_id__in={key[0] for key in new_keys},
+        category_id__in={key[1] for key in new_keys},
+        validity_start__in={key[2] for key in new_keys},
+    )
+    for other in others.only(*UNIQUE_FIELDS):
+        key = get_key(other)
+        if other.id not in changed_ids and key in new_keys:
+            conflicts.update((other.id, new_keys[key]))
+    return sorted(conflicts)
+
+
+def edit_documents(documents, field, value, user):
+    """
+    Change one field of many documents with a single update and save history of the changes.
+
+    :param documents: queryset of documents
+    :param field: string, name of the field from FIELDS
+    :param value: new value of the field, product or category object or date
+    :param user: user who performs changes
+    :return: integer, number of changed documents
+    :raises ConflictError: if the change breaks uniqueness of product, category and validity start
+    """
+    if field not in FIELDS:
+        raise ValueError(f"Field {field} cannot be changed in bulk.")
+
+    with transaction.atomic():
+        changed = []
+        for document in documents.select_related("product", "category").select_for_update(of=("self",)):
+            if get_key(document) != get_key(document, field, value):
+                changed.append(document)
+        if not changed:
+            return 0
+
+        conflicts = find_conflicts(changed, field, value)
+        if conflicts:
+            raise ConflictError(conflicts)
+
+        ids = [document.id for document in changed]
+        models.Document.objects.filter(id__in=ids).update(**{field: value}, updated_at=timezone.now())
+
+        histories = []
+        with counters.batch():
+            for document in changed:
+                before = history.snapshot(document)
+                counters.change(document.product_id, document.category_id, -1)
+                setattr(document, field, value)
+                counters.change(document.product_id, document.category_id, 1)
+                histories.extend(history.build_history(document, before, user))
+        models.History.objects.bulk_create(histories)
+
+    documents_changed.send(sender=models.Document, ids=ids)
+    return len(ids)
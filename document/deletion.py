@@ -0,0 +1,149 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from document import jobs, models, tasks
+from document.utils import counters, feed, typeahead
+
+logger = logging.getLogger(__name__)
+
+MODELS = {
+    "product": models.Product,
+    "category": models.Category,
+}
+
+
+def start_deletion(obj, user):
+    """
+    Hide the product or category with its documents and delete them in the background.
+
+    :param obj: product or category object
+    :param user: user who deletes the object
+    :return: deletion object, whose status can be polled
+    """
+    model_name = obj._meta.model_name
+    with transaction.atomic():
+        type(obj).objects.filter(id=obj.id).update(pending_deletion=True, updated_at=timezone.now())
+        documents_total = obj.document_set.update(pending_deletion=True)
+        typeahead.invalidate()
+        deletion = models.Deletion.objects.create(
+            model=model_name,
+            object_id=obj.id,
+            label=str(obj),
+            documents_total=documents_total,
+            created_by=user,
+        )
+        tasks.run_in_background(run_deletion, deletion.id, priority=jobs.HIGH)
+    # Hidden documents must disappear from the cached feed of the newest documents
+    feed.invalidate()
+    deletion.refresh_from_db()
+    return deletion
+
+
+def run_deletion(deletion_id):
+    """
+    Delete the object of the deletion with its documents and files.
+
+    A failed deletion is recorded and raised, so the job is retried and continues with the remaining documents.
+
+    :param deletion_id: integer, id of the deletion
+    :return: None
+    """
+    deletion = models.Deletion.objects.get(id=deletion_id)
+    models.Deletion.objects.filter(id=deletion_id).update(status=models.Deletion.RUNNING, error="")
+    try:
+        obj = MODELS[deletion.model].objects.get(id=deletion.object_id)
+        delete_documents(obj.document_set.all(), deletion_id=deletion_id)
+        obj.delete()
+    except Exception as error:
+        logger.exception("Deletion of %s failed", deletion.label)
+        models.Deletion.objects.filter(id=deletion_id).update(
+            status=models.Deletion.FAILED, error=str(error), finished_at=timezone.now()
+        )
+        raise
+
+    models.Deletion.objects.filter(id=deletion_id).update(status=models.Deletion.DONE, finished_at=timezone.now())
+    return None
+
+
+@jobs.on_failure(run_deletion)
+def restore_object(deletion_id):
+    """
+    Show the object and its remaining documents again once its deletion has failed for the last time.
+
+    The manager can then check them and delete the object again.
+
+    :param deletion_id: integer, id of the deletion
+    :return: None
+    """
+    deletion = models.Deletion.objects.get(id=deletion_id)
+    with transaction.atomic():
+        model = MODELS[deletion.model]
+        model.objects.filter(id=deletion.object_id).update(pending_deletion=False, updated_at=timezone.now())
+        models.Document.objects.filter(**{deletion.model: deletion.object_id}).update(
+            pending_deletion=False, updated_at=timezone.now()
+        )
+        typeahead.invalidate()
+    feed.invalidate()
+    return None
+
+
+def delete_documents(documents, deletion_id=None):
+    """
+    Delete documents and their files in bounded batches.
+
+    Rows of each batch are deleted in one transaction, then their files are deleted by a pool of threads.
+    Files which could not be deleted are logged and counted, but do not stop the deletion.
+
+    :param documents: queryset of documents
+    :param deletion_id: integer, id of the deletion whose progress is updated
+    :return: None
+    """
+    batch_size = settings.DOCUMENT_DELETION_BATCH_SIZE
+    documents = documents.order_by("id").values_list("id", "file")
+    last_id = 0
+
+    while True:
+        # Only one batch of rows is loaded at a time
+        batch = list(documents.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        with transaction.atomic(), counters.batch():
+            models.Document.objects.filter(id__in=[pk for pk, _ in batch]).delete()
+
+        names = [name for _, name in batch if name]
+        results = tasks.map_in_threads(delete_file, names, settings.DOCUMENT_DELETION_FILE_WORKERS)
+        files_failed = results.count(False)
+
+        if deletion_id is not None:
+            models.Deletion.objects.filter(id=deletion_id).update(
+                documents_deleted=F("documents_deleted") + len(batch),
+                files_failed=F("files_failed") + files_failed,
+            )
+        jobs.heartbeat()
+    return None
+
+
+def delete_file(name):
+    """
+    Delete the file from the storage, retrying with a growing delay.
+
+    :param name: string, name of the file
+    :return: boolean, whether the file has been deleted
+    """
+    attempts = settings.DOCUMENT_DELETION_FILE_ATTEMPTS
+    for attempt in range(attempts):
+        try:
+            default_storage.delete(name)
+            return True
+        except Exception:
+            if attempt == attempts - 1:
+                logger.exception("File %s could not be deleted", name)
+                return False
+            time.sleep(0.5 * 2 ** attempt)
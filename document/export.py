@@ -0,0 +1,166 @@
+import csv
+import io
+import itertools
+import logging
+import mimetypes
+import os
+import tempfile
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from document import extraction, models
+from document.utils import compression
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 500
+# Metadata rows are kept in memory up to this many bytes, then in a temporary file
+METADATA_MEMORY_SIZE = 1024 * 1024
+METADATA_NAME = "metadane.csv"
+METADATA_HEADER = [
+    "id", "produkt", "model", "kategoria", "ważny od", "plik", "rozmiar", "sha256", "dodany przez", "dodany",
+]
+
+
+class ZipOutput:
+    """
+    Writable, unseekable stream collecting the archive's bytes until they are sent.
+
+    ZipFile writes to it with data descriptors after the members, so the archive needs no temporary file.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def collect(documents):
+    """
+    Get the files and metadata of the documents while the archive is generated.
+
+    Documents are read in batches and their files are located with one query per batch, so memory use does not
+    depend on the number of documents. Under ASGI the archive is generated in worker threads, not by the event loop
+    (see document/handlers.py), so the queries are allowed there.
+
+    :param documents: queryset of documents
+    :return: generator of tuples (name in the archive, path, codec, size, metadata row), path is None
+        for missing files
+    """
+    documents = documents.select_related("product", "category", "created_by").order_by("id").iterator(BATCH_SIZE)
+    while True:
+        batch = list(itertools.islice(documents, BATCH_SIZE))
+        if not batch:
+            return
+
+        stored_files = models.StoredFile.objects.filter(name__in=[document.file.name for document in batch])
+        blobs = {
+            name: (digest, size, codec)
+            for name, digest, size, codec in stored_files.values_list("name", "blob_id", "blob__size", "blob__codec")
+        }
+        for document in batch:
+            name = document.file.name
+            if name in blobs:
+                digest, size, codec = blobs[name]
+                path = default_storage.blob_path(digest, codec)
+            else:
+                digest = ""
+                path, codec = extraction.locate(name)
+                size = os.path.getsize(path) if path and os.path.isfile(path) else None
+            if size is None:
+                path = None
+            row = [
+                document.id,
+                document.product.name,
+                document.product.model,
+                document.category.name,
+                document.validity_start.isoformat(),
+                name,
+                size if size is not None else "brak pliku",
+                digest,
+                document.created_by.username,
+                timezone.localtime(document.created_at).strftime("%Y-%m-%d %H:%M:%S"),
+            ]
+            yield name, path, codec, size, row
+
+
+def get_zip_info(name, size):
+    """
+    Get header of an archive member.
+
+    Text-heavy formats are deflated; formats compressed already (ZIP-based office files, images) are stored.
+    """
+    info = zipfile.ZipInfo(name, date_time=timezone.localtime().timetuple()[:6])
+    mime_type, _ = mimetypes.guess_type(name)
+    if compression.is_compressible(mime_type) and mime_type not in compression.ZIP_CONTAINER_TYPES:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    # Known size lets ZipFile use ZIP64 headers for large files
+    info.file_size = size
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def stream_zip(entries):
+    """
+    Generate a ZIP archive with the files and the metadata CSV.
+
+    Entries are used as they come and files are read and written in chunks, so memory use depends neither
+    on the number of documents nor on the sizes of their files. The metadata CSV is the last member; its rows
+    are collected meanwhile in a temporary file.
+
+    :param entries: iterable from collect
+    :return: generator of bytes
+    """
+    output = ZipOutput()
+    metadata = tempfile.SpooledTemporaryFile(METADATA_MEMORY_SIZE, mode="w+", encoding="utf-8", newline="")
+    with metadata, zipfile.ZipFile(output, "w") as archive:
+        writer = csv.writer(metadata, delimiter=";")
+        writer.writerow(METADATA_HEADER)
+        for name, path, codec, size, row in entries:
+            writer.writerow(row)
+            if path is None:
+                continue
+            try:
+                source = compression.open_reader(path, codec)
+            except OSError:
+                logger.warning("File %s could not be exported", name, exc_info=True)
+                continue
+            with source, archive.open(get_zip_info(name, size), "w") as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    if len(output.buffer) >= CHUNK_SIZE:
+                        yield output.drain()
+            yield output.drain()
+
+        info = zipfile.ZipInfo(METADATA_NAME, date_time=timezone.localtime().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        metadata.seek(0)
+        with archive.open(info, "w") as target, io.TextIOWrapper(target, "utf-8-sig", newline="") as text:
+            for chunk in iter(lambda: metadata.read(CHUNK_SIZE), ""):
+                text.write(chunk)
+                if len(output.buffer) >= CHUNK_SIZE:
+                    yield output.drain()
+        yield output.drain()
+    # Central directory is written when the archive is closed
+    yield output.drain()
+
+
+def get_file_name():
+    return f"archowum_{timezone.localtime():%Y-%m-%d_%H%M}.zip"
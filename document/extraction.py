@@ -0,0 +1,79 @@
+import logging
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+
+from document import jobs, models, tasks
+from document.utils import extract, search
+
+logger = logging.getLogger(__name__)
+
+
+def schedule_extraction(document_ids):
+    """
+    Extract text of the documents' files in the background, once the current transaction is committed.
+
+    :param document_ids: list of ids of documents
+    :return: None
+    """
+    tasks.run_in_background(extract_documents, list(document_ids), priority=jobs.LOW)
+    return None
+
+
+def outdated_documents():
+    """
+    Get documents whose text has not been extracted from their current file yet.
+
+    :return: queryset
+    """
+    return models.Document.objects.exclude(content__file_name=F("file"))
+
+
+def extract_documents(document_ids, workers=None):
+    """
+    Extract text of the documents' files in a pool of processes, save it and refresh the search index.
+
+    Files which cannot be read or have an unsupported format get an empty text with the error.
+
+    :param document_ids: list of ids of documents
+    :param workers: integer, number of processes, defaults to settings.DOCUMENT_EXTRACTION_WORKERS
+    :return: integer, number of documents whose text has been extracted
+    """
+    if workers is None:
+        workers = settings.DOCUMENT_EXTRACTION_WORKERS
+    documents = list(models.Document.objects.filter(id__in=document_ids).values_list("id", "file"))
+    items = [(*locate(name), name, settings.DOCUMENT_EXTRACTION_MAX_CHARS) for _, name in documents]
+    results = tasks.map_in_processes(extract.extract, items, workers)
+
+    contents = []
+    for (document_id, name), (text, error) in zip(documents, results):
+        if error:
+            logger.info("Text of document %s could not be extracted: %s", document_id, error)
+        contents.append(models.DocumentContent(document_id=document_id, file_name=name, text=text, error=error))
+
+    ids = [document_id for document_id, _ in documents]
+    with transaction.atomic():
+        models.DocumentContent.objects.filter(document_id__in=ids).delete()
+        # Documents deleted in the meantime are skipped
+        existing = set(models.Document.objects.filter(id__in=ids).values_list("id", flat=True))
+        models.DocumentContent.objects.bulk_create(content for content in contents if content.document_id in existing)
+    search.index_documents(models.Document.objects.filter(id__in=existing))
+    return sum(1 for content in contents if content.document_id in existing and not content.error)
+
+
+def locate(name):
+    """
+    Get path of the stored file and its codec.
+
+    :param name: string, name of the file
+    :return: tuple (path, codec), path is "" for remote storages and codec is "" if the file is not compressed
+    """
+    if hasattr(default_storage, "locate"):
+        return default_storage.locate(name)
+    try:
+        return default_storage.path(name), ""
+    except NotImplementedError:
+        # Remote storages have no local paths
+        return "", ""
@@ -1,6 +1,7 @@
 from django import forms
+from django.core.files.storage import default_storage
 
-from document import models
+from document import bulk_edit, models, uploads
 
 
 class DateInput(forms.DateInput):
@@ -9,6 +10,9 @@ class DateInput(forms.DateInput):
 
 
 class DocumentForm(forms.ModelForm):
+    # Id of a file uploaded in chunks (see document/uploads.py), which replaces the file field
+    upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
     class Meta:
         model = models.Document
         fields = ('product', 'category', 'validity_start', 'file')
@@ -16,6 +20,125 @@ class DocumentForm(forms.ModelForm):
             'validity_start': forms.DateInput(attrs={'type': 'date'}),
         }
 
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Products and categories being deleted cannot get new documents
+        self.fields['product'].queryset = models.Product.objects.filter(pending_deletion=False)
+        self.fields['category'].queryset = models.Category.objects.filter(pending_deletion=False)
+
+        self.upload = None
+        self.upload_error = None
+        if self.is_bound and self.data.get('upload') and user is not None:
+            self.attach_upload(user)
+
+    def attach_upload(self, user):
+        try:
+            upload_id = self.fields['upload'].clean(self.data['upload'])
+            self.upload, assembled_file = uploads.get_assembled_file(upload_id, user)
+        except forms.ValidationError:
+            # Reported by the field
+            return
+        except uploads.UploadError as error:
+            self.upload_error = error.message
+            return
+        self.files = self.files.copy()
+        self.files['file'] = assembled_file
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.upload_error:
+            self.add_error('file', self.upload_error)
+        return cleaned_data
+
+    def store_upload(self, replaced_name=None):
+        """
+        Store the finished upload of a valid form before the document is saved.
+
+        The upload is checked while the storage hashes it, so it is read only once, and nothing is deleted
+        or stored if it is damaged. The file then becomes the form's file, which is saved with the document.
+
+        :param replaced_name: string, name of the document's current file, deleted so the upload can take its name
+        :return: boolean, whether the upload has been stored; otherwise the form gets the error
+        """
+        assembled_file = self.files['file']
+        try:
+            digest, size, temporary_path = default_storage.write_temporary(assembled_file)
+        except uploads.UploadError as error:
+            self.add_error('file', error.message)
+            return False
+        if replaced_name:
+            default_storage.delete(replaced_name)
+        name, _ = default_storage.save_temporary(
+            assembled_file.name, digest, size, temporary_path,
+            max_length=models.Document._meta.get_field('file').max_length,
+        )
+        self.cleaned_data['file'] = self.instance.file = name
+        return True
+
+    def finish_upload(self):
+        """Remove the finished upload once the document has been saved."""
+        if self.upload is not None:
+            uploads.discard(self.upload)
+
+
+class UploadForm(forms.Form):
+    name = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1)
+    sha256 = forms.RegexField(r"^[0-9a-fA-F]{64}$", required=False)
+
+
+class DocumentSelectionForm(forms.Form):
+    """Select documents with a search phrase, a product and a category."""
+    phrase = forms.CharField(max_length=100, required=False, label="Fraza")
+    product = forms.ModelChoiceField(models.Product.objects.none(), required=False, label="Produkt")
+    category = forms.ModelChoiceField(models.Category.objects.none(), required=False, label="Kategoria dokumentu")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['product'].queryset = models.Product.objects.filter(pending_deletion=False)
+        self.fields['category'].queryset = models.Category.objects.filter(pending_deletion=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not any(cleaned_data.get(name) for name in ('phrase', 'product', 'category')):
+            raise forms.ValidationError("Podaj frazę, produkt lub kategorię wybierające dokumenty.")
+        return cleaned_data
+
+    def get_documents(self):
+        return bulk_edit.select_documents(
+            self.cleaned_data['phrase'], self.cleaned_data['product'], self.cleaned_data['category']
+        )
+
+
+class BulkEditForm(DocumentSelectionForm):
+    field = forms.ChoiceField(choices=bulk_edit.FIELDS.items(), label="Zmień")
+    new_product = forms.ModelChoiceField(models.Product.objects.none(), required=False, label="Nowy produkt")
+    new_category = forms.ModelChoiceField(
+        models.Category.objects.none(), required=False, label="Nowa kategoria dokumentu"
+    )
+    new_validity_start = forms.DateField(required=False, label="Nowa data ważności", widget=DateInput)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['new_product'].queryset = self.fields['product'].queryset
+        self.fields['new_category'].queryset = self.fields['category'].queryset
+
+    def clean(self):
+        cleaned_data = super().clean()
+        field = cleaned_data.get('field')
+        if field and cleaned_data.get(f'new_{field}') is None:
+            self.add_error(f'new_{field}', "Podaj nową wartość.")
+        return cleaned_data
+
+    def get_value(self):
+        return self.cleaned_data[f"new_{self.cleaned_data['field']}"]
+
+
+class ManageFilterForm(forms.Form):
+    product_model = forms.CharField(max_length=20, required=False, label="Model")
+    product_name = forms.CharField(max_length=60, required=False, label="Nazwa produktu")
+    category_name = forms.CharField(max_length=100, required=False, label="Nazwa kategorii")
+
 
 class RegisterForm(forms.Form):
     username = forms.CharField(max_length=36, label="Nazwa użytkownika")
@@ -0,0 +1,54 @@
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+
+def get_asgi_application():
+    """
+    Get the ASGI application, like django.core.asgi.get_asgi_application does.
+
+    :return: ASGIHandler
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
+
+
+def response_headers(response):
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode("ascii")
+        if isinstance(value, str):
+            value = value.encode("latin1")
+        headers.append((bytes(header), bytes(value)))
+    for cookie in response.cookies.values():
+        headers.append((b"Set-Cookie", cookie.output(header="").encode("ascii").strip()))
+    return headers
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    ASGI handler which reads streaming responses in worker threads.
+
+    Django 3.2 iterates streaming responses (downloads, exports) on the event loop, so every read
+    and decompression of a file would hold up all other requests of the process.
+    """
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": response_headers(response),
+        })
+        parts = iter(response)
+        read = sync_to_async(next, thread_sensitive=False)
+        while True:
+            part = await read(parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
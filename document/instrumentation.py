@@ -0,0 +1,118 @@
+import asyncio
+import contextvars
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger("document.queries")
+
+# Counter of the current request, also seen by the threads which run its synchronous code under ASGI
+_counter = contextvars.ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and their total time."""
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def count_query(execute, sql, params, many, context):
+    counter = _counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def instrument(db_connection):
+    """
+    Count queries of the connection for the request being processed.
+
+    Connections belong to threads, so every thread's connection is instrumented once (see document/signals.py).
+
+    :param db_connection: database connection
+    :return: None
+    """
+    if count_query not in db_connection.execute_wrappers:
+        db_connection.execute_wrappers.append(count_query)
+
+
+def get_query_budget(view_func):
+    """
+    Get the query budget declared on a class-based view.
+
+    Views declare the maximal number of SQL queries per request with the "query_budget" attribute.
+    The budget covers the whole request, including the session, the user and the roles lookups.
+
+    :param view_func: view function returned by View.as_view()
+    :return: integer or None
+    """
+    view_class = getattr(view_func, "view_class", None)
+    return getattr(view_class, "query_budget", None)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record number and time of SQL queries of each request.
+
+    Logs them to the "document.queries" logger and warns when a view exceeds its query budget.
+    In DEBUG mode the numbers are also sent in the X-Query-Count and X-Query-Time headers.
+    Queries of asynchronous requests, which run in worker threads, are counted as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the middleware as asynchronous, like django.utils.deprecation.MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        instrument(connection)
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self.record(request, response, counter)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self.record(request, response, counter)
+
+    def record(self, request, response, counter):
+        view_name = getattr(request, "query_view_name", request.path)
+        budget = getattr(request, "query_budget", None)
+        logger.debug("%s: %d queries in %.1f ms", view_name, counter.count, counter.duration * 1000)
+        if budget is not None and counter.count > budget:
+            logger.warning("%s: %d queries exceed the budget of %d", view_name, counter.count, budget)
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = counter.count
+            response["X-Query-Time"] = f"{counter.duration * 1000:.1f}ms"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_view_name = getattr(view_func, "__name__", request.path)
+        request.query_budget = get_query_budget(view_func)
+        return None
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from document import models
+
+logger = logging.getLogger(__name__)
+
+HIGH = 10
+NORMAL = 0
+LOW = -10
+
+# Number of queued jobs tried at once by claim_job, as other workers may claim some of them first
+CLAIM_CANDIDATES = 10
+# Minimal number of seconds between heartbeats saved by a running job
+HEARTBEAT_INTERVAL = 30
+
+# Functions called with the arguments of a job which has failed for the last time, by the job's name
+FAILURE_HANDLERS = {}
+
+_local = threading.local()
+
+
+def on_failure(func):
+    """
+    Register the decorated function to be called when a job of the function fails for the last time.
+
+    The handler gets the same arguments as the job, e.g. to undo what the job has prepared.
+
+    :param func: function of the jobs
+    :return: decorator
+    """
+    def register(handler):
+        FAILURE_HANDLERS[f"{func.__module__}.{func.__qualname__}"] = handler
+        return handler
+    return register
+
+
+def give_up(name, args):
+    handler = FAILURE_HANDLERS.get(name)
+    if handler is None:
+        return
+    try:
+        handler(*args)
+    except Exception:
+        logger.exception("Failure handler of job %s failed", name)
+
+
+def run_now(func, *args):
+    """
+    Run the function immediately like a job with a single attempt.
+
+    :param func: function defined at the top level of a module
+    :param args: arguments of the function
+    :return: boolean, whether the function succeeded
+    """
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Task %s failed", func.__name__)
+        give_up(f"{func.__module__}.{func.__qualname__}", args)
+        return False
+    return True
+
+
+def heartbeat():
+    """
+    Tell that the job run by this thread is still working, so requeue_stale does not run it again.
+
+    Long jobs should call it regularly, e.g. after each batch. It saves at most one update per HEARTBEAT_INTERVAL.
+
+    :return: None
+    """
+    job_id = getattr(_local, "job_id", None)
+    if job_id is None:
+        return None
+    now = time.monotonic()
+    if now - getattr(_local, "heartbeat", 0) >= HEARTBEAT_INTERVAL:
+        _local.heartbeat = now
+        models.Job.objects.filter(id=job_id, status=models.Job.RUNNING).update(heartbeat_at=timezone.now())
+    return None
+
+
+def enqueue(func, *args, priority=NORMAL, max_attempts=None, delay=0):
+    """
+    Save a job in the database, to be run by a worker (see the run_jobs command).
+
+    The job is saved in the current transaction, so it is not run if the transaction is rolled back.
+
+    :param func: function defined at the top level of a module
+    :param args: JSON-serializable arguments of the function
+    :param priority: integer, jobs with a higher priority run first
+    :param max_attempts: integer, defaults to settings.JOBS_MAX_ATTEMPTS
+    :param delay: number of seconds before the job can run
+    :return: job object
+    """
+    return models.Job.objects.create(
+        name=f"{func.__module__}.{func.__qualname__}",
+        args=list(args),
+        priority=priority,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim_job():
+    """
+    Take the queued job with the highest priority, which is ready to run.
+
+    Each job is marked as running with a conditional update, so concurrent workers never take the same job.
+
+    :return: job object or None if no job is ready
+    """
+    now = timezone.now()
+    candidates = models.Job.objects.filter(status=models.Job.QUEUED, run_after__lte=now)
+    for job_id in candidates.order_by("-priority", "run_after", "id").values_list("id", flat=True)[:CLAIM_CANDIDATES]:
+        claimed = models.Job.objects.filter(id=job_id, status=models.Job.QUEUED).update(
+            status=models.Job.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return models.Job.objects.get(id=job_id)
+    return None
+
+
+def run_job(job):
+    """
+    Run the claimed job and save its result.
+
+    A failed job is queued again after a delay, which doubles with each attempt, until it runs out of attempts;
+    then its failure handler (see on_failure) is called.
+
+    :param job: job object returned by claim_job
+    :return: boolean, whether the job succeeded
+    """
+    _local.job_id, _local.heartbeat = job.id, time.monotonic()
+    try:
+        import_string(job.name)(*job.args)
+    except Exception as error:
+        logger.exception("Job %s failed (attempt %s of %s)", job, job.attempts, job.max_attempts)
+        message = f"{type(error).__name__}: {error}"
+        jobs = models.Job.objects.filter(id=job.id)
+        if job.attempts < job.max_attempts:
+            delay = settings.JOBS_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            jobs.update(status=models.Job.QUEUED, error=message, run_after=timezone.now() + timedelta(seconds=delay))
+        else:
+            jobs.update(status=models.Job.FAILED, error=message, finished_at=timezone.now())
+            give_up(job.name, job.args)
+        return False
+    finally:
+        _local.job_id = None
+
+    models.Job.objects.filter(id=job.id).update(status=models.Job.DONE, error="", finished_at=timezone.now())
+    return True
+
+
+def work(once=False, poll_interval=1.0, max_jobs=None):
+    """
+    Run jobs one after another.
+
+    :param once: boolean, stop when no job is ready instead of waiting for new jobs
+    :param poll_interval: number of seconds between checks of an empty queue
+    :param max_jobs: integer, stop after that many jobs
+    :return: integer, number of jobs run
+    """
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = claim_job()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        done += 1
+    return done
+
+
+def work_in_pool(**kwargs):
+    """Run jobs like work() in a thread or process of a pool, whose database connection is closed at the end."""
+    try:
+        return work(**kwargs)
+    finally:
+        connection.close()
+
+
+def requeue_stale(timeout=None):
+    """
+    Queue again jobs left running by a worker that stopped, e.g. killed during a deployment.
+
+    Jobs are stale when their last heartbeat (or their start) is older than the timeout.
+
+    :param timeout: number of seconds after which a running job is stale, defaults to settings.JOBS_STALE_TIMEOUT
+    :return: integer, number of jobs queued again
+    """
+    if timeout is None:
+        timeout = settings.JOBS_STALE_TIMEOUT
+    stale = models.Job.objects.filter(
+        status=models.Job.RUNNING, heartbeat_at__lt=timezone.now() - timedelta(seconds=timeout)
+    )
+    failed = list(stale.filter(attempts__gte=F("max_attempts")).values_list("id", "name", "args"))
+    models.Job.objects.filter(id__in=[job_id for job_id, _, _ in failed]).update(
+        status=models.Job.FAILED, error="worker stopped", finished_at=timezone.now()
+    )
+    for _, name, args in failed:
+        give_up(name, args)
+    return stale.update(status=models.Job.QUEUED, error="worker stopped")
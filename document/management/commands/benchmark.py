@@ -0,0 +1,230 @@
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import Group, User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from document import jobs, models, permissions
+from document.utils import history, utils
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, p):
+    """
+    Get percentile of the values using linear interpolation.
+
+    :param values: sorted list of numbers
+    :param p: number from 0 to 100
+    :return: number
+    """
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark hot paths of the archive against the current database (e.g. filled with generate_data). "
+        "Creates a 'benchmark' manager user and temporarily two documents for the downloads. "
+        "Queued jobs are run before the measurements."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="measured runs of each scenario")
+        parser.add_argument("--output", help="write results as JSON to this file")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown of the p95")
+        parser.add_argument("--large-file-mb", type=int, default=50, help="size of the large downloaded file")
+        parser.add_argument("--fail-on-regression", action="store_true")
+        parser.add_argument("--only", nargs="*", help="names of the scenarios to run")
+
+    def handle(self, *args, **options):
+        documents = models.Document.objects.select_related("product", "category").annotate(no_history=Count("history"))
+        document = documents.order_by("-no_history").first()
+        if document is None:
+            raise CommandError("The database has no documents. Fill it first, e.g. with generate_data.")
+
+        # Jobs are not run by background threads of this process, which would overlap the measurements
+        with override_settings(JOBS_IN_PROCESS=False):
+            results = self.run_scenarios(document, options)
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "vendor": connection.vendor,
+            "iterations": options["iterations"],
+            "dataset": {
+                "documents": models.Document.objects.count(),
+                "products": models.Product.objects.count(),
+                "categories": models.Category.objects.count(),
+                "history": models.History.objects.count(),
+            },
+            "scenarios": results,
+        }
+        self.print_report(report)
+
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as fh:
+                baseline = json.load(fh)
+            regressions = self.compare(report, baseline, options["tolerance"])
+            if regressions and options["fail_on_regression"]:
+                raise CommandError(f"Regressions: {', '.join(regressions)}")
+
+    def run_scenarios(self, document, options):
+        """
+        Measure the scenarios with the documents created for the downloads.
+
+        Jobs of the created files (compression, extraction, previews) are run first, so they neither overlap
+        the measurements nor change the stored files while they run.
+
+        :param document: document with the most history
+        :param options: options of the command
+        :return: dictionary {scenario name: results}
+        """
+        self.client = Client(HTTP_HOST="127.0.0.1")
+        self.client.force_login(self.get_user())
+        downloads = self.create_downloads(document, options["large_file_mb"])
+        jobs.work(once=True)
+        product_model = document.product.model
+
+        scenarios = {
+            "search_selective": lambda: list(utils.search(product_model)[:20]),
+            "search_broad": lambda: list(utils.search("a")[:20]),
+            "main_view": lambda: self.get("/"),
+            "main_view_search": lambda: self.get("/search/?phrase=a"),
+            "document_detail_view": lambda: self.get(f"/document/{document.id}"),
+            "manage_view": lambda: self.get("/manage/"),
+            "download_small": lambda: self.get(f"/download/{downloads[0].id}"),
+            "download_large": lambda: self.get(f"/download/{downloads[1].id}"),
+            "save_history": lambda: self.save_history(document),
+        }
+        if options["only"]:
+            scenarios = {name: scenarios[name] for name in options["only"] if name in scenarios}
+
+        try:
+            return {name: self.measure(func, options["iterations"]) for name, func in scenarios.items()}
+        finally:
+            for download in downloads:
+                download.delete()
+
+    def get_user(self):
+        user, _ = User.objects.get_or_create(username="benchmark")
+        group, _ = Group.objects.get_or_create(name=permissions.MANAGER_GROUP)
+        user.groups.add(group)
+        return user
+
+    def create_downloads(self, document, large_file_mb):
+        """Create two documents with a small and a large file, one day before the oldest validity start."""
+        oldest = models.Document.objects.order_by("validity_start").first().validity_start
+        downloads = []
+        for days, size in ((1, 10 * 1024), (2, large_file_mb * 1024 * 1024)):
+            download = models.Document(
+                product=document.product,
+                category=document.category,
+                validity_start=oldest - timezone.timedelta(days=days),
+                created_by=document.created_by,
+            )
+            # Content differs between runs, so the storage does not deduplicate it
+            content = (str(time.time_ns()).encode() * (size // 19 + 1))[:size]
+            download.file.save(f"benchmark_{size}.pdf", ContentFile(content))
+            downloads.append(download)
+        return downloads
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned status {response.status_code}.")
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def save_history(self, document):
+        with transaction.atomic():
+            before = history.snapshot(document)
+            document.validity_start += timezone.timedelta(days=1)
+            history.save_history(document, before, user=document.created_by)
+            document.validity_start -= timezone.timedelta(days=1)
+            transaction.set_rollback(True)
+
+    def measure(self, func, iterations):
+        """
+        Measure latency, number of queries and peak memory of the scenario.
+
+        Memory is traced in a separate run, as tracing slows the code down.
+
+        :param func: function running the scenario once
+        :param iterations: integer, number of measured runs
+        :return: dictionary with the results
+        """
+        func()
+
+        durations = []
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                func()
+                durations.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context))
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        durations.sort()
+        result = {f"p{p}_ms": round(percentile(durations, p), 3) for p in PERCENTILES}
+        result.update({
+            "mean_ms": round(statistics.mean(durations), 3),
+            "max_ms": round(durations[-1], 3),
+            "queries": max(queries),
+            "peak_memory_kb": round(peak / 1024, 1),
+        })
+        return result
+
+    def print_report(self, report):
+        self.stdout.write(f"Dataset: {report['dataset']}")
+        self.stdout.write(f"{'scenario':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KB':>11}")
+        for name, result in report["scenarios"].items():
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['queries']:>9}{result['peak_memory_kb']:>11.1f}"
+            )
+
+    def compare(self, report, baseline, tolerance):
+        """
+        Compare p95 latency and number of queries with the baseline.
+
+        :return: list of names of the scenarios which got slower than the tolerance allows
+        """
+        regressions = []
+        self.stdout.write(f"{'scenario':<22}{'base p95':>10}{'p95':>10}{'change':>9}{'queries':>10}")
+        for name, result in report["scenarios"].items():
+            base = baseline.get("scenarios", {}).get(name)
+            if base is None:
+                continue
+            change = result["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0
+            regressed = change > tolerance or result["queries"] > base["queries"]
+            if regressed:
+                regressions.append(name)
+            self.stdout.write(
+                f"{name:<22}{base['p95_ms']:>10.2f}{result['p95_ms']:>10.2f}{change:>+9.0%}"
+                f"{base['queries']:>5} -> {result['queries']:<3}{' REGRESSION' if regressed else ''}"
+            )
+        return regressions
@@ -0,0 +1,65 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from document import bulk_edit, models
+
+
+class Command(BaseCommand):
+    help = "Change the product, category or validity start of many documents at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument("field", choices=bulk_edit.FIELDS, help="changed field")
+        parser.add_argument("value", help="id of the new product or category, or the new date (YYYY-MM-DD)")
+        parser.add_argument("--phrase", help="search phrase selecting the documents")
+        parser.add_argument("--product", type=int, help="id of the product whose documents are changed")
+        parser.add_argument("--category", type=int, help="id of the category whose documents are changed")
+        parser.add_argument("--user", required=True, help="username saved in the history of the changes")
+        parser.add_argument("--dry-run", action="store_true", help="only count the selected documents")
+
+    def handle(self, *args, **options):
+        if not any(options[name] for name in ("phrase", "product", "category")):
+            raise CommandError("Select the documents with --phrase, --product or --category.")
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        documents = bulk_edit.select_documents(
+            options["phrase"],
+            self.get_object(models.Product, options["product"]),
+            self.get_object(models.Category, options["category"]),
+        )
+        value = self.get_value(options["field"], options["value"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"Selected {documents.count()} documents.")
+            return
+
+        try:
+            number = bulk_edit.edit_documents(documents, options["field"], value, user)
+        except bulk_edit.ConflictError as error:
+            raise CommandError(f"Documents {', '.join(map(str, error.ids))} would not be unique.")
+        self.stdout.write(f"Changed {number} documents.")
+
+    def get_object(self, model, pk):
+        if pk is None:
+            return None
+        try:
+            return model.objects.get(id=pk, pending_deletion=False)
+        except model.DoesNotExist:
+            raise CommandError(f"{model.__name__} {pk} does not exist.")
+
+    def get_value(self, field, value):
+        if field == "validity_start":
+            try:
+                return datetime.date.fromisoformat(value)
+            except ValueError:
+                raise CommandError(f"Invalid date {value}.")
+        model = models.Product if field == "product" else models.Category
+        try:
+            pk = int(value)
+        except ValueError:
+            raise CommandError(f"Invalid id {value}.")
+        return self.get_object(model, pk)
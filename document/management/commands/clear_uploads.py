@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from document import uploads
+
+
+class Command(BaseCommand):
+    help = "Remove chunked uploads which have not been finished in time"
+
+    def handle(self, *args, **options):
+        removed = uploads.discard_stale()
+        self.stdout.write(f"Removed {removed} unfinished uploads.")
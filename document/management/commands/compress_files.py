@@ -0,0 +1,61 @@
+import mimetypes
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from document import models, tasks
+from document.storage import ContentAddressedStorage
+from document.utils import compression
+
+
+class Command(BaseCommand):
+    help = "Compress stored files which were saved without compression"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--codec", choices=["auto", *compression.CODECS],
+                            help="codec of the compressed files, defaults to settings.DOCUMENT_COMPRESSION")
+        parser.add_argument("--workers", type=int, default=2, help="number of processes, 0 compresses in this process")
+        parser.add_argument("--batch-size", type=int, default=100, help="number of files compressed at once")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("DEFAULT_FILE_STORAGE is not document.storage.ContentAddressedStorage.")
+
+        # Any name of the content tells its MIME type
+        blobs = models.Blob.objects.filter(codec="").annotate(name=Min("storedfile__name"))
+        blobs = [(digest, size, name) for digest, size, name in blobs.values_list("digest", "size", "name") if name]
+        preferred_codec = options["codec"] or settings.DOCUMENT_COMPRESSION
+        batch_size = options["batch_size"]
+
+        compressed = saved = 0
+        for start in range(0, len(blobs), batch_size):
+            batch = []
+            for digest, size, name in blobs[start:start + batch_size]:
+                codec = compression.choose_codec(mimetypes.guess_type(name)[0], preferred_codec)
+                if not codec:
+                    continue
+                path = default_storage.blob_path(digest)
+                if not os.path.isfile(path):
+                    self.stderr.write(f"Missing file: {name}")
+                    continue
+                fd, compressed_path = tempfile.mkstemp(dir=default_storage.temporary_dir())
+                os.close(fd)
+                batch.append((digest, size, codec, (path, compressed_path, codec)))
+
+            results = tasks.map_in_processes(compression.compress_file, [item for *_, item in batch],
+                                             options["workers"])
+            for (digest, size, codec, (_, compressed_path, _)), stored_size in zip(batch, results):
+                if not compression.is_worth_it(size, stored_size, settings.DOCUMENT_COMPRESSION_MIN_SAVING):
+                    os.remove(compressed_path)
+                    continue
+                if not default_storage.switch_codec(digest, codec, compressed_path, stored_size):
+                    continue
+                compressed += 1
+                saved += size - stored_size
+            self.stdout.write(f"Processed {min(start + batch_size, len(blobs))} of {len(blobs)} files.")
+
+        self.stdout.write(f"Compressed {compressed} files, saving {saved / 1024 / 1024:.1f} MB.")
@@ -0,0 +1,36 @@
+import os
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from document import models
+from document.storage import ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = "Move files of documents saved under their own names into the content-addressed storage"
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("DEFAULT_FILE_STORAGE is not document.storage.ContentAddressedStorage.")
+
+        stored_names = models.StoredFile.objects.values_list("name", flat=True)
+        names = models.Document.objects.exclude(file="").exclude(file__in=stored_names).values_list("file", flat=True)
+
+        moved = missing = 0
+        for name in names.iterator():
+            path = os.path.join(default_storage.location, name)
+            if not os.path.isfile(path):
+                missing += 1
+                self.stderr.write(f"Missing file: {name}")
+                continue
+
+            # Saving under the same name records the content and the name; the old file is removed afterwards
+            with open(path, "rb") as fh:
+                default_storage._save(name, File(fh))
+            os.remove(path)
+            moved += 1
+
+        saved = models.Blob.objects.count()
+        self.stdout.write(f"Moved {moved} files ({missing} missing). The storage holds {saved} distinct contents.")
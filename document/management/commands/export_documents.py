@@ -0,0 +1,50 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from document import bulk_edit, export, models
+
+
+class Command(BaseCommand):
+    help = "Export documents with their metadata to a ZIP archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="path of the archive, - writes it to the standard output")
+        parser.add_argument("--phrase", help="search phrase selecting the documents")
+        parser.add_argument("--product", type=int, help="id of the product whose documents are exported")
+        parser.add_argument("--category", type=int, help="id of the category whose documents are exported")
+        parser.add_argument("--all", action="store_true", help="export all documents")
+
+    def handle(self, *args, **options):
+        if not options["all"] and not any(options[name] for name in ("phrase", "product", "category")):
+            raise CommandError("Select the documents with --phrase, --product, --category or --all.")
+
+        documents = bulk_edit.select_documents(
+            options["phrase"],
+            self.get_object(models.Product, options["product"]),
+            self.get_object(models.Category, options["category"]),
+        )
+        counts = {"exported": 0, "missing": 0}
+
+        def count(entries):
+            for entry in entries:
+                counts["missing" if entry[1] is None else "exported"] += 1
+                yield entry
+
+        output = sys.stdout.buffer if options["output"] == "-" else open(options["output"], "wb")
+        try:
+            for data in export.stream_zip(count(export.collect(documents))):
+                output.write(data)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        self.stderr.write(f"Exported {counts['exported']} documents ({counts['missing']} missing files).")
+
+    def get_object(self, model, pk):
+        if pk is None:
+            return None
+        try:
+            return model.objects.get(id=pk, pending_deletion=False)
+        except model.DoesNotExist:
+            raise CommandError(f"{model.__name__} {pk} does not exist.")
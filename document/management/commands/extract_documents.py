@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from document import extraction, models
+
+
+class Command(BaseCommand):
+    help = "Extract text of documents' files, which makes their contents searchable"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="extract again also the up to date documents")
+        parser.add_argument("--workers", type=int, help="number of processes, 0 extracts in this process")
+        parser.add_argument("--batch-size", type=int, default=200, help="number of documents saved at once")
+
+    def handle(self, *args, **options):
+        documents = models.Document.objects.all() if options["all"] else extraction.outdated_documents()
+        ids = list(documents.order_by("id").values_list("id", flat=True))
+        batch_size = options["batch_size"]
+
+        extracted = 0
+        for start in range(0, len(ids), batch_size):
+            extracted += extraction.extract_documents(ids[start:start + batch_size], workers=options["workers"])
+            self.stdout.write(f"Processed {min(start + batch_size, len(ids))} of {len(ids)} documents.")
+        self.stdout.write(f"Extracted text of {extracted} documents, {len(ids) - extracted} failed or unsupported.")
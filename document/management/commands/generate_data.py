@@ -0,0 +1,156 @@
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from faker import Faker
+
+from document import models
+from document.signals import documents_changed
+from document.utils import counters, typeahead
+
+HISTORY_ELEMENTS = ["produkt", "kategoria dokumentu", "ważny od", "plik"]
+PLACEHOLDER = b"%PDF-1.4\n% archowum placeholder\n%%EOF\n"
+
+
+class Command(BaseCommand):
+    help = "Generate fake users, products, categories, documents and their history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--documents", type=int, default=2000)
+        parser.add_argument("--history", type=int, default=0, help="number of history rows")
+        parser.add_argument("--seed", type=int, default=0, help="seed making the data reproducible")
+        parser.add_argument("--files", action="store_true", help="save placeholder files in the storage")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.faker = Faker("pl_PL")
+        self.faker.seed_instance(options["seed"])
+        self.batch_size = options["batch_size"]
+        # Faker is slow, so rows are built from pools of fake words and names
+        self.words = list(dict.fromkeys(self.faker.word() for _ in range(2000)))
+        self.texts = [self.faker.text(max_nb_chars=60).rstrip(".") for _ in range(2000)]
+
+        user_ids = self.create_users(options["users"])
+        product_ids = self.create_products(options["products"])
+        category_ids = self.create_categories(options["categories"])
+        document_ids = self.create_documents(
+            options["documents"], product_ids, category_ids, user_ids, options["files"]
+        )
+        self.create_history(options["history"], document_ids, user_ids)
+
+    def bulk_create(self, model, objects):
+        """
+        Save objects in batches.
+
+        :param model: model class
+        :param objects: iterator of unsaved objects
+        :return: list of ids of the created objects
+        """
+        last_id = model.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        batch = []
+        with transaction.atomic():
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    model.objects.bulk_create(batch)
+                    batch = []
+            model.objects.bulk_create(batch)
+        # SQLite does not return ids from bulk inserts
+        return list(model.objects.filter(id__gt=last_id).order_by("id").values_list("id", flat=True))
+
+    def create_users(self, number):
+        if not number:
+            return list(User.objects.values_list("id", flat=True))
+        # Usernames are unique thanks to the numbers following the last user's id
+        first_number = (User.objects.aggregate(last_id=Max("id"))["last_id"] or 0) + 1
+        users = (
+            User(username=f"{self.random.choice(self.words)}{first_number + i}", password="!")
+            for i in range(number)
+        )
+        ids = self.bulk_create(User, users)
+        self.stdout.write(f"Created {len(ids)} users.")
+        return ids
+
+    def create_products(self, number):
+        if not number:
+            return list(models.Product.objects.values_list("id", flat=True))
+        products = (
+            models.Product(name=self.random.choice(self.texts)[:60], model=self.random.choice(self.words).upper()[:20])
+            for _ in range(number)
+        )
+        ids = self.bulk_create(models.Product, products)
+        typeahead.invalidate()
+        self.stdout.write(f"Created {len(ids)} products.")
+        return ids
+
+    def create_categories(self, number):
+        if not number:
+            return list(models.Category.objects.values_list("id", flat=True))
+        categories = (models.Category(name=self.random.choice(self.words)) for _ in range(number))
+        ids = self.bulk_create(models.Category, categories)
+        typeahead.invalidate()
+        self.stdout.write(f"Created {len(ids)} categories.")
+        return ids
+
+    def create_documents(self, number, product_ids, category_ids, user_ids, files):
+        if not number:
+            return []
+        if not product_ids or not category_ids or not user_ids:
+            raise CommandError("Documents need products, categories and users. Create them first.")
+
+        # File names are unique thanks to the numbers following the last document's id
+        first_number = (models.Document.objects.aggregate(last_id=Max("id"))["last_id"] or 0) + 1
+        # Validity starts after the existing documents, so product, category and date never repeat
+        last_date = models.Document.objects.aggregate(last_date=Max("validity_start"))["last_date"]
+        first_date = (last_date or datetime.date(2000, 1, 1)) + datetime.timedelta(days=1)
+        product_ids = self.random.sample(product_ids, len(product_ids))
+        keys_per_day = len(product_ids) * len(category_ids)
+
+        def documents():
+            for i in range(number):
+                filename = f"{self.random.choice(self.words)}_{first_number + i}.pdf"
+                if files:
+                    # Stored like uploads, so all documents share one stored copy of the placeholder
+                    filename = default_storage.save(filename, ContentFile(PLACEHOLDER))
+                yield models.Document(
+                    product_id=product_ids[i % len(product_ids)],
+                    category_id=category_ids[(i // len(product_ids)) % len(category_ids)],
+                    validity_start=first_date + datetime.timedelta(days=i // keys_per_day),
+                    file=filename,
+                    created_by_id=self.random.choice(user_ids),
+                )
+
+        ids = self.bulk_create(models.Document, documents())
+        counters.recount(models.Product)
+        counters.recount(models.Category)
+        for start in range(0, len(ids), self.batch_size):
+            documents_changed.send(sender=models.Document, ids=ids[start:start + self.batch_size])
+        self.stdout.write(f"Created {len(ids)} documents.")
+        return ids
+
+    def create_history(self, number, document_ids, user_ids):
+        if not number or not document_ids:
+            return
+        if not user_ids:
+            raise CommandError("History needs users. Create them first.")
+        histories = (
+            models.History(
+                document_id=self.random.choice(document_ids),
+                element=self.random.choice(HISTORY_ELEMENTS),
+                changed_from=self.random.choice(self.words),
+                changed_to=self.random.choice(self.words),
+                changed_by_id=self.random.choice(user_ids),
+            )
+            for _ in range(number)
+        )
+        ids = self.bulk_create(models.History, histories)
+        self.stdout.write(f"Created {len(ids)} history rows.")
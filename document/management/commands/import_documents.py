@@ -0,0 +1,269 @@
+import csv
+import datetime
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from document import extraction, models, previews
+from document.storage import remove_file
+from document.signals import documents_changed
+from document.utils import counters
+
+FILE_MAX_LENGTH = models.Document._meta.get_field("file").max_length
+
+
+class Command(BaseCommand):
+    help = "Import documents from a directory or a ZIP archive described by a CSV or JSON manifest"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="directory or ZIP archive with the files")
+        parser.add_argument(
+            "manifest",
+            help="CSV or JSON file with the columns: product (model or name), category, validity_start, file",
+        )
+        parser.add_argument("--user", required=True, help="username saved as the creator of the documents")
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="number of threads hashing and copying files into the storage, 0 copies them one by one",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="number of documents saved at once")
+
+    def handle(self, *args, **options):
+        try:
+            self.user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        self.source = options["source"]
+        self.is_zip = zipfile.is_zipfile(self.source)
+        if not self.is_zip and not os.path.isdir(self.source):
+            raise CommandError(f"{self.source} is neither a directory nor a ZIP archive.")
+        self.local = threading.local()
+        # Archive handles of all the threads, closed at the end
+        self.archives = []
+        self.archives_lock = threading.Lock()
+
+        self.products_by_model, self.products_by_name = {}, {}
+        for product_id, name, model in models.Product.objects.values_list("id", "name", "model"):
+            self.products_by_model.setdefault(model, []).append(product_id)
+            self.products_by_name.setdefault(name, []).append(product_id)
+        self.categories = {}
+        for category_id, name in models.Category.objects.values_list("id", "name"):
+            self.categories.setdefault(name, []).append(category_id)
+
+        self.seen_keys = set()
+        self.counts = {"imported": 0, "skipped": 0, "failed": 0}
+        batch_size = options["batch_size"]
+
+        executor = ThreadPoolExecutor(max_workers=options["workers"]) if options["workers"] > 0 else None
+        try:
+            batch = []
+            for number, row in enumerate(read_manifest(options["manifest"]), start=1):
+                batch.append((number, row))
+                if len(batch) >= batch_size:
+                    self.import_batch(batch, executor)
+                    batch = []
+            if batch:
+                self.import_batch(batch, executor)
+        finally:
+            if executor:
+                executor.shutdown()
+            for archive in self.archives:
+                archive.close()
+
+        self.stdout.write(
+            f"Imported {self.counts['imported']} documents, "
+            f"skipped {self.counts['skipped']} already imported, {self.counts['failed']} rows failed."
+        )
+
+    def import_batch(self, batch, executor):
+        """Validate rows of the batch, copy their files into the storage in parallel and save the documents at once."""
+        rows = []
+        for number, row in batch:
+            try:
+                rows.append((number, self.clean_row(row)))
+            except ValueError as error:
+                self.report(number, error)
+
+        # Documents saved by a previous run are skipped, so an interrupted import can be resumed
+        existing = set(
+            models.Document.objects.filter(
+                product_id__in={row["product_id"] for _, row in rows},
+                category_id__in={row["category_id"] for _, row in rows},
+                validity_start__in={row["validity_start"] for _, row in rows},
+            ).values_list("product_id", "category_id", "validity_start")
+        )
+        new_rows = []
+        for number, row in rows:
+            key = (row["product_id"], row["category_id"], row["validity_start"])
+            if key in existing:
+                self.counts["skipped"] += 1
+            elif key in self.seen_keys:
+                self.report(number, "produkt, kategoria i data ważności powtarzają się w manifeście")
+            else:
+                self.seen_keys.add(key)
+                new_rows.append((number, row))
+
+        if executor:
+            results = executor.map(self.prepare_file, [row for _, row in new_rows])
+        else:
+            results = map(self.prepare_file, [row for _, row in new_rows])
+        items = []
+        for (number, row), result in zip(new_rows, results):
+            if isinstance(result, Exception):
+                self.report(number, result)
+            else:
+                items.append((number, row, result))
+
+        try:
+            documents = self.save_documents(items)
+        except Exception:
+            # A single bad row fails the whole batch, so the rows are saved one by one
+            documents = []
+            for item in items:
+                try:
+                    documents += self.save_documents([item])
+                except Exception as error:
+                    self.report(item[0], error)
+        finally:
+            # Left in place by contents which were already stored and by failed rows
+            for *_, (_, _, temporary_path) in items:
+                remove_file(temporary_path)
+
+        ids = list(
+            models.Document.objects.filter(file__in=[document.file.name for document in documents])
+            .values_list("id", flat=True)
+        )
+        documents_changed.send(sender=models.Document, ids=ids)
+        extraction.schedule_extraction(ids)
+        previews.schedule_previews(ids)
+        self.counts["imported"] += len(documents)
+
+    def save_documents(self, items):
+        """
+        Store files of the rows and save their documents in one transaction.
+
+        A failure stores nothing: files moved to the storage are moved back to their temporary files,
+        so the rows can be saved again and an interrupted import leaves no files without documents behind.
+
+        :param items: list of tuples (number, cleaned manifest row, (digest, size, temporary path)) from prepare_file
+        :return: list of saved documents
+        """
+        documents = []
+        moved = []
+        try:
+            with transaction.atomic(), counters.batch():
+                for _, row, (digest, size, temporary_path) in items:
+                    name, stored = default_storage.save_temporary(
+                        os.path.basename(row["file"]), digest, size, temporary_path, max_length=FILE_MAX_LENGTH
+                    )
+                    if stored:
+                        moved.append((digest, temporary_path))
+                    documents.append(models.Document(
+                        product_id=row["product_id"],
+                        category_id=row["category_id"],
+                        validity_start=row["validity_start"],
+                        file=name,
+                        created_by=self.user,
+                    ))
+                models.Document.objects.bulk_create(documents)
+                for document in documents:
+                    counters.change(document.product_id, document.category_id, 1)
+        except Exception:
+            for digest, temporary_path in moved:
+                default_storage.restore_temporary(digest, temporary_path)
+            raise
+        return documents
+
+    def clean_row(self, row):
+        """
+        Resolve product, category and validity start of a manifest row.
+
+        :param row: dictionary with the manifest columns
+        :return: dictionary with product_id, category_id, validity_start and file
+        """
+        missing = [column for column in ("product", "category", "validity_start", "file") if not row.get(column)]
+        if missing:
+            raise ValueError(f"brak kolumn: {', '.join(missing)}")
+
+        product = str(row["product"]).strip()
+        product_ids = self.products_by_model.get(product) or self.products_by_name.get(product) or []
+        if len(product_ids) != 1:
+            raise ValueError(f"produkt {product} nie istnieje lub nie jest jednoznaczny")
+
+        category = str(row["category"]).strip()
+        category_ids = self.categories.get(category, [])
+        if len(category_ids) != 1:
+            raise ValueError(f"kategoria {category} nie istnieje lub nie jest jednoznaczna")
+
+        try:
+            validity_start = datetime.date.fromisoformat(str(row["validity_start"]).strip())
+        except ValueError:
+            raise ValueError(f"nieprawidłowa data {row['validity_start']}")
+
+        return {
+            "product_id": product_ids[0],
+            "category_id": category_ids[0],
+            "validity_start": validity_start,
+            "file": str(row["file"]).strip(),
+        }
+
+    def prepare_file(self, row):
+        """
+        Hash the row's file and copy it into a temporary file of the storage, without using the database.
+
+        Files of a directory are copied and files of an archive are unpacked, in parallel when there are workers,
+        so that saving them only moves them to their place.
+
+        :param row: cleaned manifest row
+        :return: tuple (digest, size, temporary path) from the storage's write_temporary or the exception
+            which occurred
+        """
+        try:
+            if self.is_zip:
+                fh = self.open_archive().open(row["file"])
+            else:
+                path = os.path.join(self.source, row["file"])
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(f"plik {row['file']} nie istnieje")
+                fh = open(path, "rb")
+            with fh:
+                return default_storage.write_temporary(File(fh))
+        except Exception as error:
+            return error
+
+    def open_archive(self):
+        # Each thread reads the archive with its own handle
+        archive = getattr(self.local, "archive", None)
+        if archive is None:
+            archive = self.local.archive = zipfile.ZipFile(self.source)
+            with self.archives_lock:
+                self.archives.append(archive)
+        return archive
+
+    def report(self, number, error):
+        self.counts["failed"] += 1
+        self.stderr.write(f"Row {number}: {error}")
+
+
+def read_manifest(path):
+    """
+    Read rows of the manifest.
+
+    :param path: string, path of a CSV file with a header or a JSON file with a list of objects
+    :return: iterator of dictionaries
+    """
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as fh:
+            yield from json.load(fh)
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as fh:
+            yield from csv.DictReader(fh)
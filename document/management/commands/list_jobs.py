@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from document import models
+
+
+class Command(BaseCommand):
+    help = "Show numbers of background jobs by status and the latest jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--status", choices=[status for status, _ in models.Job.STATUS_CHOICES])
+        parser.add_argument("--limit", type=int, default=20, help="number of the latest jobs shown")
+
+    def handle(self, *args, **options):
+        counts = dict(models.Job.objects.values_list("status").annotate(count=Count("id")))
+        for status, label in models.Job.STATUS_CHOICES:
+            self.stdout.write(f"{status}: {counts.get(status, 0)}")
+
+        jobs = models.Job.objects.order_by("-id")
+        if options["status"]:
+            jobs = jobs.filter(status=options["status"])
+        for job in jobs[:options["limit"]]:
+            line = f"#{job.id} {job.name}{tuple(job.args)} {job.status}, priority {job.priority}, " \
+                   f"attempt {job.attempts} of {job.max_attempts}, created {job.created_at:%Y-%m-%d %H:%M:%S}"
+            if job.status == models.Job.QUEUED and job.attempts:
+                line += f", retry after {job.run_after:%Y-%m-%d %H:%M:%S}"
+            if job.error:
+                line += f": {job.error}"
+            self.stdout.write(line)
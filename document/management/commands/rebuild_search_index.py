@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from document.utils import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild full-text search index of documents"
+
+    def handle(self, *args, **options):
+        number = search.rebuild_index()
+        self.stdout.write(f"Indexed {number} documents.")
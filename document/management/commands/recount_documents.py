@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from document import models
+from document.utils import counters
+
+
+class Command(BaseCommand):
+    help = "Count documents of products and categories again, fixing numbers which drifted"
+
+    def handle(self, *args, **options):
+        for name, model in (("products", models.Product), ("categories", models.Category)):
+            number = counters.recount(model)
+            self.stdout.write(f"Fixed numbers of documents of {number} {name}.")
@@ -0,0 +1,39 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from document import jobs
+
+
+class Command(BaseCommand):
+    help = "Run background jobs saved in the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="number of jobs run at once")
+        parser.add_argument("--processes", action="store_true", help="run jobs in processes instead of threads")
+        parser.add_argument("--once", action="store_true", help="stop when no job is ready to run")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between checks of the queue")
+        parser.add_argument("--max-jobs", type=int, help="number of jobs run by each worker before it stops")
+
+    def handle(self, *args, **options):
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Queued again {requeued} jobs left running by a stopped worker.")
+
+        workers = max(options["workers"], 1)
+        kwargs = {"once": options["once"], "poll_interval": options["poll_interval"], "max_jobs": options["max_jobs"]}
+        if workers == 1:
+            done = jobs.work(**kwargs)
+        else:
+            if options["processes"]:
+                # Spawned processes set up Django before they run jobs
+                context = multiprocessing.get_context("spawn")
+                executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup)
+            else:
+                executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="archowum-jobs")
+            with executor:
+                futures = [executor.submit(jobs.work_in_pool, **kwargs) for _ in range(workers)]
+                done = sum(future.result() for future in futures)
+        self.stdout.write(f"Run {done} jobs.")
@@ -0,0 +1,106 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:05
+
+import unicodedata
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE document_documentindex_fts USING fts5("
+    "content, content='document_documentindex', content_rowid='document_id', tokenize='trigram')",
+    "CREATE TRIGGER document_documentindex_ai AFTER INSERT ON document_documentindex BEGIN "
+    "INSERT INTO document_documentindex_fts(rowid, content) VALUES (new.document_id, new.content); END",
+    "CREATE TRIGGER document_documentindex_ad AFTER DELETE ON document_documentindex BEGIN "
+    "INSERT INTO document_documentindex_fts(document_documentindex_fts, rowid, content) "
+    "VALUES ('delete', old.document_id, old.content); END",
+    "CREATE TRIGGER document_documentindex_au AFTER UPDATE ON document_documentindex BEGIN "
+    "INSERT INTO document_documentindex_fts(document_documentindex_fts, rowid, content) "
+    "VALUES ('delete', old.document_id, old.content); "
+    "INSERT INTO document_documentindex_fts(rowid, content) VALUES (new.document_id, new.content); END",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS document_documentindex_au",
+    "DROP TRIGGER IF EXISTS document_documentindex_ad",
+    "DROP TRIGGER IF EXISTS document_documentindex_ai",
+    "DROP TABLE IF EXISTS document_documentindex_fts",
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX document_documentindex_content_trgm "
+    "ON document_documentindex USING gin (content gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS document_documentindex_content_trgm",
+]
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_FORWARD, "postgresql": POSTGRESQL_FORWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRESQL_BACKWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+# Copies of document.utils.search.fold and build_content as they were when the index was added,
+# so later changes of the search do not change this migration
+EXTRA_FOLDS = str.maketrans({"ł": "l", "Ł": "L", "đ": "d", "Đ": "D", "ø": "o", "Ø": "O"})
+
+
+def fold(text):
+    text = unicodedata.normalize("NFKD", str(text).translate(EXTRA_FOLDS))
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def build_content(document):
+    created_at = timezone.localtime(document.created_at) if document.created_at else None
+    values = [
+        document.id,
+        document.product.name,
+        document.product.model,
+        document.category.name,
+        document.validity_start.strftime("%Y-%m-%d") if document.validity_start else "",
+        document.file.name,
+        document.created_by.username,
+        created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "",
+    ]
+    return fold("\n".join(str(value) for value in values))
+
+
+def fill_index(apps, schema_editor):
+    Document = apps.get_model("document", "Document")
+    DocumentIndex = apps.get_model("document", "DocumentIndex")
+    documents = Document.objects.select_related("product", "category", "created_by")
+    DocumentIndex.objects.bulk_create(
+        (DocumentIndex(document_id=document.id, content=build_content(document)) for document in documents.iterator()),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0011_auto_20220115_2131'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentIndex',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='document.document')),
+                ('content', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
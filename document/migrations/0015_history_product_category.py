@@ -0,0 +1,29 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0014_pending_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='document.category', verbose_name='kategoria'),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='document.product', verbose_name='produkt'),
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='document',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='document.document', verbose_name='dokument'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:25
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_documents(apps, schema_editor):
+    Document = apps.get_model("document", "Document")
+    for model_name in ("product", "category"):
+        counts = Document.objects.filter(**{model_name: OuterRef("pk")}).values(model_name)
+        counts = Subquery(counts.annotate(count=Count("id")).values("count"))
+        apps.get_model("document", model_name).objects.update(documents_count=Coalesce(counts, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0015_history_product_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='documents_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='liczba dokumentów'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='documents_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='liczba dokumentów'),
+        ),
+        migrations.RunPython(count_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0016_documents_count'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='model',
+            field=models.CharField(db_index=True, max_length=20, verbose_name='model przepływów pieniężnych'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(db_index=True, max_length=60, verbose_name='nazwa produktu ubezpieczeniowego'),
+        ),
+    ]
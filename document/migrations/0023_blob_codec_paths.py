@@ -0,0 +1,39 @@
+import os
+
+from django.conf import settings
+from django.db import migrations
+
+# Frozen copy of the blob layout of document.storage, so later changes of the storage do not change the migration
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def blob_path(digest, suffix=""):
+    return os.path.join(settings.MEDIA_ROOT, "blobs", digest[:2], digest[2:4], digest + suffix)
+
+
+def move_compressed_blobs(apps, schema_editor):
+    """Move compressed contents, which were stored under their bare digests, to names with their codec's suffix."""
+    Blob = apps.get_model("document", "Blob")
+    for digest, codec in Blob.objects.exclude(codec="").values_list("digest", "codec").iterator():
+        source = blob_path(digest)
+        if os.path.exists(source):
+            os.replace(source, blob_path(digest, SUFFIXES[codec]))
+
+
+def move_back(apps, schema_editor):
+    Blob = apps.get_model("document", "Blob")
+    for digest, codec in Blob.objects.exclude(codec="").values_list("digest", "codec").iterator():
+        source = blob_path(digest, SUFFIXES[codec])
+        if os.path.exists(source):
+            os.replace(source, blob_path(digest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0022_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_compressed_blobs, move_back),
+    ]
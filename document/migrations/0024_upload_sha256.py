@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0023_blob_codec_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Filters of the management page (icontains, istartswith) compare UPPER(column) with LIKE, which btree indexes
+# cannot serve; pg_trgm GIN indexes on the same expressions can. SQLite scans the small tables instead.
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX document_product_name_upper_trgm "
+    "ON document_product USING gin ((UPPER(name::text)) gin_trgm_ops)",
+    "CREATE INDEX document_product_model_upper_trgm "
+    "ON document_product USING gin ((UPPER(model::text)) gin_trgm_ops)",
+    "CREATE INDEX document_category_name_upper_trgm "
+    "ON document_category USING gin ((UPPER(name::text)) gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS document_category_name_upper_trgm",
+    "DROP INDEX IF EXISTS document_product_model_upper_trgm",
+    "DROP INDEX IF EXISTS document_product_name_upper_trgm",
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRESQL_FORWARD:
+            schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for statement in POSTGRESQL_BACKWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0024_upload_sha256'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
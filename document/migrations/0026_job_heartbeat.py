@@ -0,0 +1,24 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:05
+
+from django.db import migrations, models
+
+
+def copy_started_at(apps, schema_editor):
+    Job = apps.get_model("document", "Job")
+    Job.objects.filter(heartbeat_at__isnull=True).update(heartbeat_at=models.F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0025_product_category_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_started_at, migrations.RunPython.noop),
+    ]
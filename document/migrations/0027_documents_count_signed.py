@@ -0,0 +1,23 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0026_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='documents_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='liczba dokumentów'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='documents_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='liczba dokumentów'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('document', '0027_documents_count_signed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['name', 'id'], name='document_ca_name_2117e2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['documents_count', 'id'], name='document_ca_documen_b66473_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['documents_count', 'id'], name='document_pr_documen_9eab9a_idx'),
+        ),
+    ]
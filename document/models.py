@@ -1,46 +1,58 @@
+import uuid
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 
 class Product(models.Model):
-    name = models.CharField(max_length=60, verbose_name="nazwa produktu ubezpieczeniowego")
-    model = models.CharField(max_length=20, verbose_name="model przepływów pieniężnych")
+    # Indexed for sorting the management page; its filters use trigram indexes on PostgreSQL
+    name = models.CharField(max_length=60, db_index=True, verbose_name="nazwa produktu ubezpieczeniowego")
+    model = models.CharField(max_length=20, db_index=True, verbose_name="model przepływów pieniężnych")
+    pending_deletion = models.BooleanField(default=False, editable=False)
+    # Signed, so decrementing a number which has drifted to 0 does not fail; recount_documents fixes it
+    documents_count = models.IntegerField(default=0, editable=False, verbose_name="liczba dokumentów")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.name} ({self.model})"
 
     def delete(self, *args, **kwargs):
-        documents = self.document_set.all()
-        files = [document.file for document in documents]
-        for file in files:
-            file.delete()
+        from document import deletion
+        deletion.delete_documents(self.document_set.all())
         super().delete(*args, **kwargs)
 
     def number_of_documents(self):
-        return self.document_set.count()
+        return self.documents_count
 
     class Meta:
         ordering = ["name"]
+        # Pages of the management page sorted by the number of documents are read in the order of the index
+        indexes = [models.Index(fields=["documents_count", "id"])]
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="nazwa")
+    pending_deletion = models.BooleanField(default=False, editable=False)
+    # Signed, so decrementing a number which has drifted to 0 does not fail; recount_documents fixes it
+    documents_count = models.IntegerField(default=0, editable=False, verbose_name="liczba dokumentów")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
 
     def delete(self, *args, **kwargs):
-        documents = self.document_set.all()
-        files = [document.file for document in documents]
-        for file in files:
-            file.delete()
+        from document import deletion
+        deletion.delete_documents(self.document_set.all())
         super().delete(*args, **kwargs)
 
     def number_of_documents(self):
-        return self.document_set.count()
+        return self.documents_count
 
     class Meta:
         ordering = ["name"]
+        # Pages of the management page are read in the order of the indexes
+        indexes = [models.Index(fields=["name", "id"]), models.Index(fields=["documents_count", "id"])]
 
 
 class Document(models.Model):
@@ -50,22 +62,179 @@ class Document(models.Model):
     file = models.FileField(verbose_name="plik")
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="create_user")
     created_at = models.DateTimeField(auto_now_add=True)
+    pending_deletion = models.BooleanField(default=False, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.file.name
 
+    def save(self, *args, **kwargs):
+        # Numbers of documents of the product and category are updated in the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def delete(self, *args, **kwargs):
-        self.file.delete()
-        super().delete(*args, **kwargs)
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+        # Deleted after the row, like by deletion.delete_documents, so receivers of post_delete see the file name;
+        # saving the deleted row would index it again and queue extraction and previews of its file
+        self.file.delete(save=False)
+        return result
 
     class Meta:
         unique_together = ("product", "category", "validity_start")
 
 
 class History(models.Model):
-    document = models.ForeignKey(Document, on_delete=models.CASCADE, verbose_name="dokument")
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, null=True, verbose_name="dokument")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, verbose_name="produkt")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, verbose_name="kategoria")
     element = models.CharField(max_length=100)
     changed_from = models.CharField(max_length=100)
     changed_to = models.CharField(max_length=100)
     changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="change_user")
-    changed_at = models.DateTimeField(auto_now_add=True)
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+
+class Deletion(models.Model):
+    """Deletion of a product or a category together with its documents, running in the background."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "oczekuje"),
+        (RUNNING, "w toku"),
+        (DONE, "zakończone"),
+        (FAILED, "błąd"),
+    ]
+
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    label = models.CharField(max_length=200)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    documents_total = models.PositiveIntegerField(default=0)
+    documents_deleted = models.PositiveIntegerField(default=0)
+    files_failed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return self.label
+
+
+class Blob(models.Model):
+    """
+    File content stored once under its SHA-256 digest.
+
+    References count the stored file names which point to the content (see document.storage).
+    Compressed content has its codec and size on disk; size is always the size of the original content.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    codec = models.CharField(max_length=10, blank=True)
+    stored_size = models.BigIntegerField(null=True)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class StoredFile(models.Model):
+    """Name of a file saved in the content-addressed storage together with its content."""
+    name = models.CharField(max_length=255, unique=True)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT)
+
+    def __str__(self):
+        return self.name
+
+
+class DocumentIndex(models.Model):
+    """
+    Search index entry of a document.
+
+    Holds the searchable attributes of the document folded into a single lowercase text without diacritics.
+    The content is indexed with the SQLite FTS5 trigram tokenizer or the PostgreSQL pg_trgm GIN index,
+    depending on the database backend (see migration 0012).
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True)
+    content = models.TextField()
+
+
+class DocumentContent(models.Model):
+    """
+    Text extracted from the file of a document, which makes the document's contents searchable.
+
+    The name of the extracted file tells whether the text is up to date with the document's file.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name="content")
+    file_name = models.CharField(max_length=255)
+    text = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+
+class Job(models.Model):
+    """
+    Background job stored in the database and run by the run_jobs worker (see document/jobs.py).
+
+    Jobs with a higher priority run first; failed jobs are retried after a growing delay.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "w kolejce"),
+        (RUNNING, "w toku"),
+        (DONE, "zakończone"),
+        (FAILED, "błąd"),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    # Refreshed by long jobs while they run, so they are not taken for jobs of a stopped worker
+    heartbeat_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.id}"
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "priority", "run_after"])]
+
+
+class Upload(models.Model):
+    """File uploaded in chunks, assembled on disk until the document form is submitted (see document/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # SHA-256 digest of the whole file, if the client has computed it
+    sha256 = models.CharField(max_length=64, blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.file_name
+
+
+class UploadChunk(models.Model):
+    """Received part of an upload with its SHA-256 digest."""
+    upload = models.ForeignKey(Upload, on_delete=models.CASCADE, related_name="chunks")
+    offset = models.BigIntegerField()
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ("upload", "offset")
@@ -0,0 +1,38 @@
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+
+MANAGER_GROUP = "manager"
+
+
+def get_roles(user):
+    """
+    Get names of the user's groups.
+
+    The names are fetched once and kept on the user object, which lives as long as the request.
+
+    :param user: user object
+    :return: frozenset of strings
+    """
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, "_document_roles", None)
+    if roles is None:
+        roles = frozenset(user.groups.values_list("name", flat=True))
+        user._document_roles = roles
+    return roles
+
+
+def is_manager(user):
+    """
+    Check if the user can manage documents, products and categories.
+
+    :param user: user object
+    :return: boolean
+    """
+    return MANAGER_GROUP in get_roles(user)
+
+
+class ManagerRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
+    """Allow access to logged-in managers only."""
+    def test_func(self):
+        return is_manager(self.request.user)
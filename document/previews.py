@@ -0,0 +1,258 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from document import extraction, jobs, models, tasks
+from document.utils import compression, extract
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE = "image"
+TEXT = "text"
+EXTENSIONS = {IMAGE: ".png", TEXT: ".txt"}
+CONTENT_TYPES = {IMAGE: "image/png", TEXT: "text/plain; charset=utf-8"}
+
+NO_PREVIEW = "Podgląd tego pliku jest niedostępny."
+# Other processes add previews too, so the cache directory is scanned at least this often (in seconds)
+EVICT_INTERVAL = 60
+
+_lock = threading.Lock()
+# Estimated size of each cache directory and the time of its last scan, kept by this process
+_cache_sizes = {}
+
+
+def schedule_previews(document_ids):
+    """
+    Generate previews of the documents in the background, once the current transaction is committed.
+
+    :param document_ids: list of ids of documents
+    :return: None
+    """
+    tasks.run_in_background(generate_previews, list(document_ids), priority=jobs.LOW)
+    return None
+
+
+def generate_previews(document_ids):
+    """
+    Generate previews of the documents and save them in the cache.
+
+    :param document_ids: list of ids of documents
+    :return: None
+    """
+    for document in models.Document.objects.filter(id__in=document_ids):
+        generate(document)
+    return None
+
+
+def discard(document):
+    """
+    Remove cached previews of the document, e.g. when its file is replaced under the same name or it is deleted.
+
+    :param document: document object
+    :return: None
+    """
+    for kind in EXTENSIONS:
+        try:
+            os.remove(cache_path(document, kind))
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def get_kinds(document):
+    """
+    Get kinds of previews of the document, from the preferred one.
+
+    The first page of a PDF is rendered to PNG if PyMuPDF is installed, other files get an excerpt of their text.
+
+    :param document: document object
+    :return: list of IMAGE and TEXT
+    """
+    if fitz is not None and document.file.name.lower().endswith(".pdf"):
+        return [IMAGE, TEXT]
+    return [TEXT]
+
+
+def get_key(document):
+    """
+    Get key of the document's previews in the cache.
+
+    :param document: document object
+    :return: string
+    """
+    return hashlib.sha256(f"{document.id}:{document.file.name}".encode()).hexdigest()
+
+
+def cache_path(document, kind):
+    return os.path.join(settings.DOCUMENT_PREVIEW_ROOT, get_key(document) + EXTENSIONS[kind])
+
+
+def find_cached(document):
+    """
+    Find the cached preview of the document and mark it as recently used.
+
+    :param document: document object
+    :return: tuple (path, kind) or None if the preview is not cached
+    """
+    for kind in get_kinds(document):
+        path = cache_path(document, kind)
+        try:
+            # Modification time tells which previews were used least recently
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        return path, kind
+    return None
+
+
+def get_preview(document):
+    """
+    Get the preview of the document, generating it if it is not cached.
+
+    :param document: document object
+    :return: tuple (data, kind) with the bytes of the preview
+    """
+    cached = find_cached(document)
+    if cached is not None:
+        path, kind = cached
+        try:
+            with open(path, "rb") as fh:
+                return fh.read(), kind
+        except FileNotFoundError:
+            # Evicted in the meantime
+            pass
+    return generate(document)
+
+
+def generate(document):
+    """
+    Generate the preview of the document and save it in the cache.
+
+    If the first page cannot be rendered, e.g. the PDF is damaged, a text excerpt is used instead.
+
+    :param document: document object
+    :return: tuple (data, kind) with the bytes of the preview
+    """
+    for kind in get_kinds(document):
+        try:
+            data = RENDERERS[kind](document)
+        except Exception:
+            logger.exception("Preview of document %s could not be rendered", document.id)
+            continue
+        save(cache_path(document, kind), data)
+        return data, kind
+    return NO_PREVIEW.encode(), TEXT
+
+
+def render_image(document):
+    """Render the first page of the PDF file to PNG."""
+    path, codec = extraction.locate(document.file.name)
+    if not path:
+        # Remote storages have no local paths
+        with document.file.open("rb") as fh:
+            with fitz.open(stream=fh.read(), filetype="pdf") as pdf:
+                return render_page(pdf)
+    # PyMuPDF reads only the parts of the file it needs
+    with compression.decompressed_copy(path, codec) as plain_path, fitz.open(plain_path, filetype="pdf") as pdf:
+        return render_page(pdf)
+
+
+def render_page(pdf):
+    page = pdf[0]
+    zoom = settings.DOCUMENT_PREVIEW_WIDTH / page.rect.width
+    return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("png")
+
+
+def render_text(document):
+    """Get an excerpt of the file's text, extracted earlier if possible."""
+    max_chars = settings.DOCUMENT_PREVIEW_EXCERPT_CHARS
+    contents = models.DocumentContent.objects.filter(document=document, file_name=document.file.name)
+    text = contents.values_list("text", flat=True).first()
+    if text is None:
+        name = document.file.name
+        text, _ = extract.extract((*extraction.locate(name), name, max_chars + 1))
+
+    text = re.sub(r"\n\s*\n", "\n\n", text.strip())
+    if not text:
+        text = NO_PREVIEW
+    elif len(text) > max_chars:
+        text = text[:max_chars].rstrip() + "…"
+    return text.encode()
+
+
+RENDERERS = {IMAGE: render_image, TEXT: render_text}
+
+
+def save(path, data):
+    """
+    Save the preview in the cache and evict the least recently used previews above the size limit.
+
+    The cache directory is scanned only when the estimated size exceeds the limit or EVICT_INTERVAL has passed.
+
+    :param path: string, path from cache_path
+    :param data: bytes
+    :return: None
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Readers never see a partially written file
+    fd, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(data)
+    os.replace(temporary_path, path)
+
+    root = settings.DOCUMENT_PREVIEW_ROOT
+    with _lock:
+        size, evicted_at = _cache_sizes.get(root, (None, 0))
+        if size is not None:
+            size += len(data)
+            _cache_sizes[root] = (size, evicted_at)
+    if size is None or size > settings.DOCUMENT_PREVIEW_CACHE_SIZE or time.monotonic() - evicted_at > EVICT_INTERVAL:
+        evict()
+    return None
+
+
+def evict(max_size=None):
+    """
+    Remove the least recently used previews until the cache fits the size limit.
+
+    Previews of deleted documents are removed with the documents (see discard).
+
+    :param max_size: integer, number of bytes, defaults to settings.DOCUMENT_PREVIEW_CACHE_SIZE
+    :return: integer, number of removed previews
+    """
+    if max_size is None:
+        max_size = settings.DOCUMENT_PREVIEW_CACHE_SIZE
+    entries = []
+    with os.scandir(settings.DOCUMENT_PREVIEW_ROOT) as scanner:
+        for entry in scanner:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    with _lock:
+        _cache_sizes[settings.DOCUMENT_PREVIEW_ROOT] = (total, time.monotonic())
+    return removed
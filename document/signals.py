@@ -0,0 +1,128 @@
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from document import extraction, instrumentation, models, previews, tasks
+from document.utils import counters, feed, search, typeahead
+
+# Sent by bulk operations which bypass the model signals (bulk_create, update), with the "ids" of documents
+documents_changed = Signal()
+
+
+@receiver(request_started)
+def start_job_scheduler(sender, **kwargs):
+    tasks.start_scheduler()
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    instrumentation.instrument(connection)
+
+
+@receiver(post_save, sender=models.Document)
+def index_document(sender, instance, **kwargs):
+    search.index_documents(models.Document.objects.filter(id=instance.id))
+
+
+@receiver(post_save, sender=models.Product)
+def index_product_documents(sender, instance, **kwargs):
+    search.index_documents(instance.document_set.all())
+
+
+@receiver(post_save, sender=models.Category)
+def index_category_documents(sender, instance, **kwargs):
+    search.index_documents(instance.document_set.all())
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    instance._original_username = instance.__dict__.get("username")
+
+
+@receiver(post_save, sender=User)
+def index_user_documents(sender, instance, created, update_fields=None, **kwargs):
+    # Only the username is indexed, so logging in or changing the password should not touch the index
+    if update_fields is not None and "username" not in update_fields:
+        return
+    changed = not created and instance.username != instance._original_username
+    instance._original_username = instance.username
+    if changed:
+        search.index_documents(models.Document.objects.filter(created_by=instance))
+
+
+@receiver(documents_changed)
+def index_changed_documents(sender, ids, **kwargs):
+    search.index_documents(models.Document.objects.filter(id__in=ids))
+
+
+@receiver([post_save, post_delete], sender=models.Document)
+@receiver([post_save, post_delete], sender=models.Product)
+@receiver([post_save, post_delete], sender=models.Category)
+@receiver(documents_changed)
+def invalidate_feed(sender, **kwargs):
+    feed.invalidate()
+
+
+@receiver(post_save, sender=models.Product)
+@receiver(post_save, sender=models.Category)
+def update_saved_suggestions(sender, instance, **kwargs):
+    typeahead.update(instance)
+
+
+@receiver(post_delete, sender=models.Product)
+@receiver(post_delete, sender=models.Category)
+def update_deleted_suggestions(sender, instance, **kwargs):
+    typeahead.update(instance, deleted=True)
+
+
+@receiver(post_init, sender=models.Document)
+def remember_counted_keys(sender, instance, **kwargs):
+    # Deferred fields are not loaded here, as that would cost a query per document
+    instance._counted_keys = (instance.__dict__.get("product_id"), instance.__dict__.get("category_id"))
+    instance._original_file = getattr(instance.__dict__.get("file"), "name", instance.__dict__.get("file"))
+
+
+@receiver(post_save, sender=models.Document)
+def count_saved_document(sender, instance, created, **kwargs):
+    keys = (instance.product_id, instance.category_id)
+    if created:
+        counters.change(*keys, 1)
+    elif keys != instance._counted_keys and None not in instance._counted_keys:
+        counters.change(*instance._counted_keys, -1)
+        counters.change(*keys, 1)
+    instance._counted_keys = keys
+
+
+@receiver(post_delete, sender=models.Document)
+def count_deleted_document(sender, instance, **kwargs):
+    counters.change(instance.product_id, instance.category_id, -1)
+
+
+@receiver(pre_save, sender=models.Document)
+def check_file_replaced(sender, instance, raw, **kwargs):
+    # Uploaded files are not committed yet; re-uploading a file may keep its name
+    instance._file_replaced = not raw and (
+        instance.pk is None or not instance.file._committed or instance.file.name != instance._original_file
+    )
+
+
+@receiver(post_save, sender=models.Document)
+def extract_replaced_file(sender, instance, **kwargs):
+    if instance._file_replaced:
+        extraction.schedule_extraction([instance.id])
+    instance._original_file = instance.file.name
+
+
+@receiver(post_delete, sender=models.Document)
+def discard_deleted_previews(sender, instance, **kwargs):
+    previews.discard(instance)
+
+
+@receiver(post_save, sender=models.Document)
+def preview_replaced_file(sender, instance, **kwargs):
+    # Connected after extract_replaced_file, so text excerpts can use the extracted text
+    if instance._file_replaced:
+        previews.discard(instance)
+        previews.schedule_previews([instance.id])
@@ -0,0 +1,103 @@
+// Large files are uploaded in chunks, which are retried and resumed after a dropped connection;
+// the form is then submitted with the id of the upload instead of the file
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const CHUNK_ATTEMPTS = 5;
+
+document.addEventListener("DOMContentLoaded", function() {
+    const form = document.querySelector("form[data-upload-url]");
+    const file_input = form.querySelector("input[type=file][name=file]");
+    const upload_input = form.querySelector("input[name=upload]");
+    const csrf_token = form.querySelector("input[name=csrfmiddlewaretoken]").value;
+    const progress = document.createElement("p");
+    form.appendChild(progress);
+
+    // File uploaded earlier is kept when the form comes back with errors
+    if (upload_input.value) {
+        file_input.required = false;
+    }
+
+    function request(url, options) {
+        options.headers = Object.assign({"X-CSRFToken": csrf_token}, options.headers);
+        options.credentials = "same-origin";
+        return fetch(url, options).then(function(response) {
+            if (!response.ok) {
+                return response.json().then(function(data) {
+                    throw new Error(data.error || "Błąd przesyłania (" + response.status + ").");
+                });
+            }
+            return response.json();
+        });
+    }
+
+    async function sha256(blob) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest("SHA-256", await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(byte => byte.toString(16).padStart(2, "0")).join("");
+    }
+
+    async function startUpload(file) {
+        // Upload interrupted e.g. by closing the page is resumed
+        const key = "upload:" + file.name + ":" + file.size + ":" + file.lastModified;
+        const url = sessionStorage.getItem(key);
+        if (url) {
+            try {
+                const status = await request(url, {method: "GET"});
+                status.url = url;
+                return status;
+            } catch (error) {
+                sessionStorage.removeItem(key);
+            }
+        }
+        const data = new FormData();
+        data.append("name", file.name);
+        data.append("size", file.size);
+        const status = await request(form.dataset.uploadUrl, {method: "POST", body: data});
+        sessionStorage.setItem(key, status.url);
+        return status;
+    }
+
+    async function sendChunk(url, offset, chunk) {
+        const headers = {"Content-Type": "application/octet-stream"};
+        const digest = await sha256(chunk);
+        if (digest) {
+            headers["X-Chunk-SHA256"] = digest;
+        }
+        for (let attempt = 1; ; attempt++) {
+            try {
+                return await request(url + "?offset=" + offset, {method: "PUT", headers: headers, body: chunk});
+            } catch (error) {
+                if (attempt >= CHUNK_ATTEMPTS) {
+                    throw error;
+                }
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
+            }
+        }
+    }
+
+    form.addEventListener("submit", async function(event) {
+        const file = file_input.files[0];
+        if (!file || file.size < CHUNKED_UPLOAD_THRESHOLD) {
+            return;
+        }
+        event.preventDefault();
+
+        try {
+            const upload = await startUpload(file);
+            let received = upload.received;
+            while (received < file.size) {
+                progress.textContent = "Przesyłanie pliku: " + Math.floor(100 * received / file.size) + "%";
+                const chunk = file.slice(received, received + upload.chunk_size);
+                received = (await sendChunk(upload.url, received, chunk)).received;
+            }
+            progress.textContent = "Przesłano plik, zapisywanie dokumentu...";
+            upload_input.value = upload.id;
+            file_input.value = "";
+            file_input.required = false;
+            form.submit();
+        } catch (error) {
+            progress.textContent = error.message + " Spróbuj ponownie, przesyłanie zostanie wznowione.";
+        }
+    });
+})
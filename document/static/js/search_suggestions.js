@@ -0,0 +1,34 @@
+// Products, model codes and categories are suggested while the phrase is typed
+const SUGGEST_DELAY = 100;
+
+document.addEventListener("DOMContentLoaded", function() {
+    const search_field = document.getElementById("search_field");
+    const datalist = document.getElementById(search_field.getAttribute("list"));
+    let timeout = null;
+    let controller = null;
+
+    function showSuggestions(suggestions) {
+        datalist.replaceChildren(...suggestions.map(function(suggestion) {
+            const option = document.createElement("option");
+            option.value = suggestion.phrase;
+            option.label = suggestion.label;
+            return option;
+        }));
+    }
+
+    search_field.addEventListener("input", function() {
+        clearTimeout(timeout);
+        timeout = setTimeout(function() {
+            // Response to an older phrase is not shown over the newer one
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            const url = search_field.dataset.suggestUrl + "?q=" + encodeURIComponent(search_field.value);
+            fetch(url, {credentials: "same-origin", signal: controller.signal})
+                .then(response => response.json())
+                .then(data => showSuggestions(data.suggestions))
+                .catch(() => {});
+        }, SUGGEST_DELAY);
+    });
+})
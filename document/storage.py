@@ -0,0 +1,331 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from document import jobs, models, tasks
+from document.utils import compression
+
+BLOB_DIR = "blobs"
+CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage which keeps each distinct content only once.
+
+    Uploads are hashed while they are written. The content is stored under its SHA-256 digest
+    in the "blobs" directory and the file name only points to the content (models.StoredFile).
+    The content is removed when the last name pointing to it is deleted.
+
+    Contents of text-heavy formats are compressed with a codec chosen by their MIME type
+    (settings.DOCUMENT_COMPRESSION) by a low-priority background job, and transparently decompressed
+    when they are opened.
+    path() gives the stored, possibly compressed, file; get_codec() tells how it is compressed. Each of them
+    queries the database, stat() gets both with the size at once.
+
+    Files saved before the storage was introduced are still read from their own names.
+    """
+    def blob_name(self, digest, codec=""):
+        return os.path.join(BLOB_DIR, digest[:2], digest[2:4], digest + compression.SUFFIXES.get(codec, ""))
+
+    def blob_path(self, digest, codec=""):
+        return super().path(self.blob_name(digest, codec))
+
+    def stored_file(self, name):
+        return models.StoredFile.objects.select_related("blob").filter(name=name).first()
+
+    def exists(self, name):
+        return models.StoredFile.objects.filter(name=name).exists() or super().exists(name)
+
+    def path(self, name):
+        return self.locate(name)[0]
+
+    def get_codec(self, name):
+        return self.locate(name)[1]
+
+    def locate(self, name):
+        """
+        Get path of the stored file and its codec with one query.
+
+        :param name: string, name of the file
+        :return: tuple (path, codec), codec is "" if the file is not compressed
+        """
+        stored_file = self.stored_file(name)
+        if stored_file is None:
+            return super().path(name), ""
+        return self.blob_path(stored_file.blob.digest, stored_file.blob.codec), stored_file.blob.codec
+
+    def stat(self, name):
+        """
+        Get path, codec and size of the stored file with one query.
+
+        Each of path(), get_codec() and size() queries the database, so callers needing more of them use this.
+
+        :param name: string, name of the file
+        :return: tuple (path, codec, size), codec is "" if the file is not compressed
+        :raises FileNotFoundError: if the file does not exist
+        """
+        stored_file = self.stored_file(name)
+        if stored_file is None:
+            path = super().path(name)
+            return path, "", os.path.getsize(path)
+        blob = stored_file.blob
+        return self.blob_path(blob.digest, blob.codec), blob.codec, blob.size
+
+    def size(self, name):
+        stored_file = self.stored_file(name)
+        if stored_file is None:
+            return super().size(name)
+        return stored_file.blob.size
+
+    def _open(self, name, mode="rb"):
+        return open_path(*self.locate(name), mode)
+
+    def _save(self, name, content):
+        digest, size, temporary_path = self.write_temporary(content)
+        self.store_temporary(name, digest, size, temporary_path, keep_temporary=hasattr(content, "temporary_file_path"))
+        return name
+
+    def save_temporary(self, name, digest, size, temporary_path, max_length=None):
+        """
+        Save the content of a temporary file from write_temporary under an available name.
+
+        The content can be hashed and written in other threads, so only the database is used here.
+        The temporary file is moved to the blobs when its content is new, otherwise it is left in place.
+
+        :param name: string, wanted name of the file
+        :param digest: string, SHA-256 digest of the content
+        :param size: integer, size of the content in bytes
+        :param temporary_path: string, path of the temporary file
+        :param max_length: integer, maximal length of the name
+        :return: tuple (name, whether the temporary file has been moved to the blobs)
+        """
+        name = self.get_available_name(self.generate_filename(name), max_length=max_length)
+        return name, self.store_temporary(name, digest, size, temporary_path, keep_temporary=True)
+
+    def store_temporary(self, name, digest, size, temporary_path, keep_temporary=False):
+        """
+        Point the name to the content of a temporary file from write_temporary.
+
+        :param name: string, name of the file
+        :param digest: string, SHA-256 digest of the content
+        :param size: integer, size of the content in bytes
+        :param temporary_path: string, path of the temporary file
+        :param keep_temporary: boolean, whether the temporary file is left in place if the content is already stored
+        :return: boolean, whether the temporary file has been moved to the blobs
+        """
+        with transaction.atomic():
+            # Locked, so a concurrent deletion of the last reference cannot remove the file which is kept
+            blobs = models.Blob.objects.select_for_update()
+            blob, _ = blobs.get_or_create(digest=digest, defaults={"size": size})
+            stored = self.store_blob(blob, temporary_path, keep_temporary=keep_temporary)
+            models.Blob.objects.filter(digest=digest).update(references=F("references") + 1)
+            models.StoredFile.objects.create(name=name, blob=blob)
+
+        # Compression takes long for big files, so they are stored as they are and compressed later
+        codec = compression.choose_codec(mimetypes.guess_type(name)[0], settings.DOCUMENT_COMPRESSION)
+        if stored and codec:
+            tasks.run_in_background(compress_blob, self.location, digest, codec, priority=jobs.LOW)
+        return stored
+
+    def restore_temporary(self, digest, temporary_path):
+        """
+        Move the file of a blob stored by a rolled back transaction back to its temporary file.
+
+        The file is kept if the same content has been saved again in the meantime.
+
+        :param digest: string, SHA-256 digest of the content
+        :param temporary_path: string, path of the temporary file given to save_temporary
+        :return: None
+        """
+        with transaction.atomic():
+            if models.Blob.objects.select_for_update().filter(digest=digest).exists():
+                return None
+            # Compressed copies are made right away only by eager jobs
+            for codec in compression.SUFFIXES:
+                remove_file(self.blob_path(digest, codec))
+            os.replace(self.blob_path(digest), temporary_path)
+        return None
+
+    def write_temporary(self, content):
+        """
+        Hash the content and make sure it is in a temporary file next to the blobs.
+
+        Uploads which Django has already written to disk are only read; other content is streamed
+        into a new temporary file.
+
+        :param content: file object to be saved
+        :return: tuple (digest, size, path of the temporary file)
+        """
+        sha256 = hashlib.sha256()
+        size = 0
+
+        if hasattr(content, "temporary_file_path"):
+            # Read through the content, which may check itself on the way (uploads.AssembledFile)
+            for chunk in content.chunks(CHUNK_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+            return sha256.hexdigest(), size, content.temporary_file_path()
+
+        fd, temporary_path = tempfile.mkstemp(dir=self.temporary_dir())
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in content.chunks(CHUNK_SIZE):
+                sha256.update(chunk)
+                size += len(chunk)
+                fh.write(chunk)
+        return sha256.hexdigest(), size, temporary_path
+
+    def store_blob(self, blob, temporary_path, keep_temporary=False):
+        """
+        Move the temporary file to the blob's place unless the same content is already stored.
+
+        :param blob: Blob object, locked by the current transaction
+        :param temporary_path: string, path of the file with the content
+        :param keep_temporary: boolean, whether the temporary file is left in place (Django removes its own uploads)
+        :return: boolean, whether the file has been moved
+        """
+        path = self.blob_path(blob.digest, blob.codec)
+        if os.path.exists(path):
+            if not keep_temporary:
+                os.remove(temporary_path)
+            return False
+
+        # A compressed blob whose file is missing gets the content back as it is
+        if blob.codec:
+            models.Blob.objects.filter(digest=blob.digest).update(codec="", stored_size=None)
+            blob.codec, blob.stored_size = "", None
+            path = self.blob_path(blob.digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_move_safe(temporary_path, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return True
+
+    def compress_temporary(self, temporary_path, codec, size):
+        """
+        Compress the file into a new temporary file next to the blobs.
+
+        :param temporary_path: string, path of the file
+        :param codec: string, codec
+        :param size: integer, size of the file in bytes
+        :return: string, path of the compressed file, or None if compression saves too little
+        """
+        fd, compressed_path = tempfile.mkstemp(dir=self.temporary_dir())
+        os.close(fd)
+        stored_size = compression.compress_file((temporary_path, compressed_path, codec))
+        if compression.is_worth_it(size, stored_size, settings.DOCUMENT_COMPRESSION_MIN_SAVING):
+            return compressed_path
+        os.remove(compressed_path)
+        return None
+
+    def switch_codec(self, digest, codec, compressed_path, stored_size):
+        """
+        Replace the uncompressed content of a blob with its compressed copy.
+
+        The copy is moved to its own name and the codec is switched with the blob locked, so a concurrent deletion
+        of the last reference either removes the blob first (and the copy is dropped) or waits and removes the copy.
+        Readers keep using the uncompressed file, which is removed only after the commit.
+
+        :param digest: string, SHA-256 digest of the content
+        :param codec: string, codec of the copy
+        :param compressed_path: string, path of the compressed copy, moved or removed
+        :param stored_size: integer, size of the copy in bytes
+        :return: boolean, whether the codec was switched
+        """
+        with transaction.atomic():
+            blob = models.Blob.objects.select_for_update().filter(digest=digest, codec="").first()
+            if blob is None:
+                os.remove(compressed_path)
+                return False
+            if self.file_permissions_mode is not None:
+                os.chmod(compressed_path, self.file_permissions_mode)
+            os.replace(compressed_path, self.blob_path(digest, codec))
+            models.Blob.objects.filter(digest=digest).update(codec=codec, stored_size=stored_size)
+            transaction.on_commit(lambda: remove_file(self.blob_path(digest)))
+        return True
+
+    def temporary_dir(self):
+        temporary_dir = super().path(os.path.join(BLOB_DIR, "tmp"))
+        os.makedirs(temporary_dir, exist_ok=True)
+        return temporary_dir
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+
+        with transaction.atomic():
+            stored_file = models.StoredFile.objects.filter(name=name).first()
+            if stored_file is None:
+                return super().delete(name)
+            digest = stored_file.blob_id
+            stored_file.delete()
+            models.Blob.objects.filter(digest=digest).update(references=F("references") - 1)
+
+        self.remove_unreferenced(digest)
+
+    def remove_unreferenced(self, digest):
+        """
+        Remove the blob and its file if no name points to it.
+
+        The blob stays in the database until its file is removed, so saving the same content in the meantime
+        waits for the lock and then stores the file again, or keeps the blob and its file.
+
+        :param digest: string, SHA-256 digest of the content
+        :return: None
+        """
+        with transaction.atomic():
+            blob = models.Blob.objects.select_for_update().filter(digest=digest, references__lte=0).first()
+            if blob is not None:
+                remove_file(self.blob_path(digest, blob.codec))
+                blob.delete()
+
+
+def compress_blob(location, digest, codec):
+    """
+    Compress the content of a blob saved without compression (run as a background job).
+
+    The content stays uncompressed if it was deleted or compressed in the meantime, or if compression
+    saves too little (settings.DOCUMENT_COMPRESSION_MIN_SAVING).
+
+    :param location: string, location of the storage
+    :param digest: string, SHA-256 digest of the content
+    :param codec: string, codec
+    :return: None
+    """
+    storage = ContentAddressedStorage(location=location)
+    blob = models.Blob.objects.filter(digest=digest, codec="").first()
+    if blob is None or not os.path.isfile(storage.blob_path(digest)):
+        return None
+    compressed_path = storage.compress_temporary(storage.blob_path(digest), codec, blob.size)
+    if compressed_path is not None:
+        storage.switch_codec(digest, codec, compressed_path, os.path.getsize(compressed_path))
+    return None
+
+
+def open_path(path, codec, mode="rb"):
+    """
+    Open the stored file by its path from locate() or stat(), decompressing it if it is compressed.
+
+    :param path: string, path of the stored file
+    :param codec: string, codec of the file
+    :param mode: string, mode of uncompressed files
+    :return: File
+    """
+    if codec:
+        return File(compression.open_reader(path, codec), name=path)
+    return File(open(path, mode))
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
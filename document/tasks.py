@@ -0,0 +1,168 @@
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from document import jobs
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_process_pool = None
+_process_pool_workers = None
+_process_pool_lock = threading.Lock()
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_TASKS_WORKERS, thread_name_prefix="archowum")
+    return _executor
+
+
+def get_process_pool(workers):
+    """
+    Get the pool of processes of this process.
+
+    Spawned processes import the modules again, which takes long, so the pool is kept for later calls.
+    It is created again if a different number of processes is requested.
+
+    :param workers: integer, number of processes
+    :return: ProcessPoolExecutor
+    """
+    global _process_pool, _process_pool_workers
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_workers != workers:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            context = multiprocessing.get_context("spawn")
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _process_pool_workers = workers
+        return _process_pool
+
+
+def _discard_process_pool(pool):
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background task %s failed", func.__name__)
+    finally:
+        connection.close()
+
+
+def run_in_background(func, *args, priority=jobs.NORMAL):
+    """
+    Run the function in the background as a job saved in the database (see document/jobs.py).
+
+    The job is saved in the current transaction and is run by the run_jobs worker. With settings.JOBS_IN_PROCESS
+    queued jobs are also run in a background thread once the current transaction is committed, so the application
+    works without a worker (see also start_scheduler). With settings.BACKGROUND_TASKS_EAGER the function runs
+    immediately in the calling thread, as a job with a single attempt.
+    Arguments should be simple values (e.g. ids), as the function runs outside the request.
+
+    :param func: function to be run, defined at the top level of a module
+    :param args: JSON-serializable arguments of the function
+    :param priority: integer, jobs with a higher priority run first
+    :return: None
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        jobs.run_now(func, *args)
+        return None
+    jobs.enqueue(func, *args, priority=priority)
+    if settings.JOBS_IN_PROCESS:
+        transaction.on_commit(lambda: get_executor().submit(_run, jobs.work, (True,)))
+    return None
+
+
+def start_scheduler():
+    """
+    Start the thread which checks the queue of the web process every settings.JOBS_IN_PROCESS_INTERVAL seconds.
+
+    Without a run_jobs worker it queues again jobs left running by a restarted process and runs retries
+    once they are due. It is started once per process, with the first request.
+
+    :return: None
+    """
+    global _scheduler
+    if not settings.JOBS_IN_PROCESS or settings.BACKGROUND_TASKS_EAGER or settings.JOBS_IN_PROCESS_INTERVAL <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_check_queue, name="archowum-scheduler", daemon=True)
+            _scheduler.start()
+    return None
+
+
+def _check_queue():
+    while True:
+        time.sleep(settings.JOBS_IN_PROCESS_INTERVAL)
+        try:
+            jobs.requeue_stale()
+        except Exception:
+            logger.exception("Stale jobs could not be queued again")
+        finally:
+            connection.close()
+        get_executor().submit(_run, jobs.work, (True,))
+
+
+def map_in_threads(func, items, workers):
+    """
+    Apply the function to the items using a pool of threads.
+
+    With settings.BACKGROUND_TASKS_EAGER the items are processed one by one in the calling thread.
+
+    :param func: function of one argument
+    :param items: list of arguments
+    :param workers: integer, number of threads
+    :return: list of results
+    """
+    if settings.BACKGROUND_TASKS_EAGER or workers < 2:
+        return [func(item) for item in items]
+
+    def run(item):
+        try:
+            return func(item)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run, items))
+
+
+def map_in_processes(func, items, workers):
+    """
+    Apply the function to the items using a pool of processes, e.g. for CPU-bound work.
+
+    Processes are spawned, so the function should be importable and should not use Django. They are kept
+    for later calls (see get_process_pool).
+    With settings.BACKGROUND_TASKS_EAGER the items are processed one by one in the calling process.
+
+    :param func: function of one argument defined at the top level of a module
+    :param items: list of picklable arguments
+    :param workers: integer, number of processes
+    :return: list of results
+    """
+    if settings.BACKGROUND_TASKS_EAGER or workers < 1 or not items:
+        return [func(item) for item in items]
+
+    pool = get_process_pool(workers)
+    try:
+        return list(pool.map(func, items))
+    except BrokenProcessPool:
+        # A killed process breaks the pool, so the next call gets a new one
+        _discard_process_pool(pool)
+        raise
@@ -1,15 +1,49 @@
+import csv
 import datetime
+import gzip
+import hashlib
+import io
+import json
 import os
-from django.contrib.auth.models import User, Group
+import shutil
+import tempfile
+import threading
+import zipfile
+import zlib
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
-
-from document import models
-
-
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.http import StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from document import (
+    async_views, bulk_edit, deletion, export, extraction, handlers, instrumentation, jobs, models, previews, tasks,
+    uploads, views,
+)
+from document.management.commands import benchmark, import_documents
+from document.utils import downloads, extract, pagination, search, typeahead, utils
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True, JOBS_IN_PROCESS_INTERVAL=0)
 class ExtendedTestCase(TestCase):
     def setUp(self):
         self.client = Client()
+        cache.clear()
+        preview_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, preview_root)
+        preview_settings = self.settings(DOCUMENT_PREVIEW_ROOT=preview_root)
+        preview_settings.enable()
+        self.addCleanup(preview_settings.disable)
 
     def log_user(self):
         user = User.objects.create(username='user123')
@@ -21,6 +55,17 @@ class ExtendedTestCase(TestCase):
         user.groups.add(manager_group)
         self.client.force_login(user)
 
+    def assertWithinQueryBudget(self, url):
+        """Request the page and check that it does not run more queries than its view's query budget."""
+        budget = instrumentation.get_query_budget(resolve(url.split("?")[0]).func)
+        self.assertIsNotNone(budget)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sqls = "\n".join(query["sql"] for query in queries)
+        self.assertLessEqual(len(queries), budget, f"{url} ran {len(queries)} queries:\n{sqls}")
+        return response
+
 
 class TestMainView(ExtendedTestCase):
     def test_get(self):
@@ -106,6 +151,230 @@ class TestMainView03(ExtendedTestCase):
         self.assertEqual(response.context.get("documents").first().id, 12)
 
 
+class TestMainViewPagination03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def test_feed_pages(self):
+        self.log_user()
+        response = self.client.get("/")
+        page = response.context.get("page")
+        self.assertEqual([document.id for document in page], list(range(12, 2, -1)))
+        self.assertEqual(page.next_cursor, 3)
+        self.assertIsNone(page.previous_cursor)
+
+        response = self.client.get("/?after=3")
+        page = response.context.get("page")
+        self.assertEqual([document.id for document in page], [2, 1])
+        self.assertIsNone(page.next_cursor)
+        self.assertEqual(page.previous_cursor, 2)
+
+        response = self.client.get("/?before=2")
+        page = response.context.get("page")
+        self.assertEqual([document.id for document in page], list(range(12, 2, -1)))
+        self.assertIsNone(page.previous_cursor)
+
+    def test_search_pages(self):
+        self.log_user()
+        response = self.client.get("/search/?phrase=alamakota&after=6")
+        page = response.context.get("page")
+        self.assertEqual([document.id for document in page], [5, 4, 3, 2, 1])
+        self.assertEqual(page.previous_cursor, 5)
+        self.assertEqual(response.context.get("no_documents"), 6)
+
+    def test_count_limit(self):
+        self.log_user()
+        with mock.patch.object(views.MainView, "count_limit", 5):
+            response = self.client.get("/search/?phrase=2012")
+        self.assertEqual(response.context.get("no_documents"), 5)
+        self.assertTrue(response.context.get("more_documents"))
+
+
+class TestMainViewFeedCache03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def get_feed(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get("/")
+        document_queries = [query for query in context.captured_queries if "document_" in query["sql"]]
+        return response, document_queries
+
+    def test_cache_hit(self):
+        self.log_user()
+        response, document_queries = self.get_feed()
+        self.assertTrue(document_queries)
+        self.assertContains(response, "#12")
+
+        response, document_queries = self.get_feed()
+        self.assertEqual(document_queries, [])
+        self.assertContains(response, "#12")
+        self.assertContains(response, "starsze")
+
+    def test_invalidation(self):
+        self.log_user()
+        self.get_feed()
+
+        models.Product.objects.filter(id=2).update(name="Produkt zmieniony")
+        models.Product.objects.get(id=2).save()
+        response, document_queries = self.get_feed()
+        self.assertTrue(document_queries)
+        self.assertContains(response, "Produkt zmieniony")
+
+        models.Document.objects.get(id=12).delete()
+        response, _ = self.get_feed()
+        self.assertNotContains(response, "#12")
+
+        document = models.Document.objects.get(id=11)
+        bulk_edit.edit_documents(
+            models.Document.objects.filter(id=11), "category", models.Category.objects.get(id=2), document.created_by
+        )
+        _, document_queries = self.get_feed()
+        self.assertTrue(document_queries)
+
+
+class TestQueryBudgets(ExtendedTestCase):
+    """Page cost must not grow with the number of rows shown."""
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username="author")
+        models.Product.objects.bulk_create(models.Product(name=f"Produkt {i}", model=f"MODEL{i}") for i in range(200))
+        models.Category.objects.bulk_create(models.Category(name=f"Kategoria {i}") for i in range(50))
+        products = list(models.Product.objects.order_by("id"))
+        categories = list(models.Category.objects.order_by("id"))
+        models.Document.objects.bulk_create(
+            models.Document(
+                product=products[i % 200],
+                category=categories[i % 50],
+                validity_start=datetime.date(2000, 1, 1) + datetime.timedelta(days=i),
+                file=f"file{i}.pdf",
+                created_by=user,
+            )
+            for i in range(300)
+        )
+        cls.document = models.Document.objects.first()
+        models.History.objects.bulk_create(
+            models.History(
+                document=cls.document,
+                element="plik",
+                changed_from=f"file{i}.pdf",
+                changed_to=f"file{i + 1}.pdf",
+                changed_by=User.objects.create(username=f"editor{i}"),
+            )
+            for i in range(50)
+        )
+        search.rebuild_index()
+
+    def test_main_view(self):
+        self.log_manager()
+        self.assertWithinQueryBudget("/")
+        response = self.assertWithinQueryBudget("/search/?phrase=produkt")
+        self.assertWithinQueryBudget(f"/search/?phrase=produkt&after={response.context['page'].next_cursor}")
+
+    def test_document_detail_view(self):
+        self.log_manager()
+        response = self.assertWithinQueryBudget(f"/document/{self.document.id}")
+        self.assertEqual(len(response.context["history_set"]), 50)
+
+    def test_manage_view(self):
+        self.log_manager()
+        response = self.assertWithinQueryBudget("/manage/")
+        self.assertEqual(len(response.context["products"]), views.ManageView.paginate_by)
+        response = self.assertWithinQueryBudget(f"/manage/{response.context['product_links']['next']}")
+        self.assertWithinQueryBudget(f"/manage/{response.context['product_links']['previous']}")
+
+    def test_manage_view_sorted_pages(self):
+        self.log_manager()
+        names = []
+        url = "/manage/?product_sort=-name&product_name=produkt 1"
+        while url:
+            response = self.client.get(url)
+            names.extend(product.name for product in response.context["products"])
+            next_link = response.context["product_links"]["next"]
+            url = f"/manage/{next_link}" if next_link else None
+        expected = sorted((f"Produkt {i}" for i in range(200) if str(i).startswith("1")), reverse=True)
+        self.assertEqual(names, expected)
+
+        response = self.client.get(f"/manage/{response.context['product_links']['previous']}")
+        self.assertEqual(response.context["products"][0].name, expected[50])
+
+    def test_manage_view_sorts_are_indexed(self):
+        # Otherwise every page sorts the whole table
+        for model, sorts in ((models.Product, views.ManageView.product_sorts),
+                             (models.Category, views.ManageView.category_sorts)):
+            for sort in sorts:
+                for order in (sort, f"-{sort}"):
+                    queryset = model.objects.filter(pending_deletion=False)
+                    page = pagination.paginate_sorted(queryset, views.ManageView.paginate_by, order)
+                    with self.subTest(model=model.__name__, sort=order):
+                        self.assertNotIn("TEMP B-TREE", page.object_list.explain())
+
+    def test_manage_view_invalid_cursor(self):
+        self.log_manager()
+        for value in (["abc", 1], [[1], 1], [None, 1], [1, "x"]):
+            cursor = pagination.encode_cursor(*value)
+            response = self.client.get(f"/manage/?product_sort=documents_count&product_after={cursor}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context["products"]), views.ManageView.paginate_by)
+
+    def test_manage_view_filters(self):
+        self.log_manager()
+        response = self.client.get("/manage/?product_model=model19&category_name=kategoria 4")
+        self.assertEqual(
+            sorted(product.model for product in response.context["products"]),
+            ["MODEL19"] + [f"MODEL19{i}" for i in range(10)],
+        )
+        self.assertEqual(len(response.context["categories"]), 11)
+        self.assertIsNone(response.context["category_links"]["next"])
+        self.assertIn("product_model=model19", response.context["category_links"]["sort"]["name"])
+
+
+class TestSearch03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def test_search_ignores_diacritics(self):
+        models.Category.objects.filter(pk=1).update(name="Ogólne warunki ubezpieczenia")
+        models.Category.objects.get(pk=1).save()
+        self.assertEqual(utils.search("ogolne").count(), 6)
+        self.assertEqual(utils.search("OGÓLNE").count(), 6)
+
+        models.Product.objects.filter(pk=2).update(name="Produkt łąka")
+        models.Product.objects.get(pk=2).save()
+        self.assertEqual(utils.search("laka").count(), 6)
+
+    def test_index_follows_changes(self):
+        self.assertEqual(utils.search("zmieniony").count(), 0)
+        product = models.Product.objects.get(pk=1)
+        product.name = "Produkt zmieniony"
+        product.save()
+        self.assertEqual(utils.search("zmieniony").count(), 6)
+
+        user = User.objects.get(pk=2)
+        user.username = "nowanazwa"
+        user.save()
+        self.assertEqual(utils.search("nowanazwa").count(), 2)
+
+        models.Document.objects.get(pk=1).delete()
+        self.assertEqual(utils.search("zmieniony").count(), 5)
+        self.assertEqual(models.DocumentIndex.objects.count(), 11)
+
+    def test_unchanged_username_is_not_indexed(self):
+        user = User.objects.get(pk=2)
+        user.first_name = "Jan"
+        with mock.patch.object(search, "index_documents") as index_documents:
+            user.save()
+            user.username = "nowanazwa"
+            user.save(update_fields=["last_login"])
+        index_documents.assert_not_called()
+
+        with mock.patch.object(search, "index_documents") as index_documents:
+            user.save()
+            user.save()
+        index_documents.assert_called_once()
+
+    def test_short_phrase(self):
+        self.assertEqual(utils.search("11").first().id, 11)
+        self.assertEqual(utils.search("x").count(), 0)
+
+
 class TestManageView(ExtendedTestCase):
     def test_get(self):
         response = self.client.get("/manage/")
@@ -123,6 +392,22 @@ class TestManageView(ExtendedTestCase):
         self.assertEqual(len(response.context.get("categories")), 0)
 
 
+class TestManagerPermission(ExtendedTestCase):
+    def test_roles_are_fetched_once_per_request(self):
+        self.log_manager()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/manage/")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context.get("user_is_manager"))
+        group_queries = [query for query in queries if "auth_group" in query["sql"]]
+        self.assertEqual(len(group_queries), 1)
+
+    def test_user_is_not_manager(self):
+        self.log_user()
+        response = self.client.get("/")
+        self.assertFalse(response.context.get("user_is_manager"))
+
+
 class TestManageView02(ExtendedTestCase):
     fixtures = ["02.json"]
 
@@ -231,6 +516,13 @@ class TestEditProductView01(ExtendedTestCase):
         self.assertEqual(products.count(), 1)
         self.assertEqual(products.first().model, "TOST")
 
+        histories = models.History.objects.filter(product_id=1).order_by("element")
+        self.assertEqual(
+            list(histories.values_list("element", "changed_to")),
+            [("model przepływów pieniężnych", "TOST"), ("nazwa produktu", "Produkt tostowy")],
+        )
+        self.assertEqual(histories.first().changed_from, "TEST")
+
 
 class TestDeleteProductView01(ExtendedTestCase):
     fixtures = ["01.json"]
@@ -261,6 +553,72 @@ class TestDeleteProductView01(ExtendedTestCase):
         self.assertEqual(products.count(), 0)
 
 
+class TestDeletionInBackground03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def test_delete_product_in_batches(self):
+        self.log_manager()
+        with self.settings(DOCUMENT_DELETION_BATCH_SIZE=4):
+            response = self.client.post("/product/delete/1", follow=True)
+        self.assertEqual(response.redirect_chain[0][0], "/manage/")
+        self.assertEqual(models.Product.objects.count(), 1)
+        self.assertEqual(models.Document.objects.count(), 6)
+
+        deletion = models.Deletion.objects.get()
+        self.assertEqual(deletion.status, models.Deletion.DONE)
+        self.assertEqual(deletion.documents_total, 6)
+        self.assertEqual(deletion.documents_deleted, 6)
+
+        response = self.client.get(f"/deletion/{deletion.id}")
+        self.assertEqual(response.json()["status"], "done")
+
+    def test_pending_deletion_is_hidden(self):
+        self.log_manager()
+        self.client.get("/")
+        with self.settings(BACKGROUND_TASKS_EAGER=False):
+            with self.captureOnCommitCallbacks():
+                response = self.client.post("/category/delete/2", follow=True)
+        self.assertTrue(models.Category.objects.filter(pk=2).exists())
+        self.assertNotContains(self.client.get("/"), "#12")
+        self.assertIn("w tle", [str(message) for message in response.context["messages"]][0])
+
+        response = self.client.get("/manage/")
+        self.assertEqual(len(response.context["categories"]), 1)
+        self.assertEqual(response.context["deletions"][0].status, models.Deletion.PENDING)
+        response = self.client.get("/search/?phrase=swu")
+        self.assertEqual(response.context["no_documents"], 0)
+        self.assertEqual(self.client.get("/category/delete/2").status_code, 404)
+
+        deletion.run_deletion(models.Deletion.objects.get().id)
+        self.assertFalse(models.Category.objects.filter(pk=2).exists())
+        self.assertEqual(models.Document.objects.count(), 6)
+        self.assertEqual(models.Deletion.objects.get().status, models.Deletion.DONE)
+
+    def test_pending_deletion_is_not_downloaded(self):
+        self.log_manager()
+        with self.settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=False):
+            with self.captureOnCommitCallbacks():
+                self.client.post("/category/delete/2")
+        document = models.Document.objects.filter(category_id=2).first()
+        self.assertEqual(self.client.get(f"/download/{document.id}").status_code, 404)
+
+    def test_batches_are_loaded_one_at_a_time(self):
+        with self.settings(DOCUMENT_DELETION_BATCH_SIZE=4), CaptureQueriesContext(connection) as queries:
+            deletion.delete_documents(models.Document.objects.filter(product_id=1))
+        self.assertFalse(models.Document.objects.filter(product_id=1).exists())
+        selects = [query["sql"] for query in queries
+                   if query["sql"].startswith('SELECT "document_document"."id", "document_document"."file" ')]
+        self.assertTrue(selects)
+        self.assertTrue(all("LIMIT 4" in sql for sql in selects))
+
+    def test_file_deletion_is_retried(self):
+        with self.settings(DOCUMENT_DELETION_FILE_ATTEMPTS=2), \
+                mock.patch("document.deletion.time.sleep"), \
+                mock.patch("document.deletion.default_storage.delete", side_effect=[OSError, None]) as delete:
+            self.assertTrue(deletion.delete_file("file1.pdf"))
+        self.assertEqual(delete.call_count, 2)
+
+
 class TestAddCategoryView(ExtendedTestCase):
     def test_get(self):
         response = self.client.get("/category/add")
@@ -317,6 +675,10 @@ class TestEditCategoryView01(ExtendedTestCase):
         self.assertEqual(categories.count(), 1)
         self.assertEqual(categories.first().name, "UFO")
 
+        history = models.History.objects.get(category_id=1)
+        self.assertEqual(history.element, "nazwa kategorii")
+        self.assertEqual((history.changed_from, history.changed_to), ("OWU", "UFO"))
+
 
 class TestDeleteCategoryView01(ExtendedTestCase):
     fixtures = ["01.json"]
@@ -429,6 +791,1261 @@ class TestAddDocumentView01(ExtendedTestCase):
         self.assertEqual(models.Document.objects.count(), 5)
 
 
+class TestContentAddressedStorage01(ExtendedTestCase):
+    fixtures = ["01.json"]
+
+    def post_document(self, filename, validity_start):
+        data = {
+            "product": "1",
+            "category": "1",
+            "validity_start": validity_start,
+            "file": SimpleUploadedFile(filename, b"identical content", content_type="pdf")
+        }
+        return self.client.post("/document/add", data, follow=True)
+
+    def test_identical_files_are_stored_once(self):
+        self.log_manager()
+        self.post_document("owu_a.pdf", "2022-02-01")
+        response = self.post_document("owu_b.pdf", "2022-02-02")
+        document_a = models.Document.objects.get(file="owu_a.pdf")
+        document_b = models.Document.objects.get(file="owu_b.pdf")
+        message = [str(message) for message in response.context["messages"]][0]
+        self.assertIn(f"dokument #{document_a.id}", message)
+
+        self.assertEqual(models.Blob.objects.count(), 1)
+        blob = models.Blob.objects.get()
+        self.assertEqual(blob.references, 2)
+        path = document_a.file.path
+        self.assertEqual(path, document_b.file.path)
+        with document_b.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"identical content")
+
+        document_a.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(models.Blob.objects.get().references, 1)
+
+        document_b.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(models.Blob.objects.count(), 0)
+
+    def test_deleting_product_releases_files(self):
+        self.log_manager()
+        self.post_document("owu_a.pdf", "2022-02-01")
+        path = models.Document.objects.get(file="owu_a.pdf").file.path
+        self.assertTrue(os.path.exists(path))
+
+        self.client.post("/product/delete/1")
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(models.StoredFile.objects.count(), 0)
+
+
+class TestCompressedStorage01(ExtendedTestCase):
+    fixtures = ["01.json"]
+    content = "Ochrona: ryzyko wypadku, ryzyko choroby.\n".encode() * 500
+
+    def add_document(self):
+        self.log_manager()
+        data = {
+            "product": "1",
+            "category": "1",
+            "validity_start": "2022-02-01",
+            "file": SimpleUploadedFile("owu_skompresowany.txt", self.content, content_type="text/plain"),
+        }
+        # Uncompressed file is removed after the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/document/add", data)
+        document = models.Document.objects.get(file="owu_skompresowany.txt")
+        self.addCleanup(document.file.delete)
+        return document
+
+    def test_text_heavy_file_is_compressed(self):
+        document = self.add_document()
+        blob = models.Blob.objects.get()
+        self.assertEqual((blob.codec, blob.size), ("gzip", len(self.content)))
+        self.assertLess(blob.stored_size, len(self.content) / 10)
+        self.assertEqual(os.path.getsize(document.file.path), blob.stored_size)
+        self.assertEqual(document.file.size, len(self.content))
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertEqual(list(utils.search("ryzyko choroby")), [document])
+
+    def test_download(self):
+        document = self.add_document()
+        response = self.client.get(f"/download/{document.id}")
+        self.assertNotIn("Content-Encoding", response)
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get(f"/download/{document.id}", HTTP_ACCEPT_ENCODING="br, gzip;q=0.8")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        body = b"".join(response.streaming_content)
+        self.assertEqual(response["Content-Length"], str(len(body)))
+        self.assertEqual(gzip.decompress(body), self.content)
+
+        response = self.client.get(f"/download/{document.id}", HTTP_ACCEPT_ENCODING="gzip;q=0", HTTP_RANGE="bytes=9-14")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), b"ryzyko")
+
+    def test_download_ranges_out_of_order(self):
+        document = self.add_document()
+        response = self.client.get(f"/download/{document.id}", HTTP_RANGE="bytes=500-505,9-14,12-20,-2")
+        self.assertEqual(response.status_code, 206)
+        body = b"".join(response.streaming_content)
+        self.assertEqual(response["Content-Length"], str(len(body)))
+        # Decompressed content is read forwards only, so the ranges are sorted and merged
+        parts = [part.split(b"\r\n\r\n", 1) for part in body.split(b"\r\n--")[:-1]]
+        self.assertEqual(
+            [(header.split(b"Content-Range: ")[1], content) for header, content in parts],
+            [
+                (b"bytes 9-20/20500", self.content[9:21]),
+                (b"bytes 500-505/20500", self.content[500:506]),
+                (b"bytes 20498-20499/20500", self.content[-2:]),
+            ],
+        )
+
+    def test_merge_ranges(self):
+        self.assertEqual(
+            downloads.merge_ranges([(50, 60), (0, 9), (10, 20), (55, 70), (100, 100)]),
+            [(0, 20), (50, 70), (100, 100)],
+        )
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=False)
+    def test_file_is_compressed_by_job(self):
+        document = self.add_document()
+        blob = models.Blob.objects.get()
+        self.assertEqual(blob.codec, "")
+        self.assertEqual(os.path.getsize(document.file.path), len(self.content))
+        job = models.Job.objects.get(name="document.storage.compress_blob")
+        self.assertEqual(job.priority, jobs.LOW)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.work(once=True)
+        self.assertEqual(models.Blob.objects.get().codec, "gzip")
+        self.assertFalse(os.path.exists(default_storage.blob_path(blob.digest)))
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+
+    def test_compress_files_command(self):
+        with self.settings(DOCUMENT_COMPRESSION=""):
+            document = self.add_document()
+        self.assertEqual(models.Blob.objects.get().codec, "")
+
+        digest = models.Blob.objects.get().digest
+        stdout = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("compress_files", codec="gzip", workers=0, stdout=stdout)
+        self.assertIn("Compressed 1 files", stdout.getvalue())
+        self.assertEqual(models.Blob.objects.get().codec, "gzip")
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+        # Uncompressed file is removed after the commit
+        self.assertEqual(document.file.path, default_storage.blob_path(digest, "gzip"))
+        self.assertFalse(os.path.exists(default_storage.blob_path(digest)))
+
+    def test_file_response_queries(self):
+        document = self.add_document()
+        with self.assertNumQueries(1):
+            response = downloads.file_response(RequestFactory().get("/"), document.file)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+
+    def test_missing_compressed_file_is_stored_again(self):
+        document = self.add_document()
+        os.remove(document.file.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.save("kopia.txt", io.BytesIO(self.content))
+        self.addCleanup(default_storage.delete, "kopia.txt")
+        # Stored as it is and compressed again
+        self.assertEqual(models.Blob.objects.get().references, 2)
+        self.assertTrue(os.path.exists(document.file.path))
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+
+    def test_switch_codec_of_deleted_blob(self):
+        with self.settings(DOCUMENT_COMPRESSION=""):
+            document = self.add_document()
+        digest = models.Blob.objects.get().digest
+        fd, compressed_path = tempfile.mkstemp(dir=default_storage.temporary_dir())
+        os.close(fd)
+        document.file.delete(save=False)
+
+        self.assertFalse(default_storage.switch_codec(digest, "gzip", compressed_path, 10))
+        self.assertFalse(os.path.exists(compressed_path))
+        self.assertFalse(os.path.exists(default_storage.blob_path(digest, "gzip")))
+
+
+class TestChunkedUpload01(ExtendedTestCase):
+    fixtures = ["01.json"]
+    content = b"".join(f"wiersz {i}\n".encode() for i in range(3000))
+
+    def setUp(self):
+        super().setUp()
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir)
+        upload_settings = self.settings(DOCUMENT_UPLOAD_DIR=upload_dir, DOCUMENT_UPLOAD_CHUNK_SIZE=10000)
+        upload_settings.enable()
+        self.addCleanup(upload_settings.disable)
+        self.log_manager()
+
+    def start_upload(self, name="model_aktuarialny.txt"):
+        response = self.client.post("/upload/", {
+            "name": name, "size": len(self.content), "sha256": hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def put_chunk(self, url, offset, chunk, **headers):
+        return self.client.put(f"{url}?offset={offset}", chunk, content_type="application/octet-stream", **headers)
+
+    def upload(self):
+        status = self.start_upload()
+        for offset in range(0, len(self.content), status["chunk_size"]):
+            self.put_chunk(status["url"], offset, self.content[offset:offset + status["chunk_size"]])
+        return status
+
+    def test_chunks(self):
+        status = self.start_upload()
+        self.assertEqual((status["received"], status["chunk_size"]), (0, 10000))
+        url = status["url"]
+
+        chunk = self.content[10000:20000]
+        response = self.put_chunk(url, 10000, chunk, HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(response.json()["received"], 0)
+        response = self.put_chunk(url, 0, self.content[:10000])
+        self.assertEqual(response.json()["received"], 20000)
+        # Retried chunk changes nothing
+        response = self.put_chunk(url, 0, self.content[:10000])
+        self.assertEqual(response.json()["received"], 20000)
+
+        response = self.put_chunk(url, 20000, self.content[20000:30000], HTTP_X_CHUNK_SHA256="0" * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).json()["received"], 20000)
+        self.assertEqual(self.put_chunk(url, len(self.content) - 5, b"0123456789").status_code, 416)
+        self.assertEqual(self.put_chunk(url, 20000, self.content[20000:40001]).status_code, 413)
+
+        self.log_user()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_rejected_retry_keeps_received_data(self):
+        status = self.start_upload()
+        self.put_chunk(status["url"], 0, self.content[:10000])
+        response = self.put_chunk(status["url"], 0, b"X" * 10000, HTTP_X_CHUNK_SHA256="0" * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(status["url"]).json()["received"], 10000)
+        with open(os.path.join(settings.DOCUMENT_UPLOAD_DIR, status["id"]), "rb") as fh:
+            self.assertEqual(fh.read(10000), self.content[:10000])
+
+    def test_whole_file_digest(self):
+        response = self.client.post("/upload/", {
+            "name": "model_aktuarialny.txt", "size": len(self.content), "sha256": "0" * 64,
+        })
+        status = response.json()
+        for offset in range(0, len(self.content), status["chunk_size"]):
+            self.put_chunk(status["url"], offset, self.content[offset:offset + status["chunk_size"]])
+        data = {"product": "1", "category": "1", "validity_start": "2023-01-01", "upload": status["id"]}
+        response = self.client.post("/document/add", data)
+        self.assertIn("Przesłany plik jest uszkodzony. Wybierz go ponownie.", response.context["form"].errors["file"])
+
+        # Chunk changed on the disk after it was received
+        status = self.upload()
+        with open(os.path.join(settings.DOCUMENT_UPLOAD_DIR, status["id"]), "r+b") as fh:
+            fh.write(b"X")
+        data["upload"] = status["id"]
+        response = self.client.post("/document/add", data)
+        self.assertIn("Przesłany plik jest uszkodzony. Wybierz go ponownie.", response.context["form"].errors["file"])
+
+    def test_finalize_with_document_form(self):
+        status = self.upload()
+        data = {"product": "1", "category": "1", "validity_start": "2023-01-01", "upload": status["id"]}
+        response = self.client.post("/document/add", data)
+        self.assertEqual(response.url, "/")
+
+        document = models.Document.objects.get(file="model_aktuarialny.txt")
+        self.addCleanup(document.file.delete)
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertEqual(models.Upload.objects.count(), 0)
+        self.assertEqual(os.listdir(settings.DOCUMENT_UPLOAD_DIR), [])
+        self.assertEqual(list(utils.search("wiersz 2999")), [document])
+
+    def test_edit_with_upload(self):
+        status = self.upload()
+        data = {"product": "1", "category": "1", "validity_start": "2022-01-01", "upload": status["id"]}
+        response = self.client.post("/document/edit/1", data)
+        self.assertEqual(response.url, "/document/1")
+        document = models.Document.objects.get(id=1)
+        self.addCleanup(document.file.delete)
+        self.assertEqual(document.file.name, "model_aktuarialny.txt")
+        self.assertEqual(document.history_set.get().changed_to, "model_aktuarialny.txt")
+
+    def test_upload_is_read_once(self):
+        status = self.upload()
+        path = os.path.join(settings.DOCUMENT_UPLOAD_DIR, status["id"])
+        data = {"product": "1", "category": "1", "validity_start": "2023-01-01", "upload": status["id"]}
+        with mock.patch.object(uploads, "open", wraps=open, create=True) as opened:
+            # Invalid forms do not read the file
+            response = self.client.post("/document/add", {**data, "product": "999"})
+            self.assertIn("product", response.context["form"].errors)
+            self.assertFalse(opened.called)
+
+            self.client.post("/document/add", data)
+        opened.assert_called_once_with(path, "rb")
+        document = models.Document.objects.get(file="model_aktuarialny.txt")
+        self.addCleanup(document.file.delete)
+        self.assertEqual(models.Blob.objects.get(digest=hashlib.sha256(self.content).hexdigest()).references, 1)
+
+    def test_damaged_upload_keeps_edited_file(self):
+        status = self.upload()
+        with open(os.path.join(settings.DOCUMENT_UPLOAD_DIR, status["id"]), "r+b") as fh:
+            fh.write(b"X")
+        data = {"product": "1", "category": "1", "validity_start": "2022-01-01", "upload": status["id"]}
+        with mock.patch.object(default_storage, "delete") as delete:
+            response = self.client.post("/document/edit/1", data)
+        self.assertIn("Przesłany plik jest uszkodzony. Wybierz go ponownie.", response.context["form"].errors["file"])
+        delete.assert_not_called()
+        self.assertNotEqual(models.Document.objects.get(id=1).file.name, "model_aktuarialny.txt")
+        self.assertEqual(models.Upload.objects.count(), 1)
+
+    def test_concurrent_retry_of_chunk(self):
+        status = self.start_upload()
+        upload = models.Upload.objects.get()
+        copyfileobj = shutil.copyfileobj
+
+        def copy_after_retry(*args):
+            # The retry saves the chunk while the original request writes it
+            models.UploadChunk.objects.create(upload=upload, offset=0, size=10000, sha256="0" * 64)
+            return copyfileobj(*args)
+
+        with mock.patch.object(uploads.shutil, "copyfileobj", side_effect=copy_after_retry):
+            response = self.put_chunk(status["url"], 0, self.content[:10000])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.UploadChunk.objects.get().sha256, hashlib.sha256(self.content[:10000]).hexdigest())
+
+    def test_unfinished_upload_is_rejected(self):
+        status = self.start_upload()
+        self.put_chunk(status["url"], 0, self.content[:10000])
+        data = {"product": "1", "category": "1", "validity_start": "2023-01-01", "upload": status["id"]}
+        response = self.client.post("/document/add", data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Przesyłanie pliku nie zostało ukończone.", response.context["form"].errors["file"])
+        self.assertContains(response, f'value="{status["id"]}"')
+
+        models.Upload.objects.update(created_at=timezone.now() - datetime.timedelta(days=2))
+        stdout = io.StringIO()
+        call_command("clear_uploads", stdout=stdout)
+        self.assertIn("Removed 1 unfinished uploads.", stdout.getvalue())
+        self.assertEqual(os.listdir(settings.DOCUMENT_UPLOAD_DIR), [])
+
+
+class TestExport01(ExtendedTestCase):
+    fixtures = ["01.json"]
+    text = "Ogólne warunki ubezpieczenia\n".encode() * 1000
+
+    def setUp(self):
+        super().setUp()
+        self.log_manager()
+        self.add_document("owu_eksport.txt", self.text, "2023-01-01")
+        self.add_document("owu_eksport.docx", make_docx(["Ogólne warunki"]), "2023-02-01")
+
+    def add_document(self, name, content, validity_start):
+        data = {
+            "product": "1",
+            "category": "1",
+            "validity_start": validity_start,
+            "file": SimpleUploadedFile(name, content),
+        }
+        self.client.post("/document/add", data)
+        self.addCleanup(models.Document.objects.get(file=name).file.delete)
+
+    def test_export_product(self):
+        response = self.client.get("/export/?product=1")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertTrue(response["Content-Disposition"].startswith('attachment; filename="archowum_'))
+
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), ["owu_eksport.txt", "owu_eksport.docx", "metadane.csv"])
+            self.assertEqual(archive.read("owu_eksport.txt"), self.text)
+            self.assertEqual(archive.getinfo("owu_eksport.txt").compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(archive.getinfo("owu_eksport.docx").compress_type, zipfile.ZIP_STORED)
+            rows = list(csv.reader(io.StringIO(archive.read("metadane.csv").decode("utf-8-sig")), delimiter=";"))
+
+        documents = models.Document.objects.filter(product=1)
+        self.assertEqual(rows[0][:3], ["id", "produkt", "model"])
+        self.assertEqual([int(row[0]) for row in rows[1:]], sorted(documents.values_list("id", flat=True)))
+        self.assertEqual(rows[-2][5:8], ["owu_eksport.txt", str(len(self.text)), hashlib.sha256(self.text).hexdigest()])
+        self.assertEqual(rows[1][6], "brak pliku")
+
+    def test_export_reads_documents_while_streaming(self):
+        documents = models.Document.objects.filter(product=1)
+        lookup = '"document_storedfile"."name" IN'
+        with mock.patch.object(export, "BATCH_SIZE", 1):
+            entries = export.collect(documents)
+            with CaptureQueriesContext(connection) as queries:
+                next(entries)
+            self.assertEqual(sum(lookup in query["sql"] for query in queries), 1)
+            with CaptureQueriesContext(connection) as queries:
+                rest = list(entries)
+            self.assertEqual(sum(lookup in query["sql"] for query in queries), len(rest))
+        self.assertEqual(len(rest), documents.count() - 1)
+
+    def test_export_requires_selection(self):
+        self.assertEqual(self.client.get("/export/").status_code, 400)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "eksport.zip")
+        stderr = io.StringIO()
+        call_command("export_documents", path, phrase="eksport", stderr=stderr)
+        self.assertIn("Exported 2 documents (0 missing files).", stderr.getvalue())
+        with zipfile.ZipFile(path) as archive:
+            self.assertEqual(archive.read("owu_eksport.txt"), self.text)
+
+
+class TestApi03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def setUp(self):
+        super().setUp()
+        self.log_user()
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get("/api/documents/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_pages(self):
+        ids = []
+        url = "/api/documents/?limit=3"
+        while url:
+            data = self.assertWithinQueryBudget(url).json()
+            self.assertLessEqual(len(data["results"]), 3)
+            ids += [document["id"] for document in data["results"]]
+            url = data["next"]
+        self.assertEqual(ids, list(models.Document.objects.order_by("id").values_list("id", flat=True)))
+
+        data = self.client.get("/api/documents/?limit=3&sort=-updated_at").json()
+        previous = self.client.get(self.client.get(data["next"]).json()["previous"]).json()
+        self.assertEqual(previous["results"], data["results"])
+
+    def test_fields(self):
+        data = self.client.get("/api/products/?fields=id,name").json()
+        self.assertEqual(data["results"][0], {"id": 1, "name": "Produkt alamakota"})
+
+        document = self.client.get("/api/documents/1?fields=file,url").json()
+        self.assertEqual(document, {"file": "file1.pdf", "url": "/download/1"})
+
+        response = self.client.get("/api/categories/?fields=id,secret")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["error"])
+
+    def test_invalid_parameters(self):
+        response = self.client.get("/api/documents/?sort=name")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("updated_at", response.json()["error"])
+        for sort in ("id", "updated_at"):
+            for value in (["abc", 1], [[1], 1]):
+                cursor = pagination.encode_cursor(*value)
+                response = self.client.get(f"/api/documents/?sort={sort}&after={cursor}")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "Nieprawidłowy kursor strony."})
+        response = self.client.get("/api/documents/?before=nie-kursor")
+        self.assertEqual(response.status_code, 400)
+
+    def test_updated_since(self):
+        since = timezone.now()
+        models.Product.objects.get(id=2).save()
+        data = self.client.get("/api/products/", {"updated_since": since.isoformat()}).json()
+        self.assertEqual([product["id"] for product in data["results"]], [2])
+
+        response = self.client.get("/api/products/?updated_since=wczoraj")
+        self.assertEqual(response.status_code, 400)
+
+        models.History.objects.create(document_id=1, element="plik", changed_from="a.pdf", changed_to="b.pdf",
+                                      changed_by_id=1)
+        data = self.client.get("/api/history/", {"updated_since": since.isoformat(), "fields": "element"}).json()
+        self.assertEqual(data["results"], [{"element": "plik"}])
+
+    def test_not_modified(self):
+        response = self.client.get("/api/categories/")
+        etag = response["ETag"]
+        response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        models.Category.objects.filter(id=1).update(name="Ogólne warunki")
+        response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class TestTypeahead03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def setUp(self):
+        # Each test builds the index from its own data
+        patcher = mock.patch.object(typeahead, "_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_suggest(self):
+        self.log_user()
+        typeahead.get_index()
+        response = self.assertWithinQueryBudget("/suggest/?q=ALA")
+        self.assertEqual(response.json()["suggestions"], [
+            {"kind": "model", "label": "ALA123 – Produkt alamakota", "phrase": "ALA123"},
+            {"kind": "product", "label": "Produkt alamakota", "phrase": "Produkt alamakota"},
+        ])
+        response = self.client.get("/suggest/?q=produkt")
+        self.assertEqual([suggestion["phrase"] for suggestion in response.json()["suggestions"]],
+                         ["Produkt alamakota", "Produkt bartekmapsa"])
+        response = self.client.get("/suggest/?q=")
+        self.assertEqual(response.json()["suggestions"], [])
+
+    def test_update_on_save(self):
+        typeahead.get_index()
+        product = models.Product.objects.get(id=2)
+        product.name = "Produkt łąka"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        with self.assertNumQueries(0):
+            suggestions = typeahead.suggest("laka")
+        self.assertEqual([suggestion["label"] for suggestion in suggestions], ["Produkt łąka"])
+        self.assertEqual(typeahead.suggest("bartek"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Category.objects.get(id=2).delete()
+        self.assertEqual(typeahead.suggest("swu"), [])
+
+    @override_settings(TYPEAHEAD_CHECK_INTERVAL=0)
+    def test_changes_of_other_process(self):
+        index = typeahead.get_index()
+        with self.assertNumQueries(2):
+            self.assertIs(typeahead.get_index(), index)
+
+        # Another process changed the data, only the changed rows are read
+        models.Category.objects.filter(id=1).update(name="Karta produktu", updated_at=timezone.now())
+        with self.assertNumQueries(4):
+            suggestions = typeahead.suggest("kar")
+        self.assertEqual([suggestion["label"] for suggestion in suggestions], ["Karta produktu"])
+
+        # Deleted rows are found by their number
+        models.Category.objects.filter(id=1).delete()
+        self.assertEqual(typeahead.suggest("kar"), [])
+
+    def test_checks_are_throttled(self):
+        typeahead.get_index()
+        models.Category.objects.filter(id=1).update(name="Karta produktu", updated_at=timezone.now())
+        with self.assertNumQueries(0):
+            self.assertEqual(typeahead.suggest("kar"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            typeahead.invalidate()
+        self.assertEqual([suggestion["label"] for suggestion in typeahead.suggest("kar")], ["Karta produktu"])
+
+    def test_ranking(self):
+        products = [models.Product(id=i, name=f"Polisa ala{i:03}", model="X") for i in range(150)]
+        products.append(models.Product(id=150, name="Alaz", model="X"))
+        index = typeahead.PrefixIndex([], set(), {}).replace(
+            {typeahead.get_source(product): typeahead.get_entries(product) for product in products}
+        )
+        # Start of the text is ranked first, although there are many keys before it
+        self.assertEqual([suggestion["label"] for suggestion in index.search("ala", 3)],
+                         ["Alaz", "Polisa ala000", "Polisa ala001"])
+
+    def test_short_prefix_reads_only_needed_keys(self):
+        class CountedList(list):
+            reads = 0
+
+            def __getitem__(self, index):
+                CountedList.reads += len(range(*index.indices(len(self)))) if isinstance(index, slice) else 1
+                return super().__getitem__(index)
+
+        products = [models.Product(id=i, name=f"Polisa {i:05}", model=f"P{i:05}") for i in range(5000)]
+        index = typeahead.PrefixIndex([], set(), {}).replace(
+            {typeahead.get_source(product): typeahead.get_entries(product) for product in products}
+        )
+        index.ranks = [(CountedList(keys), CountedList(entries)) for keys, entries in index.ranks]
+        suggestions = index.search("p", 10)
+        self.assertEqual([suggestion["phrase"] for suggestion in suggestions], [f"P{i:05}" for i in range(10)])
+        # Binary search and the keys of the suggestions, not all the 10000 matching keys
+        self.assertLess(CountedList.reads, 100)
+
+    @override_settings(TYPEAHEAD_CHECK_INTERVAL=0)
+    def test_versions_check_within_budget(self):
+        self.log_user()
+        typeahead.get_index()
+        self.assertWithinQueryBudget("/suggest/?q=ala")
+
+    def test_hidden_while_deleted(self):
+        typeahead.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            deletion.start_deletion(models.Category.objects.get(id=2), User.objects.get(id=1))
+        self.assertEqual(typeahead.suggest("swu"), [])
+
+
+class TestBulkEdit03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def test_get(self):
+        self.log_user()
+        response = self.client.get("/document/bulk-edit")
+        self.assertEqual(response.status_code, 403)
+
+        self.log_manager()
+        response = self.assertWithinQueryBudget("/document/bulk-edit?phrase=ala")
+        self.assertEqual(response.context["form"].initial["phrase"], "ala")
+
+    def test_post(self):
+        self.log_manager()
+        data = {"product": "1", "field": "category", "new_category": "2"}
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post("/document/bulk-edit", data)
+        self.assertEqual(response.url, "/")
+        queries = [query["sql"] for query in context.captured_queries]
+        updates = [sql for sql in queries if sql.startswith("UPDATE \"document_document\"")]
+        inserts = [sql for sql in queries if sql.startswith("INSERT INTO \"document_history\"")]
+        self.assertEqual((len(updates), len(inserts)), (1, 1))
+
+        self.assertEqual(models.Document.objects.filter(product_id=1, category_id=2).count(), 6)
+        histories = models.History.objects.order_by("document_id")
+        self.assertEqual(list(histories.values_list("document_id", flat=True)), [1, 3, 5])
+        self.assertEqual((histories[0].element, histories[0].changed_from, histories[0].changed_to), (
+            "kategoria dokumentu", "OWU", "SWU"
+        ))
+        indexed = models.DocumentIndex.objects.filter(content__contains="swu").values_list("document", flat=True)
+        self.assertIn(1, indexed)
+
+    def test_post_requires_selection(self):
+        self.log_manager()
+        response = self.client.post("/document/bulk-edit", {"field": "category", "new_category": "2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["form"].non_field_errors())
+        self.assertEqual(models.Document.objects.filter(category_id=2).count(), 6)
+
+    def test_post_conflict(self):
+        self.log_manager()
+        data = {"product": "2", "category": "2", "field": "validity_start", "new_validity_start": "2023-01-01"}
+        response = self.client.post("/document/bulk-edit", data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("#8", response.context["form"].non_field_errors()[0])
+        self.assertFalse(models.Document.objects.filter(validity_start=datetime.date(2023, 1, 1)).exists())
+        self.assertEqual(models.History.objects.count(), 0)
+
+    def test_conflict_with_other_document(self):
+        documents = models.Document.objects.filter(id=8)
+        with self.assertRaises(bulk_edit.ConflictError) as context:
+            bulk_edit.edit_documents(documents, "validity_start", datetime.date(2022, 1, 10), User.objects.get(id=1))
+        self.assertEqual(context.exception.ids, [8, 10])
+
+    def test_command(self):
+        stdout = io.StringIO()
+        call_command("bulk_edit", "product", "1", category=2, user="test_user1", stdout=stdout)
+        self.assertIn("Changed 3 documents.", stdout.getvalue())
+        self.assertEqual(models.Document.objects.filter(product_id=1).count(), 9)
+        self.assertEqual(models.History.objects.filter(element="produkt").count(), 3)
+
+    def test_command_invalid_id(self):
+        with self.assertRaisesMessage(CommandError, "Invalid id abc."):
+            call_command("bulk_edit", "product", "abc", category=2, user="test_user1", stdout=io.StringIO())
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class TestDocumentCounters03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def assertCounts(self, products, categories):
+        for model, counts in ((models.Product, products), (models.Category, categories)):
+            self.assertEqual(list(model.objects.order_by("id").values_list("documents_count", flat=True)), counts)
+
+    def test_single_documents(self):
+        self.assertCounts([6, 6], [6, 6])
+        document = models.Document.objects.create(
+            product_id=1, category_id=1, validity_start=datetime.date(2023, 1, 1), created_by_id=1
+        )
+        self.assertCounts([7, 6], [7, 6])
+
+        document = models.Document.objects.get(id=document.id)
+        document.product_id = 2
+        document.save()
+        self.assertCounts([6, 7], [7, 6])
+
+        models.Document.objects.get(id=1).delete()
+        self.assertCounts([5, 7], [6, 6])
+        self.assertEqual(models.Product.objects.get(id=2).number_of_documents(), 7)
+
+    def test_bulk_paths(self):
+        user = User.objects.get(id=1)
+        product = models.Product.objects.get(id=1)
+        bulk_edit.edit_documents(models.Document.objects.filter(category_id=2), "product", product, user)
+        self.assertCounts([9, 3], [6, 6])
+
+        deletion.start_deletion(models.Category.objects.get(id=2), user)
+        self.assertCounts([3, 3], [6])
+
+        models.Document.objects.filter(id=1).update(product_id=2)
+        stdout = io.StringIO()
+        call_command("recount_documents", stdout=stdout)
+        self.assertIn("Fixed numbers of documents of 2 products.", stdout.getvalue())
+        self.assertCounts([2, 4], [6])
+
+    def test_drifted_count(self):
+        models.Product.objects.filter(id=1).update(documents_count=0)
+        models.Document.objects.get(id=1).delete()
+        self.assertCounts([-1, 6], [5, 6])
+
+        call_command("recount_documents", stdout=io.StringIO())
+        self.assertCounts([5, 6], [5, 6])
+
+
+def make_pdf(text):
+    stream = zlib.compress(f"BT /F1 12 Tf 72 712 Td ({text}) Tj ET".encode("latin-1"))
+    header = f"%PDF-1.4\n1 0 obj << /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+    return header + stream + b"\nendstream\nendobj\n%%EOF\n"
+
+
+def make_docx(paragraphs):
+    body = "".join(f"<w:p><w:r><w:t>{paragraph}</w:t></w:r></w:p>" for paragraph in paragraphs)
+    xml = (
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", xml)
+    return buffer.getvalue()
+
+
+class TestTextExtraction01(ExtendedTestCase):
+    fixtures = ["01.json"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as fh:
+            fh.write(content)
+        return path
+
+    def test_formats(self):
+        pdf = self.write("owu.pdf", make_pdf(r"Ryzyko wypadku \(art. 5\)"))
+        with mock.patch.object(extract, "pypdf", None):
+            self.assertEqual(extract.extract((pdf, "", "owu.pdf", 1000)), ("Ryzyko wypadku (art. 5)", ""))
+
+        docx = self.write("owu.docx", make_docx(["Ogólne warunki", "ryzyko wypadku"]))
+        self.assertEqual(extract.extract((docx, "", "owu.docx", 1000)), ("Ogólne warunki\nryzyko wypadku\n", ""))
+
+        text = self.write("owu.txt", "Zażółć gęślą jaźń".encode("cp1250"))
+        self.assertEqual(extract.extract((text, "", "owu.txt", 6)), ("Zażółć", ""))
+
+        image = self.write("owu.png", b"\x89PNG")
+        self.assertEqual(extract.extract((image, "", "owu.png", 1000)), ("", "unsupported format"))
+        self.assertIn("FileNotFoundError", extract.extract(("missing.pdf", "", "missing.pdf", 1000))[1])
+
+    def test_extracted_text_is_searchable(self):
+        self.log_manager()
+        data = {
+            "product": "1",
+            "category": "1",
+            "validity_start": "2023-01-01",
+            "file": SimpleUploadedFile("owu_wypadek.txt", b"Ochrona: ryzyko wypadku", content_type="text/plain"),
+        }
+        self.client.post("/document/add", data)
+        document = models.Document.objects.get(file="owu_wypadek.txt")
+        self.assertEqual(document.content.text, "Ochrona: ryzyko wypadku")
+        self.assertEqual(list(utils.search("RYZYKO WYPADKU")), [document])
+
+        # Re-uploaded file keeps its name, but its text is extracted again
+        data.update(file=SimpleUploadedFile("owu_wypadek.txt", b"ryzyko choroby", content_type="text/plain"))
+        self.client.post(f"/document/edit/{document.id}", data)
+        self.assertFalse(utils.search("ryzyko wypadku").exists())
+        self.assertEqual(list(utils.search("ryzyko choroby")), [document])
+        models.Document.objects.get(id=document.id).delete()
+
+    def test_backfill_command(self):
+        with open("media/file1.pdf", "wb") as fh:
+            fh.write(make_pdf("suma ubezpieczenia"))
+        self.addCleanup(os.remove, "media/file1.pdf")
+        models.DocumentContent.objects.all().delete()
+
+        stdout = io.StringIO()
+        call_command("extract_documents", workers=0, stdout=stdout)
+        self.assertIn("Extracted text of 1 documents, 4 failed or unsupported.", stdout.getvalue())
+        self.assertEqual(list(utils.search("suma ubezpieczenia").values_list("id", flat=True)), [1])
+        self.assertFalse(extraction.outdated_documents().exists())
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_process_pool(self):
+        items = [(self.write(f"{i}.txt", f"tekst {i}".encode()), "", f"{i}.txt", 100) for i in range(3)]
+        results = tasks.map_in_processes(extract.extract, items, 2)
+        self.assertEqual(results, [(f"tekst {i}", "") for i in range(3)])
+        # Processes are kept for the next call
+        pool = tasks.get_process_pool(2)
+        self.assertEqual(tasks.map_in_processes(extract.extract, items[:1], 2), [("tekst 0", "")])
+        self.assertIs(tasks.get_process_pool(2), pool)
+
+    def test_text_is_read_up_to_max_chars(self):
+        path = self.write("dlugi.txt", "zażółć\n".encode() * 50000)
+        with mock.patch.object(extract, "CHUNK_SIZE", 1000):
+            text = extract.extract_text(path, "dlugi.txt", max_chars=100)
+        # Only the first chunk is decoded
+        self.assertLess(len(text), 1000)
+        self.assertTrue(text.startswith("zażółć\n" * 14))
+        self.assertEqual(extract.extract((path, "", "dlugi.txt", 100)), ("zażółć\n" * 14 + "za", ""))
+
+    def test_pdf_is_read_in_chunks(self):
+        path = self.write("owu.pdf", make_pdf("suma ubezpieczenia"))
+        with mock.patch.object(extract, "CHUNK_SIZE", 16), mock.patch.object(extract, "pypdf", None):
+            self.assertEqual(extract.extract_text(path, "owu.pdf"), "suma ubezpieczenia")
+
+
+job_calls = []
+
+
+def record_job(value):
+    job_calls.append(value)
+
+
+def heartbeat_job():
+    jobs.heartbeat()
+    job_calls.append(jobs.requeue_stale(timeout=3600))
+
+
+def failing_job(value):
+    raise ValueError(value)
+
+
+class TestJobs03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def setUp(self):
+        super().setUp()
+        job_calls.clear()
+
+    def test_priority_order(self):
+        jobs.enqueue(record_job, "low", priority=jobs.LOW)
+        jobs.enqueue(record_job, "normal")
+        jobs.enqueue(record_job, "high", priority=jobs.HIGH)
+        jobs.enqueue(record_job, "later", priority=jobs.HIGH, delay=60)
+        self.assertEqual(jobs.work(once=True), 3)
+        self.assertEqual(job_calls, ["high", "normal", "low"])
+        self.assertEqual(models.Job.objects.filter(status=models.Job.DONE).count(), 3)
+        self.assertEqual(models.Job.objects.get(status=models.Job.QUEUED).args, ["later"])
+
+    @override_settings(JOBS_BACKOFF_SECONDS=10)
+    def test_retry_with_backoff(self):
+        job = jobs.enqueue(failing_job, "awaria", max_attempts=2)
+        self.assertFalse(jobs.run_job(jobs.claim_job()))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (models.Job.QUEUED, 1, "ValueError: awaria"))
+        self.assertGreater(job.run_after, job.started_at + datetime.timedelta(seconds=9))
+        self.assertIsNone(jobs.claim_job())
+
+        models.Job.objects.update(run_after=job.started_at)
+        self.assertEqual(jobs.work(once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.Job.FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_requeue_stale(self):
+        job = jobs.enqueue(record_job, "x")
+        jobs.claim_job()
+        self.assertEqual(jobs.requeue_stale(timeout=3600), 0)
+        models.Job.objects.update(heartbeat_at=job.created_at - datetime.timedelta(hours=2))
+        self.assertEqual(jobs.requeue_stale(timeout=3600), 1)
+        self.assertEqual(models.Job.objects.get().status, models.Job.QUEUED)
+
+    def test_heartbeat_keeps_long_job_running(self):
+        job = jobs.enqueue(heartbeat_job)
+        job = jobs.claim_job()
+        models.Job.objects.update(started_at=job.started_at - datetime.timedelta(hours=2),
+                                  heartbeat_at=job.started_at - datetime.timedelta(hours=2))
+        with mock.patch("document.jobs.HEARTBEAT_INTERVAL", 0):
+            self.assertTrue(jobs.run_job(job))
+        # The job was not queued again while it was running
+        self.assertEqual(job_calls, [0])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS_INTERVAL=60)
+    def test_scheduler_is_started_once(self):
+        with mock.patch("document.tasks._scheduler", None), mock.patch("document.tasks.threading.Thread") as thread:
+            self.client.get("/login/")
+            self.client.get("/login/")
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=False, JOBS_BACKOFF_SECONDS=0)
+    def test_failed_deletion_is_retried_and_restored(self):
+        self.log_manager()
+        with self.captureOnCommitCallbacks():
+            self.client.post("/category/delete/2")
+        with mock.patch("document.deletion.delete_documents", side_effect=OSError("dysk")):
+            self.assertEqual(jobs.work(once=True), 3)
+        job = models.Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (models.Job.FAILED, 3))
+        deletion_object = models.Deletion.objects.get()
+        self.assertEqual((deletion_object.status, deletion_object.error), (models.Deletion.FAILED, "dysk"))
+        # Object is shown again, so it can be deleted once more
+        self.assertFalse(models.Category.objects.get(pk=2).pending_deletion)
+        self.assertFalse(models.Document.objects.filter(category_id=2, pending_deletion=True).exists())
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=False)
+    def test_stale_deletion_is_restored(self):
+        self.log_manager()
+        with self.captureOnCommitCallbacks():
+            self.client.post("/category/delete/2")
+        self.assertIn("document.deletion.run_deletion", jobs.FAILURE_HANDLERS)
+        job = jobs.claim_job()
+        models.Job.objects.update(attempts=job.max_attempts, heartbeat_at=job.started_at - datetime.timedelta(hours=2))
+        self.assertEqual(jobs.requeue_stale(timeout=3600), 0)
+        self.assertEqual(models.Job.objects.get().status, models.Job.FAILED)
+        self.assertFalse(models.Category.objects.get(pk=2).pending_deletion)
+
+    def test_failed_eager_deletion_is_restored(self):
+        self.log_manager()
+        with mock.patch("document.deletion.delete_documents", side_effect=OSError("dysk")):
+            self.client.post("/category/delete/2")
+        self.assertEqual(models.Deletion.objects.get().status, models.Deletion.FAILED)
+        self.assertFalse(models.Category.objects.get(pk=2).pending_deletion)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=False)
+    def test_deletion_is_run_by_worker(self):
+        self.log_manager()
+        with self.captureOnCommitCallbacks():
+            self.client.post("/category/delete/2")
+        job = models.Job.objects.get()
+        self.assertEqual((job.name, job.priority), ("document.deletion.run_deletion", jobs.HIGH))
+        self.assertTrue(models.Category.objects.filter(pk=2).exists())
+
+        stdout = io.StringIO()
+        call_command("run_jobs", workers=1, once=True, stdout=stdout)
+        self.assertIn("Run 1 jobs.", stdout.getvalue())
+        self.assertFalse(models.Category.objects.filter(pk=2).exists())
+        self.assertEqual(models.Deletion.objects.get().status, models.Deletion.DONE)
+
+        stdout = io.StringIO()
+        call_command("list_jobs", stdout=stdout)
+        self.assertIn("done: 1", stdout.getvalue())
+        self.assertIn(f"#{job.id} document.deletion.run_deletion", stdout.getvalue())
+
+
+class TestPreviews01(ExtendedTestCase):
+    fixtures = ["01.json"]
+
+    def add_document(self, name, content, validity_start="2023-01-01"):
+        data = {
+            "product": "1",
+            "category": "1",
+            "validity_start": validity_start,
+            "file": SimpleUploadedFile(name, content, content_type="text/plain"),
+        }
+        self.client.post("/document/add", data)
+        document = models.Document.objects.get(file=name)
+        self.addCleanup(document.file.delete)
+        return document
+
+    def test_text_excerpt(self):
+        self.log_manager()
+        document = self.add_document("owu_podglad.txt", "Ogólne warunki\n\n\n\nubezpieczenia".encode())
+        self.assertEqual(previews.find_cached(document)[1], previews.TEXT)
+
+        response = self.client.get(f"/document/{document.id}")
+        self.assertEqual(response.context["preview_kind"], "text")
+        self.assertContains(response, f"/document/{document.id}/preview")
+
+        response = self.assertWithinQueryBudget(f"/document/{document.id}/preview")
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertEqual(response.content.decode(), "Ogólne warunki\n\nubezpieczenia")
+        response = self.client.get(f"/document/{document.id}/preview", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_lazy_regeneration(self):
+        self.log_manager()
+        document = self.add_document("owu_leniwy.txt", b"x" * 2000)
+        os.remove(previews.find_cached(document)[0])
+        with self.settings(DOCUMENT_PREVIEW_EXCERPT_CHARS=10):
+            response = self.client.get(f"/document/{document.id}/preview")
+        self.assertEqual(response.content.decode(), "x" * 10 + "…")
+        self.assertIsNotNone(previews.find_cached(document))
+
+    def test_least_recently_used_are_evicted(self):
+        self.log_manager()
+        first = self.add_document("owu_1.txt", b"a" * 100)
+        second = self.add_document("owu_2.txt", b"b" * 100, validity_start="2023-02-01")
+        os.utime(previews.find_cached(first)[0], (0, 0))
+        with self.settings(DOCUMENT_PREVIEW_CACHE_SIZE=150):
+            self.assertEqual(previews.evict(), 1)
+        self.assertIsNone(previews.find_cached(first))
+        self.assertIsNotNone(previews.find_cached(second))
+
+    def test_previews_are_removed_with_document(self):
+        self.log_manager()
+        first = self.add_document("owu_usuwany.txt", b"pierwszy")
+        second = self.add_document("owu_usuwany2.txt", b"drugi", validity_start="2023-02-01")
+        paths = [previews.find_cached(document)[0] for document in (first, second)]
+
+        first.delete()
+        deletion.delete_documents(models.Document.objects.filter(id=second.id))
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+    def test_image_is_rendered_from_path(self):
+        self.log_manager()
+        document = self.add_document("owu_obraz.pdf", make_pdf("strona"))
+        with mock.patch.object(previews, "fitz") as fitz:
+            fitz.open.return_value.__enter__.return_value.__getitem__.return_value.get_pixmap.return_value \
+                .tobytes.return_value = b"png"
+            self.assertEqual(previews.render_image(document), b"png")
+        # The file is not read into memory
+        fitz.open.assert_called_once_with(document.file.path, filetype="pdf")
+
+    def test_cache_is_scanned_when_full(self):
+        path = os.path.join(settings.DOCUMENT_PREVIEW_ROOT, "{}.txt")
+        with self.settings(DOCUMENT_PREVIEW_CACHE_SIZE=250), \
+                mock.patch.object(previews, "evict", wraps=previews.evict) as evict:
+            # The first preview finds out the size of the cache
+            previews.save(path.format(1), b"a" * 100)
+            previews.save(path.format(2), b"b" * 100)
+            self.assertEqual(evict.call_count, 1)
+            previews.save(path.format(3), b"c" * 100)
+            self.assertEqual(evict.call_count, 2)
+        self.assertEqual(len(os.listdir(settings.DOCUMENT_PREVIEW_ROOT)), 2)
+
+    def test_replaced_file_gets_new_preview(self):
+        self.log_manager()
+        document = self.add_document("owu_zmiana.txt", b"stara tresc")
+        data = {"product": "1", "category": "1", "validity_start": "2023-01-01",
+                "file": SimpleUploadedFile("owu_zmiana.txt", b"nowa tresc", content_type="text/plain")}
+        self.client.post(f"/document/edit/{document.id}", data)
+        document.refresh_from_db()
+        self.assertEqual(previews.get_preview(document), (b"nowa tresc", previews.TEXT))
+
+
+class TestImportDocumentsCommand03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        for name in ("import1.pdf", "import2.pdf"):
+            with open(os.path.join(self.directory, name), "wb") as fh:
+                fh.write(name.encode())
+        self.manifest = os.path.join(self.directory, "manifest.csv")
+        with open(self.manifest, "w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["product", "category", "validity_start", "file"])
+            writer.writerow(["ALA123", "OWU", "2023-01-01", "import1.pdf"])
+            writer.writerow(["Produkt bartekmapsa", "SWU", "2023-01-01", "import2.pdf"])
+            writer.writerow(["ALA123", "OWU", "2022-01-01", "import1.pdf"])
+            writer.writerow(["NIEMA", "OWU", "2023-01-01", "import1.pdf"])
+            writer.writerow(["ALA123", "OWU", "2023-02-01", "brak.pdf"])
+
+    def import_documents(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_documents", self.directory, self.manifest, user="test_user1", workers=0,
+                     stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import(self):
+        stdout, stderr = self.import_documents()
+        self.assertIn("Imported 2 documents, skipped 1 already imported, 2 rows failed.", stdout)
+        self.assertIn("Row 4: produkt NIEMA", stderr)
+        self.assertIn("Row 5: ", stderr)
+
+        document = models.Document.objects.get(file="import1.pdf")
+        self.assertEqual(document.product.model, "ALA123")
+        self.assertEqual(document.created_by.username, "test_user1")
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"import1.pdf")
+        self.assertEqual(utils.search("import2").count(), 1)
+
+        stdout, _ = self.import_documents()
+        self.assertIn("Imported 0 documents, skipped 3 already imported", stdout)
+        self.assertEqual(models.Document.objects.count(), 14)
+
+        for document in models.Document.objects.filter(file__startswith="import"):
+            document.delete()
+
+    def test_import_zip(self):
+        archive = os.path.join(self.directory, "archive.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("owu/import1.pdf", b"zipped")
+        manifest = os.path.join(self.directory, "manifest.json")
+        with open(manifest, "w") as fh:
+            json.dump([{"product": "BAR456", "category": "OWU", "validity_start": "2023-01-01",
+                        "file": "owu/import1.pdf"}], fh)
+
+        call_command("import_documents", archive, manifest, user="test_user1", workers=0, stdout=io.StringIO())
+        document = models.Document.objects.get(file="import1.pdf")
+        with document.file.open("rb") as fh:
+            self.assertEqual(fh.read(), b"zipped")
+        document.delete()
+
+    def test_import_zip_in_threads(self):
+        archive = os.path.join(self.directory, "archive.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            for i in range(6):
+                zf.writestr(f"owu/watek{i}.pdf", f"plik {i}".encode())
+        manifest = os.path.join(self.directory, "manifest.json")
+        with open(manifest, "w") as fh:
+            json.dump([{"product": "BAR456", "category": "OWU", "validity_start": f"2024-01-0{i + 1}",
+                        "file": f"owu/watek{i}.pdf"} for i in range(6)], fh)
+
+        command = import_documents.Command()
+        stdout = io.StringIO()
+        call_command(command, archive, manifest, user="test_user1", workers=2, batch_size=4, stdout=stdout)
+        self.assertIn("Imported 6 documents", stdout.getvalue())
+        for i in range(6):
+            document = models.Document.objects.get(file=f"watek{i}.pdf")
+            with document.file.open("rb") as fh:
+                self.assertEqual(fh.read(), f"plik {i}".encode())
+            document.delete()
+        # Handles of the archive opened by the threads are closed
+        self.assertTrue(command.archives)
+        self.assertTrue(all(handle.fp is None for handle in command.archives))
+
+    def test_failed_row_does_not_fail_batch(self):
+        save_temporary = default_storage.save_temporary
+
+        def failing_save(name, *args, **kwargs):
+            if name == "import2.pdf":
+                raise OSError("dysk")
+            return save_temporary(name, *args, **kwargs)
+
+        with mock.patch.object(default_storage, "save_temporary", side_effect=failing_save):
+            stdout, stderr = self.import_documents()
+        self.assertIn("Imported 1 documents, skipped 1 already imported, 3 rows failed.", stdout)
+        self.assertIn("Row 2: dysk", stderr)
+        # Files are stored only together with their documents
+        self.assertEqual(
+            set(models.StoredFile.objects.values_list("name", flat=True)),
+            set(models.Document.objects.filter(file__startswith="import").values_list("file", flat=True)),
+        )
+        for document in models.Document.objects.filter(file__startswith="import"):
+            document.delete()
+
+    def test_failed_batch_leaves_no_files(self):
+        digests = [hashlib.sha256(name.encode()).hexdigest() for name in ("import1.pdf", "import2.pdf")]
+        with mock.patch.object(models.Document.objects, "bulk_create", side_effect=IntegrityError("konflikt")):
+            stdout, _ = self.import_documents()
+        self.assertIn("Imported 0 documents, skipped 1 already imported, 4 rows failed.", stdout)
+        self.assertFalse(models.Blob.objects.filter(digest__in=digests).exists())
+        for digest in digests:
+            self.assertFalse(os.path.exists(default_storage.blob_path(digest)))
+        temporary_dir = default_storage.temporary_dir()
+        files = [name for name in os.listdir(temporary_dir) if os.path.isfile(os.path.join(temporary_dir, name))]
+        self.assertEqual(files, [])
+
+    def test_rows_are_saved_again_after_failed_batch(self):
+        bulk_create = models.Document.objects.bulk_create
+
+        def failing_bulk_create(documents, *args, **kwargs):
+            if len(documents) > 1:
+                raise IntegrityError("konflikt")
+            return bulk_create(documents, *args, **kwargs)
+
+        with mock.patch.object(models.Document.objects, "bulk_create", side_effect=failing_bulk_create):
+            stdout, _ = self.import_documents()
+        self.assertIn("Imported 2 documents", stdout)
+        # Files moved to the storage by the failed batch were moved back and stored again
+        for name in ("import1.pdf", "import2.pdf"):
+            document = models.Document.objects.get(file=name)
+            with document.file.open("rb") as fh:
+                self.assertEqual(fh.read(), name.encode())
+            document.delete()
+
+
+class TestGenerateDataCommand01(ExtendedTestCase):
+    fixtures = ["01.json"]
+
+    def generate(self, **options):
+        call_command("generate_data", users=3, products=20, categories=4, documents=200, history=50,
+                     stdout=io.StringIO(), **options)
+
+    def test_generate(self):
+        self.generate()
+        self.assertEqual(models.Product.objects.count(), 21)
+        self.assertEqual(models.Category.objects.count(), 5)
+        self.assertEqual(models.Document.objects.count(), 205)
+        self.assertEqual(models.History.objects.count(), 50)
+        self.assertEqual(models.DocumentIndex.objects.count(), 205)
+
+        # Generating more data never breaks the uniqueness of product, category and validity start
+        self.generate()
+        self.assertEqual(models.Document.objects.count(), 405)
+
+        # File names do not repeat either
+        files = list(models.Document.objects.values_list("file", flat=True))
+        self.assertEqual(len(set(files)), len(files))
+
+    def test_generate_is_deterministic(self):
+        def words():
+            # Numbers of the names follow the existing documents
+            files = models.Document.objects.order_by("id").values_list("file", flat=True)
+            return [name.rsplit("_", 1)[0] for name in files]
+
+        self.generate(seed=7)
+        first = words()
+        models.Document.objects.all().delete()
+        self.generate(seed=7)
+        self.assertEqual(first[5:], words())
+
+    def test_files(self):
+        call_command("generate_data", users=1, products=1, categories=1, documents=3, files=True, stdout=io.StringIO())
+        documents = list(models.Document.objects.order_by("-id")[:3])
+        self.addCleanup(lambda: [document.file.delete(save=False) for document in documents])
+        # All the placeholders are one stored content
+        self.assertEqual(models.Blob.objects.get().references, 3)
+        with documents[0].file.open("rb") as fh:
+            self.assertTrue(fh.read().startswith(b"%PDF"))
+
+    def test_empty_pools(self):
+        models.Document.objects.all().delete()
+        models.Product.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, "Documents need products, categories and users."):
+            call_command("generate_data", users=0, products=0, categories=0, documents=10, stdout=io.StringIO())
+
+
+class TestBenchmarkCommand03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def test_benchmark(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, "results.json")
+        call_command("benchmark", iterations=2, large_file_mb=1, output=output, stdout=io.StringIO())
+        with open(output) as fh:
+            report = json.load(fh)
+        self.assertEqual(report["dataset"]["documents"], 12)
+        self.assertEqual(len(report["scenarios"]), 9)
+        self.assertEqual(report["scenarios"]["document_detail_view"]["queries"], 5)
+        self.assertEqual(models.Document.objects.count(), 12)
+
+        stdout = io.StringIO()
+        call_command("benchmark", iterations=2, only=["save_history"], baseline=output, stdout=stdout)
+        self.assertIn("base p95", stdout.getvalue())
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False, JOBS_IN_PROCESS=True)
+    def test_jobs_run_before_measurements(self):
+        command = benchmark.Command()
+        measure = command.measure
+
+        def measure_pending(func, iterations):
+            pending.append(models.Job.objects.exclude(status=models.Job.DONE).count())
+            return measure(func, iterations)
+
+        pending = []
+        with mock.patch("document.tasks.get_executor") as get_executor, \
+                mock.patch.object(command, "measure", side_effect=measure_pending):
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command(command, iterations=1, large_file_mb=1, stdout=io.StringIO())
+        get_executor.assert_not_called()
+        # Jobs of the created files were done before the measurements
+        self.assertTrue(models.Job.objects.filter(status=models.Job.DONE).exists())
+        self.assertEqual(pending, [0] * 9)
+
+
 class TestEditDocumentView03(ExtendedTestCase):
     fixtures = ["03.json"]
 
@@ -592,6 +2209,26 @@ class TestEditDocumentView03(ExtendedTestCase):
         self.assertEqual(history.changed_to, "1989-09-21")
         document.delete()
 
+    def test_post_edit_document07_history_saved_at_once(self):
+        self.log_manager()
+        document = models.Document.objects.get(pk=7)
+        data = {
+            "product": "1",
+            "category": "2",
+            "validity_start": "1989-09-21",
+            "file": document.file.name
+        }
+        with CaptureQueriesContext(connection) as context:
+            self.client.post("/document/edit/7", data)
+        inserts = [query for query in context.captured_queries if "INSERT INTO \"document_history\"" in query["sql"]]
+        self.assertEqual(len(inserts), 1)
+
+        histories = models.History.objects.filter(document_id=7)
+        self.assertEqual(
+            set(histories.values_list("element", flat=True)), {"produkt", "kategoria dokumentu", "ważny od"}
+        )
+        models.Document.objects.get(pk=7).delete()
+
 
 class TestDeleteDocumentView01(ExtendedTestCase):
     fixtures = ["01.json"]
@@ -616,6 +2253,17 @@ class TestDeleteDocumentView01(ExtendedTestCase):
         self.assertEqual(response.url, "/")
         self.assertEqual(models.Document.objects.count(), 4)
 
+    def test_post_does_not_save_document(self):
+        self.log_manager()
+        with mock.patch.object(search, "index_documents") as index_documents, \
+                mock.patch.object(extraction, "schedule_extraction") as schedule_extraction, \
+                mock.patch.object(previews, "schedule_previews") as schedule_previews:
+            self.client.post("/document/delete/1")
+        self.assertFalse(models.Document.objects.filter(pk=1).exists())
+        index_documents.assert_not_called()
+        schedule_extraction.assert_not_called()
+        schedule_previews.assert_not_called()
+
 
 class TestDocumentDetailView01(ExtendedTestCase):
     fixtures = ["01.json"]
@@ -626,6 +2274,85 @@ class TestDocumentDetailView01(ExtendedTestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class TestAsyncViews03(ExtendedTestCase):
+    fixtures = ["03.json"]
+
+    def setUp(self):
+        super().setUp()
+        # Views run in the test's thread, which holds the test database's transaction
+        patcher = mock.patch.object(async_views, "THREAD_SENSITIVE", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, view, path, user=None, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = user or User.objects.get(username="test_user1")
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_main(self):
+        response = self.get(async_views.main, "/")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "#12")
+
+        response = self.get(async_views.main, "/search/?phrase=bartekmapsa")
+        self.assertContains(response, "Znalezione dokumenty (6)")
+
+    def test_login_required(self):
+        response = self.get(async_views.document_detail, "/document/1", user=AnonymousUser(), pk=1)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, "/login/?next=/document/1")
+
+    def test_document_detail(self):
+        response = self.get(async_views.document_detail, "/document/7", pk=7)
+        self.assertContains(response, "file7.pdf")
+
+    def test_download(self):
+        with open("media/file1.pdf", "wb") as fh:
+            fh.write(b"%PDF" * 50000)
+        try:
+            response = self.get(async_views.download, "/download/1", pk=1)
+            self.assertTrue(response.streaming)
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF" * 50000)
+        finally:
+            os.remove("media/file1.pdf")
+
+    def test_query_budget(self):
+        self.assertEqual(instrumentation.get_query_budget(async_views.main), views.MainView.query_budget)
+
+    @override_settings(DEBUG=True)
+    def test_queries_are_counted(self):
+        self.async_client.force_login(User.objects.get(username="test_user1"))
+
+        async def get():
+            return await self.async_client.get("/document/7")
+
+        response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        # Session, user and the document at least
+        self.assertGreaterEqual(int(response["X-Query-Count"]), 3)
+
+    def test_streaming_response_is_read_in_threads(self):
+        threads = []
+
+        def parts():
+            for part in (b"abc", b"", b"def"):
+                threads.append(threading.get_ident())
+                yield part
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        response = StreamingHttpResponse(parts(), content_type="text/plain")
+        async_to_sync(handlers.ASGIHandler().send_response)(response, send)
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertIn((b"Content-Type", b"text/plain"), messages[0]["headers"])
+        self.assertEqual(b"".join(message.get("body", b"") for message in messages[1:]), b"abcdef")
+        self.assertEqual(messages[-1], {"type": "http.response.body"})
+        self.assertNotIn(threading.get_ident(), threads)
+
+
 class TestDownloadDocumentView01(ExtendedTestCase):
     fixtures = ["01.json"]
 
@@ -639,6 +2366,83 @@ class TestDownloadDocumentView01(ExtendedTestCase):
         self.assertEqual(response.status_code, 200)
         os.remove("media/file1.pdf")
 
+    def test_get_streams_file(self):
+        self.log_user()
+        with open("media/file1.pdf", "wb") as fh:
+            fh.write(b"%PDF" * 50000)
+        try:
+            response = self.client.get("/download/1")
+            self.assertTrue(response.streaming)
+            self.assertEqual(response["Content-Type"], "application/pdf")
+            self.assertEqual(response["Content-Disposition"], 'inline; filename="file1.pdf"')
+            self.assertEqual(b"".join(response.streaming_content), b"%PDF" * 50000)
+        finally:
+            os.remove("media/file1.pdf")
+
+    def test_get_conditional(self):
+        self.log_user()
+        with open("media/file1.pdf", "wb") as fh:
+            fh.write(b"0123456789")
+        try:
+            response = self.client.get("/download/1")
+            etag = response["ETag"]
+            last_modified = response["Last-Modified"]
+            self.assertEqual(response["Accept-Ranges"], "bytes")
+
+            response = self.client.get("/download/1", HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get("/download/1", HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get("/download/1", HTTP_IF_NONE_MATCH='"other"')
+            self.assertEqual(response.status_code, 200)
+        finally:
+            os.remove("media/file1.pdf")
+
+    def test_get_ranges(self):
+        self.log_user()
+        with open("media/file1.pdf", "wb") as fh:
+            fh.write(b"0123456789")
+        try:
+            response = self.client.get("/download/1", HTTP_RANGE="bytes=2-4")
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+            self.assertEqual(b"".join(response.streaming_content), b"234")
+
+            response = self.client.get("/download/1", HTTP_RANGE="bytes=-3")
+            self.assertEqual(b"".join(response.streaming_content), b"789")
+
+            response = self.client.get("/download/1", HTTP_RANGE="bytes=0-1,8-")
+            self.assertEqual(response.status_code, 206)
+            self.assertTrue(response["Content-Type"].startswith("multipart/byteranges; boundary="))
+            body = b"".join(response.streaming_content)
+            self.assertEqual(len(body), int(response["Content-Length"]))
+            self.assertIn(b"Content-Range: bytes 0-1/10\r\n\r\n01\r\n", body)
+            self.assertIn(b"Content-Range: bytes 8-9/10\r\n\r\n89\r\n", body)
+
+            response = self.client.get("/download/1", HTTP_RANGE="bytes=20-30")
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response["Content-Range"], "bytes */10")
+
+            response = self.client.get("/download/1", HTTP_RANGE="bytes=2-4", HTTP_IF_RANGE='"outdated"')
+            self.assertEqual(response.status_code, 200)
+        finally:
+            os.remove("media/file1.pdf")
+
+    def test_get_offloaded(self):
+        self.log_user()
+        open("media/file1.pdf", "x")
+        try:
+            with self.settings(DOCUMENT_DOWNLOAD_OFFLOAD="x-accel-redirect"):
+                response = self.client.get("/download/1")
+            self.assertEqual(response["X-Accel-Redirect"], "/protected-media/file1.pdf")
+            self.assertEqual(response.content, b"")
+
+            with self.settings(DOCUMENT_DOWNLOAD_OFFLOAD="x-sendfile"):
+                response = self.client.get("/download/1")
+            self.assertEqual(response["X-Sendfile"], os.path.abspath("media/file1.pdf"))
+        finally:
+            os.remove("media/file1.pdf")
+
 
 class TestRegisterView(ExtendedTestCase):
     def test_get(self):
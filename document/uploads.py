@@ -0,0 +1,258 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from document import models
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class AssembledFile(UploadedFile):
+    """
+    File of a finished upload, passed to the document form like a file uploaded to a temporary file.
+
+    Storages move it into place by its path instead of reading it. The file is read only by chunks(), which checks
+    it while the storage hashes it, so no handle is kept open.
+    """
+    def __init__(self, upload):
+        self.upload = upload
+        self.path = get_path(upload)
+        content_type, _ = mimetypes.guess_type(upload.file_name)
+        super().__init__(None, upload.file_name, content_type, upload.size)
+
+    def temporary_file_path(self):
+        return self.path
+
+    def chunks(self, chunk_size=None):
+        """
+        Read the file, checking it against the digests sent by the client.
+
+        :param chunk_size: integer, number of bytes read at once
+        :return: iterator of bytes
+        :raises UploadError: at the end of the file, if its content differs from what was sent
+        """
+        verifier = Verifier(self.upload)
+        with open(self.path, "rb") as fh:
+            for data in iter(lambda: fh.read(chunk_size or CHUNK_SIZE), b""):
+                verifier.update(data)
+                yield data
+        if not verifier.is_valid():
+            raise UploadError("Przesłany plik jest uszkodzony. Wybierz go ponownie.")
+
+    def close(self):
+        pass
+
+
+def get_path(upload):
+    return os.path.join(settings.DOCUMENT_UPLOAD_DIR, str(upload.id))
+
+
+def start_upload(file_name, size, user, sha256=""):
+    """
+    Start a chunked upload.
+
+    The file is created with its final size, so chunks can be written at their offsets in any order.
+
+    :param file_name: string, name of the uploaded file
+    :param size: integer, size of the file in bytes
+    :param user: user who uploads the file
+    :param sha256: string, hex digest of the whole file computed by the client, checked when the upload is finished
+    :return: upload object
+    """
+    if size > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+        raise UploadError("Plik jest za duży.", status=413)
+    upload = models.Upload.objects.create(
+        file_name=os.path.basename(file_name), size=size, sha256=(sha256 or "").lower(), created_by=user
+    )
+    os.makedirs(settings.DOCUMENT_UPLOAD_DIR, exist_ok=True)
+    with open(get_path(upload), "wb") as fh:
+        fh.truncate(size)
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, sha256=None):
+    """
+    Write a chunk of the file at its offset.
+
+    The chunk is streamed into its own temporary file and hashed on the way; only a complete chunk with the right
+    digest is written into the file. Sending the same chunk again only overwrites it, so clients can safely retry
+    chunks whose response they have not received, and a broken retry never spoils data received before.
+
+    :param upload: upload object
+    :param offset: integer, position of the chunk in the file
+    :param stream: file-like object with the chunk, e.g. the request
+    :param length: integer, size of the chunk in bytes
+    :param sha256: string, hex digest of the chunk computed by the client, checked if given
+    :return: chunk object
+    :raises UploadError: if the chunk does not fit the file, is incomplete or its digest differs
+    """
+    if offset < 0 or length < 1 or offset + length > upload.size:
+        raise UploadError("Fragment wykracza poza plik.", status=416)
+    if length > settings.DOCUMENT_UPLOAD_CHUNK_SIZE:
+        raise UploadError("Fragment jest za duży.", status=413)
+
+    digest = hashlib.sha256()
+    remaining = length
+    with tempfile.TemporaryFile(dir=settings.DOCUMENT_UPLOAD_DIR) as chunk_file:
+        while remaining > 0:
+            data = stream.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            chunk_file.write(data)
+            remaining -= len(data)
+
+        if remaining:
+            raise UploadError("Fragment nie został przesłany w całości.")
+        if sha256 and sha256.lower() != digest.hexdigest():
+            raise UploadError("Suma kontrolna fragmentu się nie zgadza.")
+
+        # Until the chunk is written, the bytes at its offset are not counted as received
+        models.UploadChunk.objects.filter(upload=upload, offset=offset).delete()
+        chunk_file.seek(0)
+        with open(get_path(upload), "r+b") as fh:
+            fh.seek(offset)
+            shutil.copyfileobj(chunk_file, fh, CHUNK_SIZE)
+    # A retry racing the original request may have saved the chunk in the meantime
+    chunk, _ = models.UploadChunk.objects.update_or_create(
+        upload=upload, offset=offset, defaults={"size": length, "sha256": digest.hexdigest()}
+    )
+    return chunk
+
+
+def get_received(upload):
+    """
+    Get the number of bytes received from the beginning of the file without gaps.
+
+    Clients resume the upload from this offset.
+
+    :param upload: upload object
+    :return: integer
+    """
+    received = 0
+    for offset, size in upload.chunks.order_by("offset").values_list("offset", "size"):
+        if offset > received:
+            break
+        received = max(received, offset + size)
+    return received
+
+
+def get_status(upload):
+    received = get_received(upload)
+    return {
+        "id": str(upload.id),
+        "name": upload.file_name,
+        "size": upload.size,
+        "received": received,
+        "complete": received == upload.size,
+        "chunk_size": settings.DOCUMENT_UPLOAD_CHUNK_SIZE,
+    }
+
+
+class Verifier:
+    """
+    Check the assembled file, read from its beginning, against the digests of its chunks and the digest
+    of the whole file, if it was given.
+
+    Chunks overwritten by overlapping chunks with other content are found as well.
+    """
+    def __init__(self, upload):
+        self.chunks = list(upload.chunks.order_by("offset").values_list("offset", "size", "sha256"))
+        self.sha256 = upload.sha256
+        self.digest = hashlib.sha256() if upload.sha256 else None
+        # Chunks which have started, as lists [offset, end, digest, expected digest]
+        self.reading = []
+        self.next_chunk = 0
+        self.position = 0
+        self.valid = True
+
+    def update(self, data):
+        start, end = self.position, self.position + len(data)
+        while self.next_chunk < len(self.chunks) and self.chunks[self.next_chunk][0] < end:
+            offset, size, sha256 = self.chunks[self.next_chunk]
+            self.reading.append([offset, offset + size, hashlib.sha256(), sha256])
+            self.next_chunk += 1
+
+        reading = []
+        for offset, chunk_end, digest, sha256 in self.reading:
+            digest.update(data[max(offset, start) - start:min(chunk_end, end) - start])
+            if chunk_end > end:
+                reading.append([offset, chunk_end, digest, sha256])
+            elif digest.hexdigest() != sha256:
+                self.valid = False
+        self.reading = reading
+        if self.digest is not None:
+            self.digest.update(data)
+        self.position = end
+
+    def is_valid(self):
+        """
+        :return: boolean, whether the whole file has been read and matches all the digests
+        """
+        if not self.valid or self.reading or self.next_chunk < len(self.chunks):
+            return False
+        return self.digest is None or self.digest.hexdigest() == self.sha256
+
+
+def get_assembled_file(upload_id, user):
+    """
+    Get the file of the user's finished upload.
+
+    Its content is checked only when it is read (see AssembledFile.chunks).
+
+    :param upload_id: UUID of the upload
+    :param user: user who uploaded the file
+    :return: tuple (upload, file)
+    :raises UploadError: if the upload does not exist or has missing chunks
+    """
+    upload = models.Upload.objects.filter(id=upload_id, created_by=user).first()
+    if upload is None or not os.path.exists(get_path(upload)):
+        raise UploadError("Przesłany plik nie istnieje. Wybierz go ponownie.", status=404)
+    if get_received(upload) != upload.size:
+        raise UploadError("Przesyłanie pliku nie zostało ukończone.")
+    return upload, AssembledFile(upload)
+
+
+def discard(upload):
+    """
+    Delete the upload with its file, unless the storage has already moved the file.
+
+    :param upload: upload object
+    :return: None
+    """
+    try:
+        os.remove(get_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+    return None
+
+
+def discard_stale():
+    """
+    Delete uploads which have not been finished within settings.DOCUMENT_UPLOAD_EXPIRY seconds.
+
+    :return: integer, number of deleted uploads
+    """
+    uploads = models.Upload.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=settings.DOCUMENT_UPLOAD_EXPIRY)
+    )
+    count = 0
+    for upload in uploads:
+        discard(upload)
+        count += 1
+    return count
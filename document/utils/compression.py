@@ -0,0 +1,134 @@
+"""
+Compression of stored files.
+
+Functions of this module do not use Django, so they can run in separate processes.
+"""
+import gzip
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = "gzip"
+ZSTD = "zstd"
+CODECS = (GZIP, ZSTD)
+# Compressed contents are stored under their own names, so the uncompressed file is kept until the codec is switched
+SUFFIXES = {GZIP: ".gz", ZSTD: ".zst"}
+CHUNK_SIZE = 64 * 1024
+
+# Text-heavy formats; other files (images, archives) are usually compressed already
+COMPRESSIBLE_TYPES = {
+    "application/pdf",
+    "application/rtf",
+    "application/msword",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.oasis.opendocument.text",
+    "application/vnd.ms-excel",
+}
+
+# Formats which are ZIP archives themselves
+ZIP_CONTAINER_TYPES = {
+    "application/zip",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "application/vnd.oasis.opendocument.text",
+}
+
+
+def is_compressible(mime_type):
+    """Check whether files of the MIME type are text-heavy, so they compress well."""
+    return mime_type in COMPRESSIBLE_TYPES or (mime_type or "").startswith("text/")
+
+
+def choose_codec(mime_type, preferred="auto"):
+    """
+    Choose the codec of a file.
+
+    :param mime_type: string, MIME type of the file, may be None
+    :param preferred: string, "auto" (zstd if it is installed, otherwise gzip), "gzip", "zstd" or "" (no compression)
+    :return: string, codec or "" if the file should not be compressed
+    """
+    if not preferred or not is_compressible(mime_type):
+        return ""
+    if preferred == ZSTD or preferred == "auto":
+        return ZSTD if zstandard is not None else GZIP
+    return GZIP
+
+
+def is_worth_it(size, stored_size, min_saving):
+    """
+    Check whether the compressed file is smaller enough to be kept instead of the original.
+
+    :param size: integer, size of the original file in bytes
+    :param stored_size: integer, size of the compressed file in bytes
+    :param min_saving: float, minimal saved fraction of the size, e.g. 0.1
+    :return: boolean
+    """
+    return stored_size <= size * (1 - min_saving)
+
+
+def open_writer(path, codec):
+    if codec == GZIP:
+        return gzip.open(path, "wb", compresslevel=6)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=10).stream_writer(open(path, "wb"), closefd=True)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def open_reader(path, codec):
+    """
+    Open the stored file for reading its original content.
+
+    :param path: string, path of the file
+    :param codec: string, codec of the file or "" if it is not compressed
+    :return: file object in binary mode
+    """
+    if not codec:
+        return open(path, "rb")
+    if codec == GZIP:
+        return gzip.open(path, "rb")
+    if codec == ZSTD:
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def compress_file(item):
+    """
+    Compress a file.
+
+    :param item: tuple (source_path, target_path, codec)
+    :return: integer, size of the compressed file in bytes
+    """
+    source_path, target_path, codec = item
+    with open(source_path, "rb") as source, open_writer(target_path, codec) as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+    return os.path.getsize(target_path)
+
+
+@contextmanager
+def decompressed_copy(path, codec):
+    """
+    Get path of the file's original content, decompressed into a temporary file if needed.
+
+    Useful for libraries which read files by their paths or seek in them.
+
+    :param path: string, path of the file
+    :param codec: string, codec of the file or "" if it is not compressed
+    :return: context manager giving a path
+    """
+    if not codec:
+        yield path
+        return
+
+    fd, temporary_path = tempfile.mkstemp()
+    try:
+        with open_reader(path, codec) as source, os.fdopen(fd, "wb") as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        yield temporary_path
+    finally:
+        os.remove(temporary_path)
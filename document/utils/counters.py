@@ -0,0 +1,79 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from document import models
+
+_local = threading.local()
+
+
+def change(product_id, category_id, delta):
+    """
+    Change the numbers of documents of the product and the category.
+
+    Within batch() the changes are collected and saved at its end.
+
+    :param product_id: integer, id of the product
+    :param category_id: integer, id of the category
+    :param delta: integer, change of the number of documents
+    :return: None
+    """
+    deltas = Counter({(models.Product, product_id): delta})
+    deltas[(models.Category, category_id)] += delta
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.update(deltas)
+    else:
+        apply(deltas)
+
+
+@contextmanager
+def batch():
+    """Collect changes of the numbers of documents and save them with one update per model and delta."""
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+
+    _local.pending = Counter()
+    try:
+        yield
+        deltas = _local.pending
+    finally:
+        _local.pending = None
+    apply(deltas)
+
+
+def apply(deltas):
+    """
+    Save changes of the numbers of documents.
+
+    :param deltas: Counter {(model, id): delta}
+    :return: None
+    """
+    groups = {}
+    for (model, pk), delta in deltas.items():
+        if delta:
+            groups.setdefault((model, delta), []).append(pk)
+    for (model, delta), ids in groups.items():
+        model.objects.filter(id__in=ids).update(documents_count=F("documents_count") + delta, updated_at=timezone.now())
+
+
+def recount(model):
+    """
+    Count documents of all products or categories again.
+
+    :param model: Product or Category
+    :return: integer, number of objects whose number of documents was wrong
+    """
+    field_name = model._meta.model_name
+    counts = models.Document.objects.filter(**{field_name: OuterRef("pk")}).values(field_name)
+    actual = Coalesce(Subquery(counts.annotate(count=Count("id")).values("count")), 0)
+    wrong = model.objects.annotate(actual=actual).exclude(documents_count=F("actual"))
+    ids = list(wrong.values_list("id", flat=True))
+    if ids:
+        model.objects.filter(id__in=ids).update(documents_count=actual, updated_at=timezone.now())
+    return len(ids)
@@ -0,0 +1,303 @@
+import mimetypes
+import os
+import re
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from document.storage import open_path
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 50
+RANGE_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+def content_disposition(filename):
+    """
+    Get value of the Content-Disposition header showing the file in the browser.
+
+    :param filename: string, name of the file
+    :return: string
+    """
+    try:
+        filename.encode("ascii")
+        return 'inline; filename="{}"'.format(filename.replace("\\", "\\\\").replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "inline; filename*=utf-8''{}".format(quote(filename))
+
+
+def parse_range(header, size):
+    """
+    Parse the Range header.
+
+    :param header: string, value of the Range header, e.g. "bytes=0-99,-100"
+    :param size: integer, size of the file in bytes
+    :return: list of (start, end) tuples with inclusive ends, empty if no range is satisfiable,
+             None if the header should be ignored
+    """
+    unit, _, ranges_spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges_spec:
+        return None
+
+    specs = ranges_spec.split(",")
+    if len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_RE.match(spec)
+        if not match or match.group(1) == match.group(2) == "":
+            return None
+        first, last = match.groups()
+        if first == "":
+            # Suffix range: last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start:
+                return None
+            if start >= size:
+                continue
+            ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def merge_ranges(ranges):
+    """
+    Sort the ranges and merge the overlapping and adjacent ones.
+
+    Decompressing readers cannot seek backwards, so ranges of compressed files are read in order.
+
+    :param ranges: list of (start, end) tuples with inclusive ends
+    :return: list of (start, end) tuples
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_applies(request, etag, last_modified):
+    """
+    Check the If-Range header.
+
+    :param request: request
+    :param etag: string, entity tag of the file
+    :param last_modified: integer, modification time of the file as a timestamp
+    :return: boolean, whether the Range header should be used
+    """
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/"')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def read_ranges(fh, ranges, boundary=None, content_type=None, size=None):
+    """
+    Read ranges of the file in chunks.
+
+    If the boundary is given, ranges are wrapped in multipart/byteranges parts.
+    The file is closed when the iteration ends.
+    """
+    try:
+        for start, end in ranges:
+            if boundary:
+                yield part_header(boundary, content_type, start, end, size)
+            fh.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = fh.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            if boundary:
+                yield b"\r\n"
+        if boundary:
+            yield f"--{boundary}--\r\n".encode()
+    finally:
+        fh.close()
+
+
+def part_header(boundary, content_type, start, end, size):
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode()
+
+
+def ranged_response(fh, ranges, content_type, size):
+    """
+    Get "206 Partial Content" response with one or more ranges of the file.
+
+    :param fh: file object opened in binary mode
+    :param ranges: list of (start, end) tuples
+    :param content_type: string, MIME type of the file
+    :param size: integer, size of the file in bytes
+    :return: response
+    """
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(read_ranges(fh, ranges), status=206, content_type=content_type)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+        return response
+
+    boundary = uuid.uuid4().hex
+    length = len(f"--{boundary}--\r\n")
+    for start, end in ranges:
+        length += len(part_header(boundary, content_type, start, end, size)) + end - start + 1 + 2
+    response = StreamingHttpResponse(
+        read_ranges(fh, ranges, boundary, content_type, size),
+        status=206,
+        content_type=f"multipart/byteranges; boundary={boundary}",
+    )
+    response["Content-Length"] = length
+    return response
+
+
+def accepts_encoding(request, codec):
+    """
+    Check whether the client accepts the content encoded with the codec.
+
+    :param request: request
+    :param codec: string, "gzip" or "zstd"
+    :return: boolean
+    """
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = item.partition(";")
+        if coding.strip().lower() != codec:
+            continue
+        quality = params.strip().lower()
+        if not quality.startswith("q="):
+            return True
+        try:
+            return float(quality[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def full_response(open_file, content_type, size, codec):
+    """
+    Get response with the whole original content of a stored file.
+
+    FileResponse would take Content-Length of a compressed file from the disk, so compressed files are streamed
+    with the size of their original content.
+
+    :param open_file: function opening the file with its original content
+    """
+    if not codec:
+        return FileResponse(open_file(), content_type=content_type)
+    response = StreamingHttpResponse(read_ranges(open_file(), [(0, size - 1)]), content_type=content_type)
+    response["Content-Length"] = size
+    return response
+
+
+def file_response(request, file):
+    """
+    Get response with the content of a stored file.
+
+    By default the file is streamed in chunks. If settings.DOCUMENT_DOWNLOAD_OFFLOAD is "x-sendfile" or
+    "x-accel-redirect", the response is empty and the front proxy (Apache, nginx) sends the file.
+    For "x-accel-redirect" the proxy must serve settings.DOCUMENT_DOWNLOAD_ACCEL_PREFIX from the storage location.
+
+    Compressed files (see document.storage) are sent as they are stored, with Content-Encoding, to clients
+    which accept their codec. Other clients and range requests get the decompressed content from Django; ranges
+    of compressed files are sorted and merged, as the decompressed content can only be read forwards.
+
+    Supports conditional requests (ETag and Last-Modified derived from the file's size and modification time)
+    and byte ranges, including multiple ranges.
+
+    :param request: request
+    :param file: field file of the document
+    :return: response
+    """
+    storage = file.storage
+    if not file.name:
+        raise Http404
+    if hasattr(storage, "stat"):
+        # Path, codec and size of a content-addressed file come from a single query
+        try:
+            path, codec, size = storage.stat(file.name)
+            last_modified = int(os.path.getmtime(path))
+        except FileNotFoundError:
+            raise Http404
+
+        def open_file():
+            return open_path(path, codec)
+    else:
+        if not storage.exists(file.name):
+            raise Http404
+        path, codec = None, ""
+        size = storage.size(file.name)
+        last_modified = int(storage.get_modified_time(file.name).timestamp())
+
+        def open_file():
+            return storage.open(file.name, "rb")
+
+    range_header = request.META.get("HTTP_RANGE")
+    encoded = bool(codec) and not range_header and accepts_encoding(request, codec)
+    # Encoded and decoded content are different representations with their own tags
+    etag = quote_etag(f"{size:x}-{last_modified:x}" + (f"-{codec}" if encoded else ""))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        if codec:
+            patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+    filename = os.path.basename(file.name)
+    mime_type, _ = mimetypes.guess_type(filename)
+    mime_type = mime_type or "application/octet-stream"
+    # The proxy cannot decompress files, so it only sends files which are not compressed or need not be
+    offload = settings.DOCUMENT_DOWNLOAD_OFFLOAD if encoded or not codec else None
+
+    if offload == "x-sendfile":
+        response = HttpResponse(content_type=mime_type)
+        response["X-Sendfile"] = path or storage.path(file.name)
+    elif offload == "x-accel-redirect":
+        response = HttpResponse(content_type=mime_type)
+        relative_path = os.path.relpath(path or storage.path(file.name), storage.location).replace(os.sep, "/")
+        response["X-Accel-Redirect"] = quote(settings.DOCUMENT_DOWNLOAD_ACCEL_PREFIX + relative_path)
+    elif encoded:
+        response = FileResponse(open(path, "rb"), content_type=mime_type)
+    elif range_header and range_applies(request, etag, last_modified):
+        ranges = parse_range(range_header, size)
+        if ranges is None:
+            response = full_response(open_file, mime_type, size, codec)
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+        else:
+            if codec:
+                ranges = merge_ranges(ranges)
+            response = ranged_response(open_file(), ranges, mime_type, size)
+    else:
+        response = full_response(open_file, mime_type, size, codec)
+
+    if isinstance(response, FileResponse):
+        response.block_size = CHUNK_SIZE
+    if not offload:
+        response["Accept-Ranges"] = "bytes"
+    if encoded:
+        response["Content-Encoding"] = codec
+    if codec:
+        patch_vary_headers(response, ["Accept-Encoding"])
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = content_disposition(filename)
+    return response
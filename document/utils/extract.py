@@ -0,0 +1,221 @@
+"""
+Extraction of text from files of documents.
+
+Functions of this module do not use Django, so they can run in separate processes.
+"""
+import codecs
+import os
+import re
+import zipfile
+import zlib
+from xml.etree import ElementTree
+
+from document.utils import compression
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+CHUNK_SIZE = 64 * 1024
+# Longer streams of PDF files (e.g. images) are skipped, so files are read with bounded memory
+MAX_PDF_STREAM = 16 * 1024 * 1024
+
+PLAIN_TEXT_EXTENSIONS = {".txt", ".csv", ".md"}
+PLAIN_TEXT_ENCODINGS = ("utf-8", "cp1250")
+
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+PDF_STREAM_START_RE = re.compile(rb"(?<!end)stream\r?\n")
+PDF_STREAM_END = b"endstream"
+PDF_TEXT_RE = re.compile(rb"\[((?:\\.|[^\]\\])*)\]\s*TJ|(\((?:\\.|[^\\)])*\))\s*(?:Tj|'|\")", re.S)
+PDF_STRING_RE = re.compile(rb"\(((?:\\.|[^\\)])*)\)", re.S)
+PDF_ESCAPE_RE = re.compile(rb"\\([0-7]{1,3}|.)", re.S)
+PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def extract(item):
+    """
+    Extract text of a file.
+
+    :param item: tuple (path, codec, name, max_chars) with the path of the stored file, its codec ("" if it is
+                 not compressed), its name in the archive and the maximal length of the text
+    :return: tuple (text, error), error is an empty string if the text has been extracted
+    """
+    path, codec, name, max_chars = item
+    try:
+        with compression.decompressed_copy(path, codec) as plain_path:
+            return extract_text(plain_path, name, max_chars)[:max_chars], ""
+    except UnsupportedFormat:
+        return "", "unsupported format"
+    except Exception as error:
+        return "", f"{type(error).__name__}: {error}"
+
+
+def extract_text(path, name, max_chars=None):
+    """
+    Extract text of a PDF, DOCX or plain text file.
+
+    The file is read in chunks until the text is max_chars long, so the text may be a bit longer.
+
+    :param path: string, path of the file
+    :param name: string, name of the file, whose extension tells the format
+    :param max_chars: integer, length of the text after which the file is not read further, None reads it all
+    :return: string
+    :raises UnsupportedFormat: if the format of the file is not supported
+    """
+    extension = os.path.splitext(name)[1].lower()
+    with open(path, "rb") as fh:
+        header = fh.read(5)
+
+    if extension == ".pdf" or header == b"%PDF-":
+        return extract_pdf(path, max_chars)
+    if extension == ".docx" or (header.startswith(b"PK\x03\x04") and is_docx(path)):
+        return extract_docx(path, max_chars)
+    if extension in PLAIN_TEXT_EXTENSIONS:
+        return extract_plain_text(path, max_chars)
+    raise UnsupportedFormat(name)
+
+
+def extract_plain_text(path, max_chars=None):
+    for encoding in PLAIN_TEXT_ENCODINGS:
+        try:
+            return read_text(path, encoding, "strict", max_chars)
+        except UnicodeDecodeError:
+            continue
+    return read_text(path, "utf-8", "replace", max_chars)
+
+
+def read_text(path, encoding, errors, max_chars=None):
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    parts = []
+    length = 0
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            parts.append(decoder.decode(chunk))
+            length += len(parts[-1])
+            if max_chars is not None and length >= max_chars:
+                return "".join(parts)
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def is_docx(path):
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def extract_docx(path, max_chars=None):
+    """Extract text of paragraphs of a DOCX file."""
+    parts = []
+    length = 0
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as fh:
+        for event, element in ElementTree.iterparse(fh, events=("end",)):
+            if element.tag == f"{WORD_NAMESPACE}t":
+                parts.append(element.text or "")
+            elif element.tag == f"{WORD_NAMESPACE}tab":
+                parts.append("\t")
+            elif element.tag in (f"{WORD_NAMESPACE}br", f"{WORD_NAMESPACE}cr", f"{WORD_NAMESPACE}p"):
+                parts.append("\n")
+            else:
+                continue
+            length += len(parts[-1])
+            if element.tag == f"{WORD_NAMESPACE}p":
+                element.clear()
+                if max_chars is not None and length >= max_chars:
+                    break
+    return "".join(parts)
+
+
+def extract_pdf(path, max_chars=None):
+    """
+    Extract text layer of a PDF file.
+
+    Uses pypdf if it is installed. Otherwise text is read from the text operators of the content streams,
+    which works for simple PDFs with standard encodings only.
+    """
+    lines = []
+    length = 0
+    if pypdf is not None:
+        for page in pypdf.PdfReader(path).pages:
+            lines.append(page.extract_text() or "")
+            length += len(lines[-1]) + 1
+            if max_chars is not None and length >= max_chars:
+                break
+        return "\n".join(lines)
+
+    with open(path, "rb") as fh:
+        for stream in iter_pdf_streams(fh):
+            try:
+                stream = zlib.decompress(stream)
+            except zlib.error:
+                pass
+            for array, string in PDF_TEXT_RE.findall(stream):
+                strings = PDF_STRING_RE.findall(array) if array else [string[1:-1]]
+                lines.append(b"".join(unescape_pdf_string(value) for value in strings).decode("latin-1"))
+                length += len(lines[-1]) + 1
+            if max_chars is not None and length >= max_chars:
+                break
+    return "\n".join(lines)
+
+
+def iter_pdf_streams(fh):
+    """
+    Get contents of the streams of a PDF file, reading it in chunks.
+
+    Streams longer than MAX_PDF_STREAM are skipped.
+
+    :param fh: file object opened in binary mode
+    :return: iterator of bytes
+    """
+    buffer = bytearray()
+    # Offset of the open stream's content in the buffer, None between streams
+    start = None
+    skipping = False
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+        # The end of the stream is searched for only in the new data
+        searched = max(len(buffer) - len(PDF_STREAM_END), 0)
+        buffer += chunk
+        while True:
+            if start is None:
+                match = PDF_STREAM_START_RE.search(buffer)
+                if match is None:
+                    # Keeps the start of a keyword split between chunks
+                    del buffer[:-len(PDF_STREAM_END) - 2]
+                    break
+                start = searched = match.end()
+            end = buffer.find(PDF_STREAM_END, max(start, searched))
+            if end == -1:
+                if len(buffer) - start > MAX_PDF_STREAM:
+                    del buffer[:-len(PDF_STREAM_END)]
+                    start, skipping = 0, True
+                break
+            if not skipping:
+                # Line end before the keyword is not a part of the stream
+                stream_end = end
+                for line_end in (b"\r\n", b"\n"):
+                    if buffer.endswith(line_end, start, end):
+                        stream_end = end - len(line_end)
+                        break
+                yield bytes(buffer[start:stream_end])
+            del buffer[:end + len(PDF_STREAM_END)]
+            start, skipping = None, False
+            searched = 0
+
+
+def unescape_pdf_string(value):
+    def replace(match):
+        escaped = match.group(1)
+        if escaped[:1].isdigit():
+            return bytes([int(escaped, 8) & 0xFF])
+        if escaped in (b"\n", b"\r"):
+            return b""
+        return PDF_ESCAPES.get(escaped, escaped)
+    return PDF_ESCAPE_RE.sub(replace, value)
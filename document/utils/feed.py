@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+VERSION_KEY = "document:feed:version"
+
+
+def get_key():
+    """
+    Get cache key of the rendered feed of the newest documents.
+
+    The key contains a version, which changes whenever documents, products or categories change,
+    so outdated feeds are never read and simply expire.
+
+    :return: string
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = bump_version()
+    return f"document:feed:{version}"
+
+
+def bump_version():
+    version = time.time_ns()
+    cache.set(VERSION_KEY, version, timeout=None)
+    return version
+
+
+def get_feed(key):
+    """
+    Get the rendered feed from the cache.
+
+    :param key: string, key from get_key
+    :return: safe string with HTML or None
+    """
+    html = cache.get(key)
+    return mark_safe(html) if html is not None else None
+
+
+def save_feed(key, html):
+    """
+    Save the rendered feed in the cache.
+
+    The key should be taken before the documents are read, so a feed rendered from rows changed in the meantime
+    is saved under an outdated version.
+
+    :param key: string, key from get_key
+    :param html: string with HTML
+    :return: None
+    """
+    cache.set(key, str(html), timeout=settings.DOCUMENT_FEED_CACHE_TIMEOUT)
+
+
+def invalidate():
+    """
+    Make the cached feed outdated.
+
+    The version changes again after the commit, as requests served in the meantime could cache the old rows.
+
+    :return: None
+    """
+    bump_version()
+    transaction.on_commit(bump_version)
@@ -0,0 +1,108 @@
+from django.db.models import FileField
+
+from document import models
+
+# Tracked fields of each model with the names of the elements shown in the history
+TRACKED_FIELDS = {
+    models.Document: [
+        ("product", "produkt"),
+        ("category", "kategoria dokumentu"),
+        ("validity_start", "ważny od"),
+        ("file", "plik"),
+    ],
+    models.Product: [
+        ("name", "nazwa produktu"),
+        ("model", "model przepływów pieniężnych"),
+    ],
+    models.Category: [
+        ("name", "nazwa kategorii"),
+    ],
+}
+
+MAX_LENGTH = models.History._meta.get_field("changed_from").max_length
+
+
+def snapshot(obj):
+    """
+    Take a snapshot of the tracked fields of the object.
+
+    Labels of foreign keys are taken from the related objects, which should already be loaded
+    (e.g. with select_related) to avoid extra queries.
+
+    :param obj: object of a tracked model
+    :return: dictionary {field name: (value, label)}
+    """
+    values = {}
+    for field_name, _ in TRACKED_FIELDS[type(obj)]:
+        field = obj._meta.get_field(field_name)
+        if field.is_relation:
+            value = getattr(obj, field.attname)
+            label = str(getattr(obj, field_name)) if value is not None else ""
+        elif isinstance(field, FileField):
+            value = getattr(obj, field_name).name
+            label = value or ""
+        else:
+            value = getattr(obj, field_name)
+            label = str(value) if value is not None else ""
+        values[field_name] = (value, label)
+    return values
+
+
+def get_changes(obj, before, after):
+    """
+    Compare two snapshots of the object.
+
+    :param obj: object of a tracked model
+    :param before: snapshot taken before the changes
+    :param after: snapshot taken after the changes
+    :return: list of (element, changed from, changed to) tuples
+    """
+    changes = []
+    for field_name, element in TRACKED_FIELDS[type(obj)]:
+        (value_before, label_before), (value_after, label_after) = before[field_name], after[field_name]
+        if value_before != value_after:
+            changes.append((element, label_before[:MAX_LENGTH], label_after[:MAX_LENGTH]))
+    return changes
+
+
+def build_history(obj, before, user):
+    """
+    Build unsaved history objects of the changes made to the object.
+
+    :param obj: object of a tracked model after the changes
+    :param before: snapshot of the object taken before the changes
+    :param user: user who performs changes
+    :return: list of history objects
+    """
+    link = {obj._meta.model_name: obj}
+    return [
+        models.History(element=element, changed_from=changed_from, changed_to=changed_to, changed_by=user, **link)
+        for element, changed_from, changed_to in get_changes(obj, before, snapshot(obj))
+    ]
+
+
+def save_history(obj, before, user):
+    """
+    Save history of the changes made to the object.
+
+    All history rows of the change are written with a single query.
+
+    :param obj: object of a tracked model after the changes have been saved
+    :param before: snapshot of the object taken before the changes
+    :param user: user who performs changes
+    :return: list of saved history objects
+    """
+    return models.History.objects.bulk_create(build_history(obj, before, user))
+
+
+class HistoryMixin:
+    """Save history of the changes made through an update view of a tracked model."""
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        self.history_before = snapshot(obj)
+        return obj
+
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        save_history(self.object, self.history_before, self.request.user)
+        return response
@@ -0,0 +1,194 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    Page of objects of the keyset pagination.
+
+    Cursors point to the boundary objects of the page: the next page starts after the last object
+    and the previous page ends before the first object. Cursors are ids of the objects or, for pages sorted
+    by another field, encoded pairs of the field's value and the id.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_other_pages(self):
+        return self.next_cursor is not None or self.previous_cursor is not None
+
+
+def get_cursor(value):
+    """
+    Get cursor from a query string value.
+
+    :param value: string or None
+    :return: integer or None if the value is not a valid cursor
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def paginate(queryset, per_page, after=None, before=None):
+    """
+    Paginate queryset using keyset (cursor) pagination ordered by descending id.
+
+    Each page costs one bounded query plus an "exists" query per neighbouring page,
+    regardless of the number of objects in the queryset.
+
+    :param queryset: queryset of objects with an "id" field
+    :param per_page: integer, maximal number of objects on the page
+    :param after: integer, page contains objects with ids lower than this cursor
+    :param before: integer, page contains objects with ids higher than this cursor
+    :return: KeysetPage
+    """
+    queryset = queryset.order_by("-id")
+
+    if before is not None:
+        ids = list(queryset.filter(id__gt=before).order_by("id").values_list("id", flat=True)[:per_page])
+        if not ids:
+            return paginate(queryset, per_page)
+        object_list = queryset.filter(id__gt=before, id__lte=ids[-1])
+    elif after is not None:
+        object_list = queryset.filter(id__lt=after)[:per_page]
+    else:
+        object_list = queryset[:per_page]
+
+    # Evaluates and caches the objects of the page
+    objects = list(object_list)
+    if not objects:
+        return KeysetPage(object_list)
+
+    first_id, last_id = objects[0].id, objects[-1].id
+    next_cursor = last_id if queryset.filter(id__lt=last_id).exists() else None
+    previous_cursor = None
+    if after is not None or before is not None:
+        previous_cursor = first_id if queryset.filter(id__gt=first_id).exists() else None
+    return KeysetPage(object_list, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def encode_cursor(value, pk):
+    """
+    Encode cursor of a page sorted by a field.
+
+    :param value: value of the sorting field of the boundary object
+    :param pk: integer, id of the boundary object
+    :return: string safe to use in a URL
+    """
+    # Dates and times keep their full precision, so no object is skipped or repeated
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def get_sorted_cursor(value):
+    """
+    Get cursor of a page sorted by a field from a query string value.
+
+    :param value: string or None
+    :return: tuple (value, id) or None if the value is not a valid cursor
+    """
+    try:
+        field_value, pk = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if not isinstance(pk, int):
+        return None
+    return field_value, pk
+
+
+def clean_sorted_cursor(model, field, cursor):
+    """
+    Convert the cursor's value to the type of the sorting field.
+
+    Cursors come from the query string, so their values may be anything JSON can hold.
+
+    :param model: model class of the paginated objects
+    :param field: string, name of the sorting field
+    :param cursor: tuple (value, id) or None
+    :return: tuple (value, id) or None if the cursor does not fit the field
+    """
+    if cursor is None:
+        return None
+    value, pk = cursor
+    try:
+        value = model._meta.get_field(field).to_python(value)
+        pk = model._meta.pk.to_python(pk)
+    except (ValidationError, TypeError, ValueError):
+        return None
+    if value is None or pk is None:
+        return None
+    return value, pk
+
+
+def paginate_sorted(queryset, per_page, sort="id", after=None, before=None):
+    """
+    Paginate queryset using keyset (cursor) pagination ordered by a field and then by id.
+
+    Like paginate, each page costs a bounded query plus an "exists" query per neighbouring page,
+    provided the sorting field is indexed.
+
+    :param queryset: queryset of objects with an "id" field
+    :param per_page: integer, maximal number of objects on the page
+    :param sort: string, name of the sorting field, prefixed with "-" for the descending order
+    :param after: tuple (value, id), page contains objects following this cursor, ignored if it does not fit the field
+    :param before: tuple (value, id), page contains objects preceding this cursor, ignored if it does not fit the field
+    :return: KeysetPage with encoded cursors
+    """
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    after = clean_sorted_cursor(queryset.model, field, after)
+    before = clean_sorted_cursor(queryset.model, field, before)
+    queryset = queryset.order_by(sort, "-id" if descending else "id")
+
+    def beyond(cursor, forward=True):
+        value, pk = cursor
+        lookup = "lt" if forward == descending else "gt"
+        return Q(**{f"{field}__{lookup}": value}) | Q(**{field: value, f"id__{lookup}": pk})
+
+    if before is not None:
+        ids = list(queryset.filter(beyond(before, forward=False)).reverse().values_list("id", flat=True)[:per_page])
+        if not ids:
+            return paginate_sorted(queryset, per_page, sort)
+        object_list = queryset.filter(id__in=ids)
+    elif after is not None:
+        object_list = queryset.filter(beyond(after))[:per_page]
+    else:
+        object_list = queryset[:per_page]
+
+    # Evaluates and caches the objects of the page
+    objects = list(object_list)
+    if not objects:
+        return KeysetPage(object_list)
+
+    first = (getattr(objects[0], field), objects[0].id)
+    last = (getattr(objects[-1], field), objects[-1].id)
+    next_cursor = encode_cursor(*last) if queryset.filter(beyond(last)).exists() else None
+    previous_cursor = None
+    if after is not None or before is not None:
+        previous_cursor = encode_cursor(*first) if queryset.filter(beyond(first, forward=False)).exists() else None
+    return KeysetPage(object_list, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+def count_approximately(queryset, limit):
+    """
+    Count objects of the queryset but stop counting at the limit.
+
+    :param queryset: queryset of objects
+    :param limit: integer, maximal number of objects to count
+    :return: tuple (integer, boolean), number of objects and whether there are more than the limit
+    """
+    number = queryset.order_by()[:limit + 1].count()
+    return min(number, limit), number > limit
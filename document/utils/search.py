@@ -0,0 +1,105 @@
+import unicodedata
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from document import models
+
+FTS_TABLE = "document_documentindex_fts"
+BATCH_SIZE = 500
+
+# Letters which are not decomposed by the unicode normalization
+EXTRA_FOLDS = str.maketrans({"ł": "l", "Ł": "L", "đ": "d", "Đ": "D", "ø": "o", "Ø": "O"})
+
+
+def fold(text):
+    """
+    Fold text for searching.
+
+    Removes diacritics (also Polish "ł") and converts the text to lowercase.
+
+    :param text: string, text to be folded
+    :return: string
+    """
+    text = unicodedata.normalize("NFKD", str(text).translate(EXTRA_FOLDS))
+    return "".join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def build_content(document):
+    """
+    Build searchable content of a document.
+
+    Contains: id, product name, product model, category, validity start, file, created by, created at
+    and the text extracted from the file.
+
+    :param document: document object with product, category, created_by and content loaded
+    :return: string
+    """
+    created_at = timezone.localtime(document.created_at) if document.created_at else None
+    values = [
+        document.id,
+        document.product.name,
+        document.product.model,
+        document.category.name,
+        document.validity_start.strftime("%Y-%m-%d") if document.validity_start else "",
+        document.file.name,
+        document.created_by.username,
+        created_at.strftime("%Y-%m-%d %H:%M:%S") if created_at else "",
+    ]
+    content = getattr(document, "content", None)
+    if content is not None and content.text:
+        values.append(content.text)
+    return fold("\n".join(str(value) for value in values))
+
+
+def index_documents(documents):
+    """
+    Create or refresh search index entries of documents.
+
+    :param documents: queryset of documents
+    :return: None
+    """
+    documents = documents.select_related("product", "category", "created_by", "content").order_by()
+    batch = []
+    for document in documents.iterator(chunk_size=BATCH_SIZE):
+        batch.append(models.DocumentIndex(document_id=document.id, content=build_content(document)))
+        if len(batch) >= BATCH_SIZE:
+            _save_entries(batch)
+            batch = []
+    if batch:
+        _save_entries(batch)
+    return None
+
+
+def _save_entries(entries):
+    models.DocumentIndex.objects.filter(document_id__in=[entry.document_id for entry in entries]).delete()
+    models.DocumentIndex.objects.bulk_create(entries)
+
+
+def rebuild_index():
+    """
+    Rebuild search index of all documents.
+
+    :return: integer, number of indexed documents
+    """
+    models.DocumentIndex.objects.all().delete()
+    index_documents(models.Document.objects.all())
+    return models.DocumentIndex.objects.count()
+
+
+def matching_ids(phrase):
+    """
+    Get ids of documents whose indexed content contains the phrase.
+
+    SQLite uses the FTS5 trigram index, PostgreSQL the pg_trgm GIN index.
+    Phrases shorter than three characters cannot use trigrams and scan the index table instead.
+
+    :param phrase: string, phrase to look for
+    :return: expression usable in an "id__in" lookup
+    """
+    folded = fold(phrase)
+    if connection.vendor == "sqlite" and len(folded) >= 3:
+        match = '"' + folded.replace('"', '""') + '"'
+        return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    return models.DocumentIndex.objects.filter(content__contains=folded).values("document_id")
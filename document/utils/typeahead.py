@@ -0,0 +1,239 @@
+import bisect
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from document import models
+from document.utils.search import fold
+
+LIMIT = 10
+# Changes committed this long after they were saved (or saved by a server with a slightly different clock)
+# are still found by the check of the changed rows
+LATE_CHANGES = timedelta(minutes=1)
+PRODUCT = "product"
+MODEL = "model"
+CATEGORY = "category"
+
+MODELS = (models.Product, models.Category)
+
+_lock = threading.Lock()
+_index = None
+_checked_at = None
+
+
+class PrefixIndex:
+    """
+    Sorted keys of the suggestions, searched by prefix with bisection.
+
+    Every word of a suggestion's text starts a key, so "ala" finds "Produkt alamakota"; keys at the start of the text
+    are ranked first, then keys are ordered alphabetically. The index is never changed in place; changes create a new
+    index, so requests in other threads keep searching a consistent one.
+    """
+    def __init__(self, entries, sources, versions):
+        """
+        :param entries: iterable of tuples (key, rank, source, suggestion), rank is 0 for keys at the start
+            of the text, source is a tuple (model name, id) of the object
+        :param sources: set of sources of all indexed objects, including hidden ones without entries
+        :param versions: versions of the data from get_versions
+        """
+        self.entries = sorted(entries, key=lambda entry: (entry[0], entry[1], entry[3]["label"], entry[3]["kind"]))
+        self.sources = sources
+        self.versions = versions
+        self.ranks = []
+        for rank in (0, 1):
+            entries = [entry for entry in self.entries if entry[1] == rank]
+            self.ranks.append(([entry[0] for entry in entries], entries))
+
+    def search(self, prefix, limit=LIMIT):
+        """
+        Get suggestions whose text has a word starting with the prefix, ordered by rank and key.
+
+        Keys are read in order only until the limit is reached, so a short prefix matching many keys costs
+        about as much as a long one.
+
+        :param prefix: string, folded prefix
+        :param limit: integer, maximal number of suggestions
+        :return: list of dictionaries
+        """
+        if not prefix:
+            return []
+        suggestions = {}
+        for keys, entries in self.ranks:
+            for index in range(bisect.bisect_left(keys, prefix), len(keys)):
+                if len(suggestions) == limit or not keys[index].startswith(prefix):
+                    break
+                suggestion = entries[index][3]
+                suggestions.setdefault((suggestion["label"], suggestion["kind"], suggestion["phrase"]), suggestion)
+        return list(suggestions.values())
+
+    def replace(self, changes, versions=None):
+        """
+        Get a new index with entries of the changed objects replaced.
+
+        :param changes: dictionary {source: entries} of the objects' new entries, None for deleted objects
+        :param versions: versions of the data including the changes, None keeps the index's versions
+        :return: PrefixIndex
+        """
+        entries = [entry for entry in self.entries if entry[2] not in changes]
+        sources = set(self.sources)
+        for source, new_entries in changes.items():
+            if new_entries is None:
+                sources.discard(source)
+            else:
+                sources.add(source)
+                entries += new_entries
+        return PrefixIndex(entries, sources, self.versions if versions is None else versions)
+
+
+def get_source(obj):
+    return obj._meta.model_name, obj.id
+
+
+def get_entries(obj):
+    """
+    Get index entries of a product (its name and model code) or a category (its name).
+
+    :param obj: product or category object
+    :return: list of tuples (key, rank, source, suggestion)
+    """
+    if obj.pending_deletion:
+        return []
+    source = get_source(obj)
+    if isinstance(obj, models.Product):
+        suggestions = [
+            {"kind": PRODUCT, "label": obj.name, "phrase": obj.name},
+            {"kind": MODEL, "label": f"{obj.model} – {obj.name}", "phrase": obj.model},
+        ]
+    else:
+        suggestions = [{"kind": CATEGORY, "label": obj.name, "phrase": obj.name}]
+
+    entries = []
+    for suggestion in suggestions:
+        text = fold(suggestion["phrase"])
+        starts = [i for i, char in enumerate(text) if not char.isspace() and (i == 0 or text[i - 1].isspace())]
+        entries += [(text[i:], int(i > 0), source, suggestion) for i in starts]
+    return entries
+
+
+def get_versions():
+    """
+    Get the time of the last change and the number of products and categories.
+
+    Every change of a product or category (including hiding it while it is deleted) sets its updated_at,
+    so the versions are the same in all processes and change with any change of the data.
+
+    :return: dictionary {model name: {"updated_at": datetime or None, "count": integer}}
+    """
+    return {
+        model._meta.model_name: model.objects.aggregate(updated_at=Max("updated_at"), count=Count("id"))
+        for model in MODELS
+    }
+
+
+def build_index(versions):
+    changes = {}
+    for model in MODELS:
+        for obj in model.objects.all():
+            changes[get_source(obj)] = get_entries(obj)
+    return PrefixIndex([], set(), versions).replace(changes)
+
+
+def refresh_index(index, versions):
+    """
+    Get the index with the products and categories changed since its versions.
+
+    Only the changed objects are read. The index is built again if objects were deleted by another process.
+
+    :param index: PrefixIndex
+    :param versions: current versions of the data from get_versions
+    :return: PrefixIndex
+    """
+    changes = {}
+    for model in MODELS:
+        updated_at = index.versions[model._meta.model_name]["updated_at"]
+        queryset = model.objects.all()
+        if updated_at is not None:
+            queryset = queryset.filter(updated_at__gte=updated_at - LATE_CHANGES)
+        for obj in queryset:
+            changes[get_source(obj)] = get_entries(obj)
+    index = index.replace(changes, versions)
+
+    for model_name, version in versions.items():
+        if sum(1 for source in index.sources if source[0] == model_name) != version["count"]:
+            return build_index(versions)
+    return index
+
+
+def get_index():
+    """
+    Get the index of this process.
+
+    At most every settings.TYPEAHEAD_CHECK_INTERVAL seconds the versions of the data in the database are checked,
+    so changes made by other processes are loaded.
+
+    :return: PrefixIndex
+    """
+    global _index, _checked_at
+    index, checked_at = _index, _checked_at
+    if index is not None and checked_at is not None:
+        if time.monotonic() - checked_at < settings.TYPEAHEAD_CHECK_INTERVAL:
+            return index
+    with _lock:
+        # Taken before the data are read, so a change committed in the meantime is loaded with the next check
+        versions = get_versions()
+        if _index is None:
+            _index = build_index(versions)
+        elif _index.versions != versions:
+            _index = refresh_index(_index, versions)
+        _checked_at = time.monotonic()
+        return _index
+
+
+def suggest(phrase, limit=LIMIT):
+    """
+    Get suggestions of products, model codes and categories for the beginning of the phrase.
+
+    :param phrase: string typed by the user
+    :param limit: integer, maximal number of suggestions
+    :return: list of dictionaries with "kind", "label" and "phrase"
+    """
+    return get_index().search(fold(phrase).strip(), limit)
+
+
+def update(obj, deleted=False):
+    """
+    Update the suggestions of a saved or deleted product or category after the transaction is committed.
+
+    This process updates its index in place of the next check. Other processes load the change with their
+    next check of the versions.
+
+    :param obj: product or category object
+    :param deleted: boolean, whether the object was deleted
+    :return: None
+    """
+    changes = {get_source(obj): None if deleted else get_entries(obj)}
+
+    def apply():
+        global _index
+        with _lock:
+            if _index is not None:
+                _index = _index.replace(changes)
+
+    transaction.on_commit(apply)
+
+
+def invalidate():
+    """
+    Check the versions of the data with the next search, e.g. after products or categories were updated in bulk.
+
+    :return: None
+    """
+    def expire():
+        global _checked_at
+        _checked_at = None
+
+    transaction.on_commit(expire)
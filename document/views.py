@@ -1,71 +1,196 @@
-import mimetypes
-import os
-from django.conf import settings
+import hashlib
+
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import Http404, HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 from django.views import View
+from django.views.decorators.clickjacking import xframe_options_sameorigin
 from django.views.generic import CreateView, UpdateView, DeleteView
 
+from document import api
+from document import bulk_edit
+from document import deletion
+from document import export
 from document import models
 from document import forms
-from document.utils import utils
+from document import permissions
+from document import previews
+from document import uploads
+from document.utils import downloads, feed, history, pagination, typeahead, utils
 
 
 class MainView(LoginRequiredMixin, View):
     """
     Home page of the application.
 
-    Shows ten newest documents in reverse-chronological order.
+    Shows ten newest documents in reverse-chronological order; their rendered list is cached.
     Allows searching documents using a phrase.
+    Both the newest documents and the search results are paginated with cursors.
     """
+    query_budget = 7
+    paginate_by = 20
+    feed_paginate_by = 10
+    # Search results are counted up to this number; None turns counting off
+    count_limit = 1000
+
     def get(self, request):
         phrase = request.GET.get("phrase")
+        after = pagination.get_cursor(request.GET.get("after"))
+        before = pagination.get_cursor(request.GET.get("before"))
+
         if phrase:
-            documents = utils.search(phrase)
+            documents = utils.search(phrase).select_related("product", "category")
+            page = pagination.paginate(documents, self.paginate_by, after=after, before=before)
+            no_documents, more_documents = None, False
+            if self.count_limit is not None:
+                no_documents, more_documents = pagination.count_approximately(documents, self.count_limit)
         else:
-            documents = models.Document.objects.order_by("-id")[:10]
+            documents = models.Document.objects.filter(pending_deletion=False).select_related("product", "category")
+            if after is None and before is None:
+                return self.render_feed(request, documents)
+            page = pagination.paginate(documents, self.feed_paginate_by, after=after, before=before)
+            no_documents, more_documents = len(page), False
 
         ctx = {
-            "documents": documents,
+            "documents": page.object_list,
+            "page": page,
             "phrase": phrase,
-            "no_documents": documents.count(),
+            "no_documents": no_documents,
+            "more_documents": more_documents,
+            "feed": None,
+        }
+        return render(request, "main.html", ctx)
+
+    def render_feed(self, request, documents):
+        """Render the first page of the newest documents, which is cached until any document changes."""
+        key = feed.get_key()
+        html = feed.get_feed(key)
+        ctx = {
+            "documents": documents[:self.feed_paginate_by],
+            "page": None,
+            "phrase": None,
+            "no_documents": None,
+            "more_documents": False,
         }
+        if html is None:
+            page = pagination.paginate(documents, self.feed_paginate_by)
+            ctx.update({"documents": page.object_list, "page": page, "no_documents": len(page)})
+            html = render_to_string("document_list.html", ctx)
+            feed.save_feed(key, html)
+        ctx["feed"] = html
         return render(request, "main.html", ctx)
 
 
-class ManageView(LoginRequiredMixin, UserPassesTestMixin, View):
-    """Manage products and categories. Add, edit or delete objects."""
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
+class SuggestView(LoginRequiredMixin, View):
+    """
+    Suggestions of products, model codes and categories for the phrase typed in the search field.
+
+    They come from the index in the memory of the process, so they cost no database queries besides
+    the check of the data's versions, run at most every settings.TYPEAHEAD_CHECK_INTERVAL seconds.
+    """
+    # Session, user and the two aggregates of the versions check
+    query_budget = 4
 
     def get(self, request):
-        categories = models.Category.objects.all().order_by("id")
-        products = models.Product.objects.all().order_by("id")
-        return render(request, "manage.html", {"categories": categories, "products": products})
+        return JsonResponse({"suggestions": typeahead.suggest(request.GET.get("q", ""))})
 
 
-class AddProductView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, CreateView):
-    """Form to add a new product."""
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
+class ManageView(permissions.ManagerRequiredMixin, View):
+    """
+    Manage products and categories. Add, edit or delete objects.
+
+    Both tables are filtered, sorted and paginated with cursors, so the page cost does not depend
+    on the number of products and categories.
+    """
+    query_budget = 10
+    paginate_by = 50
+    product_sorts = ("id", "model", "name", "documents_count")
+    category_sorts = ("id", "name", "documents_count")
 
+    def get(self, request):
+        form = forms.ManageFilterForm(request.GET)
+        filters = form.cleaned_data if form.is_valid() else {}
+
+        products = models.Product.objects.filter(pending_deletion=False)
+        if filters.get("product_model"):
+            products = products.filter(model__istartswith=filters["product_model"])
+        if filters.get("product_name"):
+            products = products.filter(name__icontains=filters["product_name"])
+        categories = models.Category.objects.filter(pending_deletion=False)
+        if filters.get("category_name"):
+            categories = categories.filter(name__icontains=filters["category_name"])
+
+        product_page, product_links = self.paginate(request, "product", products, self.product_sorts)
+        category_page, category_links = self.paginate(request, "category", categories, self.category_sorts)
+        deletions = models.Deletion.objects.exclude(status=models.Deletion.DONE).order_by("-id")[:10]
+        ctx = {
+            "form": form,
+            "categories": category_page.object_list,
+            "category_links": category_links,
+            "products": product_page.object_list,
+            "product_links": product_links,
+            "deletions": deletions,
+        }
+        return render(request, "manage.html", ctx)
+
+    def paginate(self, request, prefix, queryset, sorts):
+        """
+        Get the requested page of the table and the links to its neighbouring pages and sortings.
+
+        :param request: request object
+        :param prefix: string, prefix of the table's query parameters
+        :param queryset: queryset of the table's objects
+        :param sorts: names of the fields by which the table can be sorted
+        :return: tuple (KeysetPage, dictionary with the links)
+        """
+        sort = request.GET.get(f"{prefix}_sort", "id")
+        if sort.lstrip("-") not in sorts:
+            sort = "id"
+        page = pagination.paginate_sorted(
+            queryset,
+            self.paginate_by,
+            sort,
+            after=pagination.get_sorted_cursor(request.GET.get(f"{prefix}_after")),
+            before=pagination.get_sorted_cursor(request.GET.get(f"{prefix}_before")),
+        )
+
+        def link(**params):
+            query = request.GET.copy()
+            for name, value in params.items():
+                query.pop(f"{prefix}_{name}", None)
+                if value is not None:
+                    query[f"{prefix}_{name}"] = value
+            return f"?{query.urlencode()}"
+
+        links = {
+            "next": link(after=page.next_cursor, before=None) if page.next_cursor else None,
+            "previous": link(after=None, before=page.previous_cursor) if page.previous_cursor else None,
+            "sort": {
+                field: link(sort=f"-{field}" if sort == field else field, after=None, before=None) for field in sorts
+            },
+        }
+        return page, links
+
+
+class AddProductView(permissions.ManagerRequiredMixin, SuccessMessageMixin, CreateView):
+    """Form to add a new product."""
     model = models.Product
     fields = "__all__"
     success_url = reverse_lazy("manage")
     success_message = "Dodano nowy produkt!"
 
 
-class EditProductView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, UpdateView):
+class EditProductView(permissions.ManagerRequiredMixin, SuccessMessageMixin, history.HistoryMixin, UpdateView):
     """Form to edit an existing product."""
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
     model = models.Product
     fields = "__all__"
     template_name_suffix = "_update_form"
@@ -73,32 +198,44 @@ class EditProductView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMix
     success_message = "Zaktualizowano produkt!"
 
 
-class DeleteProductView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, DeleteView):
+class DeleteObjectInBackgroundMixin:
+    """
+    Delete the object with its documents in the background.
+
+    The request returns immediately; the progress is shown on the management page.
+    """
+    pending_message = ""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(pending_deletion=False)
+
+    def delete(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        deletion_object = deletion.start_deletion(self.object, request.user)
+        if deletion_object.status == models.Deletion.DONE:
+            messages.success(request, self.success_message)
+        else:
+            messages.info(request, self.pending_message)
+        return redirect(self.get_success_url())
+
+
+class DeleteProductView(permissions.ManagerRequiredMixin, DeleteObjectInBackgroundMixin, DeleteView):
     """Delete a product."""
     model = models.Product
     success_url = reverse_lazy("manage")
     success_message = "Usunięto produkt!"
-
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
-    def delete(self, request, *args, **kwargs):
-        messages.success(self.request, self.success_message)
-        return super(DeleteProductView, self).delete(request, *args, **kwargs)
+    pending_message = "Produkt i jego dokumenty są usuwane w tle."
 
 
-class AddCategoryView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, CreateView):
+class AddCategoryView(permissions.ManagerRequiredMixin, SuccessMessageMixin, CreateView):
     """Form to add a new category."""
     model = models.Category
     fields = "__all__"
     success_url = reverse_lazy("manage")
     success_message = "Dodano nową kategorię!"
 
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
 
-
-class EditCategoryView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, UpdateView):
+class EditCategoryView(permissions.ManagerRequiredMixin, SuccessMessageMixin, history.HistoryMixin, UpdateView):
     """Form to edit an existing category."""
     model = models.Category
     fields = "__all__"
@@ -106,53 +243,62 @@ class EditCategoryView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMi
     success_url = reverse_lazy("manage")
     success_message = "Zaktualizowano kategorię!"
 
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
 
-class DeleteCategoryView(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, DeleteView):
+class DeleteCategoryView(permissions.ManagerRequiredMixin, DeleteObjectInBackgroundMixin, DeleteView):
     """Delete a category."""
     model = models.Category
     success_url = reverse_lazy("manage")
     success_message = "Usunięto kategorię!"
-
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
-    def delete(self, request, *args, **kwargs):
-        messages.success(self.request, self.success_message)
-        return super(DeleteCategoryView, self).delete(request, *args, **kwargs)
+    pending_message = "Kategoria i jej dokumenty są usuwane w tle."
 
 
-class AddDocumentView(LoginRequiredMixin, UserPassesTestMixin, View):
+class DeletionStatusView(permissions.ManagerRequiredMixin, View):
+    """Status of a product's or category's deletion running in the background."""
+    def get(self, request, pk):
+        deletion_object = get_object_or_404(models.Deletion, pk=pk)
+        return JsonResponse({
+            "id": deletion_object.id,
+            "object": deletion_object.label,
+            "status": deletion_object.status,
+            "documents_total": deletion_object.documents_total,
+            "documents_deleted": deletion_object.documents_deleted,
+            "files_failed": deletion_object.files_failed,
+            "error": deletion_object.error,
+        })
+
+
+class AddDocumentView(permissions.ManagerRequiredMixin, View):
     """
     Add a new document.
     """
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
     def get(self, request):
         form = forms.DocumentForm
         return render(request, "document_form.html", {"form": form})
 
     def post(self, request):
-        form = forms.DocumentForm(request.POST, request.FILES)
+        form = forms.DocumentForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
             product = form.cleaned_data.get("product")
             category = form.cleaned_data.get("category")
             validity_start = form.cleaned_data.get("validity_start")
             form_file = form.cleaned_data.get("file")
+            if form.upload is not None and not form.store_upload():
+                return render(request, "document_form.html", {"form": form})
 
             document = models.Document.objects.create(
                 product=product,
                 category=category,
                 validity_start=validity_start,
-                file=form_file,
+                file=form.cleaned_data["file"],
                 created_by=request.user,
             )
+            form.finish_upload()
             if document.file != form_file:
                 text = utils.get_filename_msg(document, sent_filename=form_file.name)
                 messages.info(request, text)
+            duplicate_text = utils.get_duplicate_msg(document)
+            if duplicate_text:
+                messages.info(request, duplicate_text)
 
             messages.success(request, "Dodano nowy dokument!")
             return redirect("main")
@@ -160,7 +306,35 @@ class AddDocumentView(LoginRequiredMixin, UserPassesTestMixin, View):
         return render(request, "document_form.html", {"form": form})
 
 
-class EditDocumentView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class BulkEditDocumentsView(permissions.ManagerRequiredMixin, View):
+    """
+    Change the product, category or validity start of many documents at once.
+
+    Documents are selected with a search phrase, a product and a category.
+    """
+    query_budget = 7
+
+    def get(self, request):
+        form = forms.BulkEditForm(initial={"phrase": request.GET.get("phrase")})
+        return render(request, "document_bulk_edit_form.html", {"form": form})
+
+    def post(self, request):
+        form = forms.BulkEditForm(request.POST)
+        if form.is_valid():
+            try:
+                number = bulk_edit.edit_documents(
+                    form.get_documents(), form.cleaned_data["field"], form.get_value(), request.user
+                )
+            except bulk_edit.ConflictError as error:
+                form.add_error(None, str(error))
+            else:
+                messages.success(request, f"Zaktualizowano dokumenty: {number}.")
+                return redirect("main")
+
+        return render(request, "document_bulk_edit_form.html", {"form": form})
+
+
+class EditDocumentView(permissions.ManagerRequiredMixin, history.HistoryMixin, UpdateView):
     """
     Edit an existing document and save history of the changes made to the document.
     """
@@ -168,77 +342,252 @@ class EditDocumentView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     template_name_suffix = "_update_form"
     form_class = forms.DocumentForm
 
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
+    def get_queryset(self):
+        # Labels of the product and category in the history come from the loaded objects
+        return models.Document.objects.select_related("product", "category")
 
     def get_initial(self):
         initial = super(EditDocumentView, self).get_initial()
         initial["validity_start"] = self.object.validity_start.strftime("%Y-%m-%d")
         return initial
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def get_success_url(self):
+        return reverse("document_detail", args=[self.object.id])
+
     def form_valid(self, form):
         # Form contains the filename delivered by the user
         form_file = form.cleaned_data.get("file")
 
-        # Filename after saving might differ from the one uploaded
-        document_new = form.save(commit=False)
-        document_old = models.Document.objects.get(id=self.object.id)
+        # Old file is deleted first, so the new one can be saved under the same name
+        old_filename, _ = self.history_before["file"]
+        if form.upload is not None:
+            if not form.store_upload(replaced_name=old_filename):
+                return self.form_invalid(form)
+        elif form.files.get("file"):
+            self.object.file.storage.delete(old_filename)
 
-        # Filename is converted to None after deletion
-        data_old = document_old.__dict__.copy()
-        if self.request.FILES.get("file"):
-            document_old.file.delete()
-
-        # History of changes gets saved
-        document_new.save()
-        data_new = document_new.__dict__.copy()
-        utils.save_history(data_old, data_new, user=self.request.user)
+        # Filename after saving might differ from the one uploaded, history of changes gets saved
+        response = super().form_valid(form)
+        document = self.object
+        form.finish_upload()
 
         messages.success(self.request, "Zaktualizowano dokument!")
 
         # Other documents might use the file with the same name
-        if document_new.file != form_file:
-            text = utils.get_filename_msg(document_new, sent_filename=form_file.name)
+        if document.file != form_file:
+            text = utils.get_filename_msg(document, sent_filename=form_file.name)
             messages.info(self.request, text)
 
-        return redirect("document_detail", document_new.id)
+        if form.files.get("file"):
+            duplicate_text = utils.get_duplicate_msg(document)
+            if duplicate_text:
+                messages.info(self.request, duplicate_text)
+
+        return response
+
+
+class StartUploadView(permissions.ManagerRequiredMixin, View):
+    """
+    Start uploading a large file in chunks.
+
+    Chunks are sent to UploadView; then the document form is submitted with the upload's id instead of the file.
+    """
+    def post(self, request):
+        form = forms.UploadForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        try:
+            upload = uploads.start_upload(
+                form.cleaned_data["name"], form.cleaned_data["size"], request.user, form.cleaned_data["sha256"]
+            )
+        except uploads.UploadError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+        status = uploads.get_status(upload)
+        status["url"] = reverse("upload", args=[upload.id])
+        return JsonResponse(status, status=201)
 
 
-class DeleteDocumentView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class UploadView(permissions.ManagerRequiredMixin, View):
+    """
+    Receive chunks of an upload and report its status.
+
+    PUT /upload/<id>?offset=<position> with the chunk as the body and optionally its SHA-256 digest
+    in the X-Chunk-SHA256 header. Repeated chunks overwrite themselves once they are verified, so they can be retried.
+    GET tells how many bytes have been received, which is where an interrupted upload resumes.
+    """
+    def get_upload(self, pk):
+        return get_object_or_404(models.Upload, pk=pk, created_by=self.request.user)
+
+    def get(self, request, pk):
+        return JsonResponse(uploads.get_status(self.get_upload(pk)))
+
+    def put(self, request, pk):
+        upload = self.get_upload(pk)
+        try:
+            offset = int(request.GET["offset"])
+            length = int(request.META["CONTENT_LENGTH"])
+        except (KeyError, ValueError):
+            return JsonResponse({"error": "Podaj położenie (offset) i długość fragmentu."}, status=400)
+        try:
+            # The body is read from the request stream, so the chunk is never held in memory as a whole
+            uploads.write_chunk(upload, offset, request, length, request.headers.get("X-Chunk-SHA256"))
+        except uploads.UploadError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+        return JsonResponse(uploads.get_status(upload))
+
+    def delete(self, request, pk):
+        uploads.discard(self.get_upload(pk))
+        return HttpResponse(status=204)
+
+
+class DeleteDocumentView(permissions.ManagerRequiredMixin, DeleteView):
     """Delete a document."""
     model = models.Document
     success_url = reverse_lazy("main")
     success_message = "Usunięto dokument!"
 
-    def test_func(self):
-        return self.request.user.groups.filter(name="manager").exists()
-
 
 class DocumentDetailView(LoginRequiredMixin, View):
     """Show document's details."""
+    query_budget = 5
+
     def get(self, request, pk):
-        document = get_object_or_404(models.Document, pk=pk)
-        history_set = document.history_set.all().order_by("-changed_at")
+        documents = models.Document.objects.filter(pending_deletion=False)
+        documents = documents.select_related("product", "category", "created_by")
+        document = get_object_or_404(documents, pk=pk)
+        history_set = document.history_set.select_related("changed_by").order_by("-changed_at")
+        cached = previews.find_cached(document)
         ctx = {
             "document": document,
             "history_set": history_set,
+            "preview_kind": cached[1] if cached else previews.get_kinds(document)[0],
         }
         return render(request, "document_detail.html", ctx)
 
 
+@method_decorator(xframe_options_sameorigin, name="dispatch")
+class DocumentPreviewView(LoginRequiredMixin, View):
+    """Show a preview of the document's first page, so it can be checked without downloading the file."""
+    query_budget = 4
+
+    def get(self, request, pk):
+        document = get_object_or_404(models.Document, pk=pk, pending_deletion=False)
+        data, kind = previews.get_preview(document)
+        # Browsers revalidate their copy, which is not sent again while the preview is unchanged
+        etag = quote_etag(hashlib.md5(data).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(data, content_type=previews.CONTENT_TYPES[kind])
+        response["ETag"] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
 class DownloadDocumentView(LoginRequiredMixin, View):
     """Download a document's file."""
     def get(self, request, pk):
-        document = get_object_or_404(models.Document, id=pk)
-        filepath = os.path.join(settings.MEDIA_ROOT, document.file.name)
-        if os.path.exists(filepath):
-            with open(filepath, "rb") as fh:
-                mime_type, _ = mimetypes.guess_type(filepath)
-                response = HttpResponse(fh.read(), content_type=mime_type)
-                response["Content-Disposition"] = "inline; filename=" + os.path.basename(filepath)
-                return response
-        else:
-            raise Http404
+        document = get_object_or_404(models.Document, id=pk, pending_deletion=False)
+        return downloads.file_response(request, document.file)
+
+
+class ExportDocumentsView(LoginRequiredMixin, View):
+    """
+    Download documents found with a phrase, a product and a category as a ZIP archive with their metadata.
+
+    The archive is generated while it is sent, so neither memory nor disk use depends on its size.
+    """
+    def get(self, request):
+        form = forms.DocumentSelectionForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({"errors": form.errors}, status=400)
+        entries = export.collect(form.get_documents())
+        response = StreamingHttpResponse(export.stream_zip(entries), content_type="application/zip")
+        response["Content-Disposition"] = f'attachment; filename="{export.get_file_name()}"'
+        return response
+
+
+class ApiListView(LoginRequiredMixin, View):
+    """
+    List of objects in JSON for integrations.
+
+    Pages are linked with cursors, so listing thousands of objects costs the same bounded queries per page.
+    Clients synchronizing the objects pass the time of their last synchronization as "updated_since"
+    and sort them by the time of their change.
+    """
+    resource = None
+    query_budget = 5
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "Wymagane zalogowanie."}, status=401)
+
+    def get(self, request):
+        resource = self.resource
+        try:
+            fields = api.get_fields(resource, request.GET.get("fields"))
+            since = api.get_since(request.GET.get("updated_since"))
+            limit = api.get_limit(request.GET.get("limit"))
+            sort = api.get_sort(resource, request.GET.get("sort"))
+            after = api.get_cursor(resource, sort, request.GET.get("after"))
+            before = api.get_cursor(resource, sort, request.GET.get("before"))
+        except api.ApiError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+
+        queryset = resource.get_queryset()
+        if since is not None:
+            queryset = queryset.filter(**{f"{resource.timestamp_field}__gte": since})
+        page = pagination.paginate_sorted(queryset, limit, sort, after=after, before=before)
+
+        def link(**params):
+            query = request.GET.copy()
+            for name, value in params.items():
+                query.pop(name, None)
+                if value is not None:
+                    query[name] = value
+            return f"{request.path}?{query.urlencode()}"
+
+        return api.json_response(request, {
+            "results": [api.serialize(obj, resource, fields) for obj in page],
+            "next": link(after=page.next_cursor, before=None) if page.next_cursor else None,
+            "previous": link(after=None, before=page.previous_cursor) if page.previous_cursor else None,
+        })
+
+
+class ApiDocumentsView(ApiListView):
+    resource = api.DocumentResource()
+
+
+class ApiProductsView(ApiListView):
+    resource = api.ProductResource()
+
+
+class ApiCategoriesView(ApiListView):
+    resource = api.CategoryResource()
+
+
+class ApiHistoryView(ApiListView):
+    resource = api.HistoryResource()
+
+
+class ApiDocumentView(LoginRequiredMixin, View):
+    """Document in JSON for integrations."""
+    resource = api.DocumentResource()
+    query_budget = 3
+
+    def handle_no_permission(self):
+        return JsonResponse({"error": "Wymagane zalogowanie."}, status=401)
+
+    def get(self, request, pk):
+        try:
+            fields = api.get_fields(self.resource, request.GET.get("fields"))
+        except api.ApiError as error:
+            return JsonResponse({"error": error.message}, status=error.status)
+        document = get_object_or_404(self.resource.get_queryset(), pk=pk)
+        return api.json_response(request, api.serialize(document, self.resource, fields))
 
 
 class RegisterView(View):